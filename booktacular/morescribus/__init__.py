@@ -38,13 +38,19 @@ from __future__ import print_function
 from __future__ import division
 import sys
 import os
-# import re
+import re
 import shutil
 # import json
 import copy
+import bisect
+import gzip
+import io
+import tempfile
 
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from io import StringIO
 
 if __name__ == "__main__":
     sys.path.insert(
@@ -77,11 +83,44 @@ from pycodetool.parsing import (
     find_unquoted_even_commented,
 )
 
+from booktacular.morescribus.fileindex import FileStatCache
+# ^ fileindex does not import this module, so it can be imported here.
+from booktacular.morescribus.styles import StyleTable
+# ^ styles does not import this module either.
+from booktacular.morescribus.writers import (
+    get_frame_text,
+    get_writer,
+)
+# ^ writers only uses the standard library.
+
 # ASCII_BULLET = "0x2022"
 UTF8_BULLET = b"\xE2\x80\xA2"  # hex editor
 #   confirms this to be the 3 bytes where Scribus
 #   inserted a bullet (The only bytes between the
 #   single-byte quotes of CH="").
+BULLET = UTF8_BULLET.decode("utf-8")  # so text is not encoded to compare
+LIST_ATTRIBUTE = "CH"  # The attribute checked by mark_list_items.
+
+# Kinds of problems found by validate_lists:
+LIST_MID_PARAGRAPH = "bullet-mid-paragraph"  # not at start of paragraph
+LIST_EMPTY_ITEM = "empty-list-item"  # only a bullet, then a new paragraph
+PARAGRAPH_END_TAGS = ("para", "trail")
+
+TOC_ATTRIBUTE_NAME = "TOC"
+HEADING_LEVEL_RE = re.compile(r"\bH(\d+)\b")
+
+PAGE_FILTER_TAGS = ("PAGEOBJECT", "FRAMEOBJECT")
+# ^ Objects that can be skipped by OwnPage while parsing (MASTEROBJECT
+#   is not included since its OwnPage is the index of the master page).
+MASTER_ORIGIN_KEY = "MASTERPAGE"
+# ^ The first part of the key of a master page in PageOrigins.
+
+GZIP_MAGIC = b"\x1f\x8b"  # The first bytes of a gzip file (.sla.gz)
+SLA_EXTENSIONS = (".sla", ".sla.gz")
+
+SAVE_CHUNK_SIZE = 1024 * 1024
+# ^ Characters of unchanged data written at a time by
+#   SGMLElementTree.write, so saving takes constant extra memory.
 
 if hasattr(sys, 'maxint'):
     MAXINT = sys.maxint
@@ -392,6 +431,70 @@ class SGMLLexer(object):
             #             "Non-blank content in Scribus file")
         return self._chunkdef
 
+    def skip_element(self):
+        """Skip to the end of the element that the last chunk started.
+
+        The skipped part is found by searching for the closing tag
+        (counting nested tags with the same tagName), so attributes
+        inside of it are not lexed. This is possible since "<" is always
+        escaped inside of SLA attribute values.
+
+        Returns:
+            dict: A chunkdef for the closing tag, which becomes the
+                previous chunk so that next continues after it. If the
+                last chunk was not a start tag or was self-closing,
+                return None and skip nothing.
+        """
+        chunkdef = self._chunkdef
+        if ((chunkdef is None) or (chunkdef['context'] != SGMLLexer.START)
+                or (chunkdef.get('self_closer') is not None)):
+            return None
+        tagName = chunkdef['tagName']
+        opener = "<" + tagName
+        closer = "</" + tagName + ">"
+        depth = 1
+        pos = chunkdef['end']
+        while True:
+            close_i = self._data.find(closer, pos)
+            if close_i < 0:
+                raise SyntaxError(
+                    "{} at {} was not closed"
+                    "".format(tagName, chunkdef['start'])
+                )
+            open_i = self._data.find(opener, pos, close_i)
+            if open_i > -1:
+                pos = open_i + len(opener)
+                after = self._data[pos:pos + 1]
+                if not (after.isspace() or after in ("/", ">")):
+                    continue  # Only tagName starts with the same letters.
+                end = find_unquoted_even_commented(
+                    self._data,
+                    ">",
+                    pos,
+                    quote_marks='"',
+                )
+                if end < 0:
+                    raise SyntaxError(
+                        "The '<' at {} wasn't closed.".format(open_i)
+                    )
+                pos = end + 1
+                if self._data[end - 1] != "/":
+                    depth += 1
+                continue
+            depth -= 1
+            pos = close_i + len(closer)
+            if depth == 0:
+                break
+        if self.stack and (self.stack[-1] is chunkdef):
+            del self.stack[-1]
+        self._chunkdef = {
+            'context': SGMLLexer.END,
+            'tagName': tagName,
+            'start': close_i,
+            'end': pos,
+        }
+        return self._chunkdef
+
     def _stack_tagNames(self):
         """Get a list of the current tagNames that are still open.
 
@@ -404,11 +507,302 @@ class SGMLLexer(object):
         return results
 
 
+class ReadingOrder(object):
+    """Decide the reading order of objects on a page.
+
+    Objects that span columns (such as a heading or a picture as wide as
+    the page) divide the page into bands from top to bottom. Within each
+    band, the remaining objects are clustered into columns by their
+    x-extents, so any number of columns is detected (not only left and
+    right). The order is: each band's columns from left to right (each
+    column from top to bottom), then the spanning object that ends the
+    band. Sorting is O(n log n) for n objects on the page.
+
+    Set the reading_order attribute of a ScribusDocRoot to change the
+    settings for that document.
+
+    Attributes:
+        span_ratio (float): An object wider than this portion of
+            ScribusPage.safe_width() spans columns. The default is
+            slightly more than half since a picture with a blank
+            background may be a little bigger than one of two columns.
+        overlap_ratio (float): An object joins a column if it overlaps
+            the column by at least this portion of its own width, so a
+            picture sticking into the gutter does not merge columns.
+        use_columns_attribute (bool): If True, a text frame with
+            COLUMNS greater than 1 spans columns regardless of width
+            (its text flows through its own columns so it is read as
+            one block).
+    """
+    def __init__(self, span_ratio=None, overlap_ratio=None,
+                 use_columns_attribute=True):
+        if span_ratio is None:
+            span_ratio = 0.5 + 0.5 / 6
+        if overlap_ratio is None:
+            overlap_ratio = 0.25
+        self.span_ratio = span_ratio
+        self.overlap_ratio = overlap_ratio
+        self.use_columns_attribute = use_columns_attribute
+
+    def is_spanner(self, child, span_w):
+        """Check whether the object should start a new band.
+
+        Args:
+            child (ScribusPageObject): Any object on the page.
+            span_w (float): Width in points above which an object spans
+                columns (See span_ratio).
+        """
+        if self.use_columns_attribute:
+            columns = child.get_int("COLUMNS")
+            if columns is not None and columns > 1:
+                return True
+        width = child.get_float("WIDTH")
+        return width is not None and width > span_w
+
+    def columns(self, children):
+        """Cluster objects into columns by their x-extents.
+
+        Args:
+            children (list[ScribusPageObject]): Objects in one band
+                (none of them should be spanners).
+
+        Returns:
+            list[list[ScribusPageObject]]: Columns from left to right,
+                each in the order of its left edge.
+        """
+        boxes = get_page_boxes(children)
+        return [[children[i] for i in column]
+                for column in self._column_indices(range(len(children)),
+                                                   boxes)]
+
+    def _column_indices(self, indices, boxes):
+        columns = []
+        right = None
+        for i in sorted(indices, key=lambda i: (boxes[i][0], boxes[i][1])):
+            left, _, width, _ = boxes[i]
+            if columns:
+                overlap = min(right, left + width) - left
+                if overlap > 0 and overlap >= self.overlap_ratio * width:
+                    columns[-1].append(i)
+                    right = max(right, left + width)
+                    continue
+            columns.append([i])
+            right = left + width
+        return columns
+
+    def sort(self, page, children=None):
+        """Get the children of a page in reading order.
+
+        Args:
+            page (ScribusPage): The page (its document must be set since
+                the safe width is calculated from the margins).
+            children (Optional[list[ScribusPageObject]]): Objects to sort
+                instead of page.children, such as
+                page.get_children(include_master=True).
+
+        Returns:
+            list[ScribusPageObject]: A new list with the same objects.
+        """
+        if children is None:
+            children = page.children
+        span_w = page.safe_width() * self.span_ratio
+        boxes = get_page_boxes(children)
+        spanners = []
+        narrow = []
+        for i, child in enumerate(children):
+            if self.is_spanner(child, span_w):
+                spanners.append(i)
+            else:
+                narrow.append(i)
+        spanners.sort(key=lambda i: (boxes[i][1], boxes[i][0]))
+        band_tops = [boxes[i][1] for i in spanners]
+        bands = {}
+        for i in narrow:
+            band = bisect.bisect_right(band_tops, boxes[i][1])
+            bands.setdefault(band, []).append(i)
+        keyed = []
+        for band, members in bands.items():
+            columns = self._column_indices(members, boxes)
+            for column_i, column in enumerate(columns):
+                for i in column:
+                    keyed.append(((band, 0, column_i, boxes[i][1],
+                                   boxes[i][0]), i))
+        for band, i in enumerate(spanners):
+            keyed.append(((band, 1, 0, boxes[i][1], boxes[i][0]), i))
+        keyed.sort(key=lambda pair: pair[0])
+        return [children[i] for _, i in keyed]
+
+
+def get_page_boxes(children):
+    """Get the boxes of objects relative to their own pages in one batch.
+
+    XPOS and YPOS are relative to the whole canvas, so they are
+    converted by PageOrigins.to_page_relative using the page (or master
+    page) of each object. An object that is not on a page is not moved.
+
+    Args:
+        children (list[ScribusPageObject]): Objects of one document.
+
+    Returns:
+        list[tuple[float]]: (x, y, width, height) for each object in
+            points (0.0 for any missing value).
+    """
+    page_origins = None
+    xs = []
+    ys = []
+    keys = []
+    for child in children:
+        page = getattr(child, 'page', None)
+        key = None
+        if page is not None:
+            key = page.get_origin_key()
+            if page_origins is None:
+                page_origins = page.get_page_origins()
+        xs.append(child.get_float("XPOS") or 0.0)
+        ys.append(child.get_float("YPOS") or 0.0)
+        keys.append(key)
+    if page_origins is not None:
+        xs, ys = page_origins.to_page_relative(xs, ys, keys)
+    return [(x, y, child.get_float("WIDTH") or 0.0,
+             child.get_float("HEIGHT") or 0.0)
+            for x, y, child in zip(xs, ys, children)]
+
+
+class PageOrigins(object):
+    """A table of where each page is on the Scribus canvas.
+
+    XPOS and YPOS of objects are relative to the whole canvas, which
+    has pages in rows (PAGEYPOS) and columns (PAGEXPOS) for facing
+    pages. The table is made once from PAGE and MASTERPAGE elements by
+    collect_pages (See ScribusDocRoot.page_origins), and every
+    page-relative position (See ScribusPage.get_origin and
+    get_page_boxes) comes from it.
+
+    Pages are keyed by number (as in OwnPage) and master pages by
+    (MASTER_ORIGIN_KEY, NAM) (See ScribusPage.get_origin_key). Master
+    pages are on their own canvas, so find_page does not find them.
+    """
+    def __init__(self):
+        self._boxes = {}  # key is page number (NUM)
+        self._masters = {}  # key is master page name (NAM)
+        self._row_tops = None
+        self._rows = None
+        self._row_lefts = None
+
+    def add(self, number, left, top, width, height):
+        """Add a page (from NUM, PAGEXPOS, PAGEYPOS, PAGEWIDTH and
+        PAGEHEIGHT)."""
+        self._boxes[number] = (left, top, width, height)
+        self._row_tops = None  # Rebuild the index on the next lookup.
+
+    def add_master(self, name, left, top, width, height):
+        """Add a master page (from NAM, PAGEXPOS, etc. of MASTERPAGE)."""
+        self._masters[name] = (left, top, width, height)
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def get_box(self, key):
+        """Get the canvas box of a page or master page.
+
+        Args:
+            key (Union[int,tuple]): A page number or a master page key
+                (See the class docstring).
+
+        Returns:
+            tuple[float]: (left, top, width, height), or None if not
+                known.
+        """
+        if isinstance(key, tuple):
+            return self._masters.get(key[1])
+        return self._boxes.get(key)
+
+    def get_origin(self, key):
+        """Get the canvas position of a page or master page.
+
+        Args:
+            key (Union[int,tuple]): See get_box.
+
+        Returns:
+            tuple[float]: (PAGEXPOS, PAGEYPOS), or None if not known.
+        """
+        box = self.get_box(key)
+        if box is None:
+            return None
+        return (box[0], box[1])
+
+    def to_page_relative(self, xs, ys, keys):
+        """Convert canvas positions to page-relative positions in a batch.
+
+        Args:
+            xs (Iterable[float]): XPOS values.
+            ys (Iterable[float]): YPOS values.
+            keys (Iterable): The page of each position (See get_box). A
+                position on an unknown page (or None) is not changed.
+
+        Returns:
+            tuple[list[float]]: x values, y values
+        """
+        page_xs = []
+        page_ys = []
+        for x, y, key in zip(xs, ys, keys):
+            box = self.get_box(key)
+            if box is None:
+                page_xs.append(x)
+                page_ys.append(y)
+            else:
+                page_xs.append(x - box[0])
+                page_ys.append(y - box[1])
+        return page_xs, page_ys
+
+    def _build_index(self):
+        rows = {}
+        for number, box in self._boxes.items():
+            rows.setdefault(box[1], []).append((box[0], number))
+        self._row_tops = sorted(rows.keys())
+        self._rows = [sorted(rows[top]) for top in self._row_tops]
+        self._row_lefts = [[left for left, _ in row] for row in self._rows]
+
+    def find_page(self, x, y):
+        """Find the page that contains a canvas position.
+
+        The lookup is O(log pages) (a binary search of the row tops then
+        of the page lefts in the row). Only pages added so far are found,
+        so collect_pages finds pages for objects lacking OwnPage after
+        all PAGE elements are added.
+
+        Returns:
+            int: The page number (as in OwnPage), or None if the position
+                is not on any page (such as on the scratch space).
+        """
+        if self._row_tops is None:
+            self._build_index()
+        row_i = bisect.bisect_right(self._row_tops, y) - 1
+        if row_i < 0:
+            return None
+        col_i = bisect.bisect_right(self._row_lefts[row_i], x) - 1
+        if col_i < 0:
+            return None
+        number = self._rows[row_i][col_i][1]
+        left, top, width, height = self._boxes[number]
+        if x < left + width and y < top + height:
+            return number
+        return None
+
+
 class ScribusPage(object):
     """Manage elements on a single Scribus page.
 
+    A master page (such as for running headers and page numbers) is also
+    a ScribusPage, but its children are MASTEROBJECT elements.
+
     Attributes:
         number (int): The page number (may be -1)
+        page_node (SGMLNode): The PAGE (or MASTERPAGE) element, which
+            has the position of the page on the canvas.
+        name (str): The name of a master page (NAM), otherwise None.
+        master (ScribusPage): The master page that this page uses (MNAM),
+            shared by all pages using it. None if the page has no master.
     """
     # not SGMLPage because this is specific to Scribus
 
@@ -418,6 +812,59 @@ class ScribusPage(object):
         self.root = None
         self.document = None
         self.number = None
+        self.page_node = None
+        self.name = None
+        self.master = None
+        self._page_origins = None  # only for a detached page
+
+    def get_origin_key(self):
+        """Get the key of this page in PageOrigins."""
+        if self.name is not None:
+            return (MASTER_ORIGIN_KEY, self.name)
+        return self.number
+
+    def get_page_origins(self):
+        """Get the PageOrigins of the document (or of a detached page).
+        """
+        if self.root is not None:
+            return self.root.page_origins
+        return self._page_origins
+
+    def get_origin(self):
+        """Get the position of the page on the canvas.
+
+        XPOS and YPOS of objects are relative to the whole canvas, not
+        to the page. The position is from the PageOrigins table (See
+        get_page_origins).
+
+        Returns:
+            tuple[float]: PAGEXPOS, PAGEYPOS in points ((0.0, 0.0) if the
+                PAGE element is unknown).
+        """
+        page_origins = self.get_page_origins()
+        origin = None
+        if page_origins is not None:
+            origin = page_origins.get_origin(self.get_origin_key())
+        if origin is None:
+            return (0.0, 0.0)
+        return origin
+
+    def get_children(self, include_master=False):
+        """Get the objects on the page.
+
+        Args:
+            include_master (bool): Also include objects of the master
+                page first (the same objects are shared by every page
+                using the master, not copied).
+
+        Returns:
+            list[ScribusPageObject]: The objects (a new list only if
+                include_master adds any).
+        """
+        master = self.master
+        if include_master and master is not None and master.children:
+            return self.master.children + self.children
+        return self.children
 
     def add_child(self, node):
         known_objects = [
@@ -453,54 +900,70 @@ class ScribusPage(object):
             )
         if node.ancestor_has_attribute("OwnPage"):
             raise NotImplementedError("Nested OwnPage")
+        new_node.page = self
         self.children.append(new_node)
 
+    def get_float(self, attribute_name):
+        """Get a page setting such as PAGEWIDTH or BORDERLEFT.
+
+        The PAGE element is used if known since each page can have its
+        own size and margins, otherwise the DOCUMENT element is used.
+        """
+        if self.page_node is not None:
+            value = self.page_node.get_float(attribute_name)
+            if value is not None:
+                return value
+        return float(self.document.attributes[attribute_name])
+
     def get_width(self):
         """Get width in points (1/72 in)
         """
-        return int(self.document.attributes['PAGEWIDTH'])
+        return int(self.get_float('PAGEWIDTH'))
 
     def get_height(self):
         """Get height in points (1/72 in)
         """
-        return int(self.document.attributes['PAGEHEIGHT'])
+        return int(self.get_float('PAGEHEIGHT'))
 
-    def safe_width(self):
-        """Get width minus margins in points (1/72 in).
-        """
-        return int(
-            self.get_width()
-            - int(self.document.attributes['BORDERLEFT'])
-            - int(self.document.attributes['BORDERRIGHT'])
-        )
+    def get_margins(self):
+        """Get the margins in points (1/72 in).
 
-    def safe_height(self):
-        """Get height minus margins in points (1/72 in).
+        Returns:
+            tuple[float]: BORDERLEFT, BORDERTOP, BORDERRIGHT, BORDERBOTTOM
         """
-        return int(
-            self.get_height()
-            - int(self.document.attributes['BORDERTOP'])
-            - int(self.document.attributes['BORDERBOTTOM'])
+        return (
+            self.get_float('BORDERLEFT'),
+            self.get_float('BORDERTOP'),
+            self.get_float('BORDERRIGHT'),
+            self.get_float('BORDERBOTTOM'),
         )
 
-    def wide_and_narrow_children(self):
-        """Separate wide and narrow page objects.
+    def get_bleeds(self):
+        """Get the bleed (beyond the edges of the page) in points.
 
         Returns:
-            tuple[list[ScribusPageObject]]: wide_children, narrow_children
+            tuple[float]: left, top, right, bottom (0.0 for any bleed that
+                the document does not set).
         """
-        half_w = self.safe_width() // 2
-        big_w = half_w + half_w // 6
-        # ^ increase threshold slightly since a picture with a blank
-        #   background may be a little bigger than half the page.
-        wide = []
-        narrow = []
-        for child in self.children:
-            if child.get_float("WIDTH") > big_w:
-                wide.append(child)
-            else:
-                narrow.append(child)
-        return (wide, narrow)
+        results = []
+        for key in ('BleedLeft', 'BleedTop', 'BleedRight', 'BleedBottom'):
+            value = None
+            if self.document is not None:
+                value = self.document.attributes.get(key)
+            results.append(float(value) if value else 0.0)
+        return tuple(results)
+
+    def safe_width(self):
+        """Get width minus margins in points (1/72 in).
+        """
+        left, _, right, _ = self.get_margins()
+        return int(self.get_float('PAGEWIDTH') - left - right)
+
+    def safe_height(self):
+        """Get height minus margins in points (1/72 in).
+        """
+        _, top, _, bottom = self.get_margins()
+        return int(self.get_float('PAGEHEIGHT') - top - bottom)
 
     def left_and_right_children(self, narrow_children):
         """Separate left and right column objects by center_x of each.
@@ -509,128 +972,237 @@ class ScribusPage(object):
         only one column.
 
         Args:
-            narrow_children (list[ScribusPageObject]): The 2nd element
-                of the self.wide_and_narrow_children() tuple which only
-                has children that are the size of a column.
+            narrow_children (list[ScribusPageObject]): Children that
+                are the size of a column (not spanners as determined by
+                ReadingOrder.is_spanner).
         """
         half_w = self.safe_width() // 2
-        center_x = int(self.document.attributes['BORDERLEFT']) + half_w
+        center_x = self.get_margins()[0] + half_w
+        # ^ relative to the page, so compare page-relative positions.
         left = []
         right = []
-        for child in narrow_children:
-            if child.center_x < center_x:
+        boxes = get_page_boxes(narrow_children)
+        for child, box in zip(narrow_children, boxes):
+            if box[0] + box[2] / 2.0 < center_x:
                 left.append(child)
             else:
                 right.append(child)
         return left, right
 
-    def sort_children_spatially(self):
-        """Sort children by column.
+    def sort_children_spatially(self, reading_order=None):
+        """Sort children by band then by column.
+
+        Columns are detected by ReadingOrder (any number of columns, not
+        only left then right), and an object that spans columns (as
+        determined by ReadingOrder.is_spanner) starts a new band.
 
-        Left then right sorting is normal but can be overridden by an
-        object that is 2 columns wide as determined by
-        wide_and_narrow_children.
+        Args:
+            reading_order (Optional[ReadingOrder]): Settings to use.
+                Defaults to the reading_order of the ScribusDocRoot
+                (self.root) if set, otherwise to ReadingOrder().
         """
         if self.document is None:
             raise ValueError("DOCUMENT node is not set.")
         prefix = "[sort_children_spatially] "
-        echo0(prefix + "sorting page %s+1=%s" % (self.number, self.number + 1))
-        new_children = []
-        wide_children, narrow_children = self.wide_and_narrow_children()
-
-        wide_children = sorted(wide_children)
-        narrow_children = sorted(narrow_children)
-        # ^ sorted requires the ScribusPageObject subclass which implements
-        #   dunder methods used by sorting.
-        tmp = ScribusPageObject()
-        tmp.attributes = OrderedDict()
-        tmp.attributes['YPOS'] = None
-        TMP_TAGNAME = "morescribus tmp"
-        tmp.tagName = TMP_TAGNAME
-        tmp.attributes['HEIGHT'] = 72 // 4  # 72 is 1 inch.
-        min_y = None
-        # last tier has to be above all children:
-        for child in narrow_children:
-            if tmp.ypos is None or child.ypos > tmp.ypos:
-                tmp.attributes["YPOS"] = child.ypos
-            if min_y is None or child.ypos < min_y:
-                min_y = child.ypos
-        # first minimum needs to be below all tiers too
-        #   (for bounds checking--see RuntimeError further down):
-        for child in wide_children:
-            if min_y is None or child.ypos < min_y:
-                min_y = child.ypos
-
-        if len(narrow_children) > 0:
-            tmp.attributes["YPOS"] += 1
-        else:
-            # echo0("Warning, no single-column elements in page %s+1=%s"
-            #       % (self.number, self.number+1))
-            # ^ This warning is commented since the recommended way to do
-            #   2 columns in scribus is *1* box with columns set to 2.
-            if hasattr(sys, 'maxint'):
-                tmp.attributes['YPOS'] = MAXINT
-            else:
-                # maxint is deprecated...there is no max!
-                tmp.attributes['YPOS'] = MAXINT
-        if min_y is None:
-            min_y = MININT
-        if len(wide_children) == 0:
-            echo0("There are no wide elements in page %s+1=%s"
-                  % (self.number, self.number + 1))
-        if len(wide_children) + len(narrow_children) != len(self.children):
-            echo0("%s wide and %s narrow do not add up to %s total"
-                  " on page %s+1=%s"
-                  % (len(wide_children), len(narrow_children),
-                     len(self.children), self.number, self.number + 1))
-        wide_children.append(tmp)  # to reorder left or right less than each
-        for child in narrow_children:
-            child.done = False
-        left_children, right_children = \
-            self.left_and_right_children(narrow_children)
-        # echo0(prefix+"Sorting page %s" % (self.number + 1))
-        for divider in wide_children:
-            # echo0(prefix+"writing %s <= y < %s" % (min_y, divider.ypos))
-            for child in left_children:
-                if child.ypos < divider.ypos and child.ypos >= min_y:
-                    new_children.append(child)
-            for child in right_children:
-                if child.ypos < divider.ypos and child.ypos >= min_y:
-                    new_children.append(child)
-            if divider.tagName == TMP_TAGNAME:
-                continue
-            new_children.append(divider)
-            if divider.ypos < min_y:
-                points = []
-                for _divider in wide_children:
-                    points.append((_divider.xpos, _divider.ypos))
-                raise RuntimeError("Sorting failed. ypos %s < %s in: %s"
-                                   % (divider.ypos, min_y, points))
-            min_y = divider.ypos
+        echo1(prefix + "sorting page %s+1=%s" % (self.number, self.number + 1))
+        if reading_order is None:
+            reading_order = getattr(self.root, 'reading_order', None)
+        if reading_order is None:
+            reading_order = ReadingOrder()
+        new_children = reading_order.sort(self)
         if len(self.children) != len(new_children):
             raise NotImplementedError("Not all children were sorted.")
         self.children = new_children
 
-    def dump_text(self, stream):
+    def to_payload(self, include_master=False):
+        """Get a compact picklable copy of the page for another process.
+
+        The nodes are converted using to_dict, so parent references (and
+        therefore the rest of the tree) are not included.
+
+        Args:
+            include_master (bool): Also include the master page (See
+                get_children).
+        """
+        page_origins = self.get_page_origins()
+        payload = {
+            'number': self.number,
+            'name': self.name,
+            'box': (page_origins.get_box(self.get_origin_key())
+                    if page_origins is not None else None),
+            'document': OrderedDict(self.document.attributes),
+            'reading_order': getattr(self.root, 'reading_order', None),
+            'image_dir': getattr(self.root, 'image_dir', None),
+            'include_master': include_master,
+            'master': None,
+            'children': [child.to_dict(enable_locations=False)
+                         for child in self.children],
+        }
+        if include_master and self.master is not None:
+            payload['master'] = self.master.to_payload()
+        return payload
+
+    @staticmethod
+    def from_payload(payload, page_origins=None):
+        """Create a detached page from the result of to_payload.
+
+        Args:
+            page_origins (Optional[PageOrigins]): The table to add the
+                page to, shared with its master page. Defaults to a new
+                one.
+        """
+        page = ScribusPage()
+        page.number = payload['number']
+        page.name = payload['name']
+        if page_origins is None:
+            page_origins = PageOrigins()
+        page._page_origins = page_origins
+        box = payload['box']
+        if box is not None:
+            if page.name is not None:
+                page_origins.add_master(page.name, *box)
+            else:
+                page_origins.add(page.number, *box)
+        page.document = SGMLNode()
+        page.document.tagName = "DOCUMENT"
+        page.document.attributes = payload['document']
+        for child_dict in payload['children']:
+            child = node_from_dict(child_dict)
+            mark_list_items(child)
+            page.add_child(child)
+        if payload['master'] is not None:
+            page.master = ScribusPage.from_payload(payload['master'],
+                                                   page_origins)
+        return page
+
+    def dump_text(self, stream, children=None, file_cache=None):
         """Write only visible text of children to stream.
 
         Call sort_children_spatially *before* this for spatial sorting.
+
+        Args:
+            children (Optional[list[ScribusPageObject]]): Objects to dump
+                instead of self.children, such as from
+                ReadingOrder.sort(page, page.get_children(True)).
+            file_cache (Optional[FileStatCache]): Where to look up images
+                and record missing ones. Defaults to that of self.root
+                (See ScribusDocRoot.get_file_cache).
         """
-        for sub in self.children:
+        for _, markdown in self.get_frames(children=children,
+                                           file_cache=file_cache):
+            stream.write(markdown)
+
+    def get_frames(self, children=None, file_cache=None):
+        """Get the visible text of each child as Markdown, with a record.
+
+        Call sort_children_spatially *before* this for spatial sorting.
+
+        Args:
+            children, file_cache: See dump_text.
+
+        Returns:
+            list[tuple(OrderedDict, str)]: A record (See
+                booktacular.morescribus.writers) and the Markdown of each
+                child, in order.
+        """
+        if children is None:
+            children = self.children
+        if file_cache is None and self.root is not None:
+            file_cache = self.root.get_file_cache()
+        frames = []
+        boxes = get_page_boxes(children)
+        for sub, box in zip(children, boxes):
+            frame_stream = StringIO()
             # _dump_text_unsorted since children of PAGEOBJECT
             #   (but not PAGEOBJECTs themselves) are in order of appearance(?)
             sub._dump_text_unsorted(
-                stream,
+                frame_stream,
                 sub.parent,
                 self.root,
                 sub,
                 sub,
                 attribute="CH",
                 image_attribute="PFILE",
-                paragraph_tags=["PAGEOBJECT", "para"],
+                paragraph_tags=["PAGEOBJECT", "MASTEROBJECT", "para"],
                 tab_tags=["tab"],
-                tab_mark="\t"
+                tab_mark="\t",
+                file_cache=file_cache,
             )
+            markdown = frame_stream.getvalue()
+            x, y, width, height = box
+            record = OrderedDict()
+            record['page'] = self.number + 1
+            record['ItemID'] = sub.get("ItemID")
+            record['tagName'] = sub.tagName
+            record['bbox'] = [x, y, x + width, y + height]
+            record['style'] = get_paragraph_style(sub)
+            record['image'] = sub.get("PFILE")
+            record['text'] = get_frame_text(markdown)
+            frames.append((record, markdown))
+        return frames
+
+
+def _get_page_frames(page, reading_order, include_master=False,
+                     file_cache=None):
+    """Sort a page then get its frames (See ScribusPage.get_frames)."""
+    children = None
+    if include_master and page.master is not None and page.master.children:
+        if reading_order is None:
+            reading_order = ReadingOrder()
+        children = reading_order.sort(page, page.get_children(True))
+    else:
+        page.sort_children_spatially(reading_order=reading_order)
+    return page.get_frames(children=children, file_cache=file_cache)
+
+
+def _render_page(page, reading_order, include_master=False,
+                 file_cache=None):
+    """Get the frames of a page and the images missing from it.
+
+    Returns:
+        tuple(list, OrderedDict): The frames (See _get_page_frames), and
+            missing images of only this page (See FileStatCache.missing,
+            to which the caller must add them).
+    """
+    all_missing = file_cache.missing
+    file_cache.missing = OrderedDict()
+    try:
+        frames = _get_page_frames(page, reading_order,
+                                  include_master=include_master,
+                                  file_cache=file_cache)
+        return frames, file_cache.missing
+    finally:
+        file_cache.missing = all_missing
+
+
+_worker_file_caches = {}
+# ^ image_dir with the FileStatCache of this worker process (See
+#   _init_dump_worker), so each directory is listed once per worker
+#   instead of once per page.
+
+
+def _init_dump_worker():
+    """Start each worker of a dump with empty caches (not copies of the
+    parent's, such as after fork)."""
+    _worker_file_caches.clear()
+
+
+def _dump_page_payload(payload):
+    """Get the frames of a page from ScribusPage.to_payload in a worker.
+
+    Returns:
+        tuple(list, OrderedDict): The same frames that _get_page_frames
+            would get for the page, and missing images of only this page
+            (See _render_page).
+    """
+    page = ScribusPage.from_payload(payload)
+    file_cache = _worker_file_caches.get(payload['image_dir'])
+    if file_cache is None:
+        file_cache = FileStatCache(payload['image_dir'])
+        _worker_file_caches[payload['image_dir']] = file_cache
+    return _render_page(page, payload['reading_order'],
+                        include_master=payload['include_master'],
+                        file_cache=file_cache)
 
 
 class SGMLText(object):
@@ -650,6 +1222,7 @@ class SGMLText(object):
         self.parent = None
         self.start = None
         self.end = None
+        self.list_item = None  # See mark_list_items (None if not checked)
 
     def startswith(self, value, attribute=None, encoding=None,
                    test_fail=False):
@@ -681,6 +1254,20 @@ class SGMLText(object):
                 raise NotImplementedError("uh oh")
             return False
 
+        if (isinstance(self_value_bytes, str)
+                and isinstance(value, (bytes, bytearray))):
+            # Decode the (short) prefix instead of encoding the value.
+            if (value == UTF8_BULLET) and (encoding == "utf-8"):
+                prefix = BULLET
+            else:
+                prefix = bytes(value).decode(encoding)
+            if test_fail and not self_value_bytes.startswith(prefix):
+                raise NotImplementedError(
+                    "uh oh %s does not start with %s"
+                    % (repr(self_value_bytes), repr(prefix))
+                )
+            return self_value_bytes.startswith(prefix)
+
         if not isinstance(self_value_bytes, type(value)):
             if isinstance(value, (bytes, bytearray)):
                 if isinstance(self_value_bytes, str):
@@ -853,17 +1440,61 @@ class SGMLText(object):
             CH = attributes.get('CH')
             XPOS = attributes.get('XPOS')
             YPOS = attributes.get('YPOS')
-            if attributes.get("OwnPage") is not None:
+            tagName = getattr(self, 'tagName', None)
+            if tagName == "PAGE":
+                page = root._get_page(int(attributes['NUM']), self,
+                                      document_node)
+                page.page_node = self
+                root.page_origins.add(
+                    page.number,
+                    page.get_float('PAGEXPOS'),
+                    page.get_float('PAGEYPOS'),
+                    page.get_float('PAGEWIDTH'),
+                    page.get_float('PAGEHEIGHT'),
+                )
+                if attributes.get('MNAM'):
+                    page.master = root._get_master_page(
+                        attributes['MNAM'], self, document_node)
+            elif tagName == "MASTERPAGE":
+                master = root._get_master_page(attributes.get('NAM'), self,
+                                               document_node)
+                master.page_node = self
+                if attributes.get('NUM') is not None:
+                    master.number = int(attributes['NUM'])
+                root.page_origins.add_master(
+                    master.name,
+                    master.get_float('PAGEXPOS'),
+                    master.get_float('PAGEYPOS'),
+                    master.get_float('PAGEWIDTH'),
+                    master.get_float('PAGEHEIGHT'),
+                )
+            if ((attributes.get("OwnPage") is None)
+                    and (tagName in PAGE_FILTER_TAGS)
+                    and (XPOS is not None) and (YPOS is not None)):
+                page_node = self
+                root._unplaced.append(self)
+                # ^ Its page is found once all PAGE elements are known
+                #   (See collect_pages).
+            elif attributes.get("OwnPage") is not None:
                 page_node = self
                 OwnPage = int(attributes['OwnPage'])
-                if OwnPage not in root._pages:
-                    root._pages[OwnPage] = ScribusPage()
-                    root._pages[OwnPage].node = self
-                    root._pages[OwnPage].root = root
-                    root._pages[OwnPage].document = document_node
-                    root._pages[OwnPage].number = int(OwnPage)
-                root._pages[OwnPage].add_child(self)
-
+                if tagName == "MASTEROBJECT":
+                    # OwnPage is the index of the master page, so use
+                    #   the name.
+                    root._get_master_page(attributes.get('OnMasterPage'),
+                                          self,
+                                          document_node).add_child(self)
+                else:
+                    root._get_page(OwnPage, self,
+                                   document_node).add_child(self)
+
+            if tagName == "ItemAttribute":
+                if page_node is not None:
+                    root._item_attributes.append((self, page_node))
+            elif tagName == "TableOfContents":
+                if attributes.get('ItemAttributeName'):
+                    root._toc_attribute_names.add(
+                        attributes['ItemAttributeName'])
             if XPOS is not None:
                 if YPOS is not None:
                     pos_node = self
@@ -876,7 +1507,7 @@ class SGMLText(object):
                 YPOS = pos_node.attributes['YPOS']
         if OwnPage is None:
             if page_node:
-                OwnPage = page_node.attributes['OwnPage']
+                OwnPage = page_node.attributes.get('OwnPage')
 
         tagName = None
         tagNameUpper = None
@@ -897,7 +1528,7 @@ class SGMLText(object):
     def _dump_text_unsorted(self, stream, parent, root, pos_node, page_node,
                             attribute=None, image_attribute=None, indent=None,
                             paragraph_tags=None, para_mark=None, tab_tags=None,
-                            tab_mark=None):
+                            tab_mark=None, file_cache=None):
         # if node['tagName'].upper() == "PAGEOBJECT":
 
         # if tagName.lower() != 'ITEXT':
@@ -905,6 +1536,8 @@ class SGMLText(object):
         #     return
         if para_mark is None:
             para_mark = "\n\n"
+        if file_cache is None:
+            file_cache = FileStatCache()  # relative to the current directory
         attributes = None
         children = None
         if indent is None:
@@ -951,18 +1584,23 @@ class SGMLText(object):
             #     alt = value
             # else:
             date_str = ""
-            if os.path.isfile(image):
-                file_ts = os.path.getmtime(image)
+            file_ts = file_cache.getmtime(image)
+            if file_ts is not None:
                 dt = datetime.fromtimestamp(file_ts)
                 date_str = ": " + dt.strftime("%Y-%d-%m %H:%M:%S")
             else:
-                raise FileNotFoundError("No such file: %s" % image)
+                page = None
+                if attributes and attributes.get('OwnPage') is not None:
+                    page = int(attributes['OwnPage']) + 1
+                    # ^ pages start at 0 here, but not in GUI.
+                file_cache.add_missing(image, page=page)
+                date_str = ": missing"
             image_no_ext, _ = os.path.splitext(os.path.basename(image))
             image_name = image_no_ext.replace("_", " ").replace("-", " ")
             alt = "%s%s" % (image_name, date_str)
             stream.write("\n![%s](%s)\n" % (alt, image))
         elif value is not None:
-            markdown = value.replace(UTF8_BULLET.decode("utf-8"), "*")
+            markdown = value.replace(BULLET, "*")
             try:
                 _ = int(value)
                 raise ValueError(
@@ -989,55 +1627,17 @@ class SGMLText(object):
             return
 
         for i, child in enumerate(children):
-            prev_child = children[i - 1] if i > 0 else None
-            # ^ The prev child may not be a bullet such as in
+            # The bullet may be in a separate child such as in
             #   Scribus format:
             #   <para PARENT
             #   <ITEXT FONT  ... [where CH is only a bullet character]
             #   <ITEXT FONTSIZE ... [where CH is text after bullet]
             next_child = children[i + 1] if (i + 1 < len(children)) else None
-            if next_child:
-                # In The Path of Resistance.sla, if the
-                # previous child contains "and giant sil" then the
-                # current child should be para and the
-                # next child should start with bullet:
-                if next_child.startswith(UTF8_BULLET, attribute=attribute):
-                    para_mark = "\n"  # only 1 newline, para between bullets
-                else:  # There is no bullet next
-                    # There is known to be another bullet after
-                    #   after_prev_bullet prior to this child (para). If
-                    #   that bullet isn't next, parsing failed (or
-                    #   UTF8_BULLET is not decoded correctly).
-                    after_prev_bullet = "giant silhouettes"  # prev_child
-                    prev_child_value = None
-                    if prev_child:
-                        prev_child_value = \
-                            prev_child.get_value(attribute=attribute)
-                    # child_value = child.get_value(attribute)
-                    # ^ unused (*always blank* for para in Scribus format)
-                    if (prev_child_value
-                            and (after_prev_bullet in prev_child_value)):
-                        _ = next_child.startswith(UTF8_BULLET,
-                                                  attribute=attribute,
-                                                  test_fail=True)
-
-                        # since this is the ELSE case for below, above
-                        #   should be False (Match should have para
-                        #   [this child] then bullet[next child])
-                        raise ValueError(
-                            "No bullet in value=%s in "
-                            "\n  next_child %s"
-                            "\n  (this=%s)"
-                            "\n  (previous=%s)"
-                            % (
-                                repr(
-                                    next_child.get_value(attribute=attribute)
-                                ),
-                                next_child.to_dict(),
-                                child.to_dict(),
-                                prev_child.to_dict(),
-                            )
-                        )
+            if next_child and is_list_item(next_child, attribute=attribute):
+                para_mark = "\n"  # only 1 newline, para between bullets
+            # ^ Whether the list is well-formed (such as bullets only at
+            #   the start of a paragraph) is checked by validate_lists
+            #   instead of stopping the dump.
             child._dump_text_unsorted(
                 stream,
                 self,
@@ -1051,6 +1651,7 @@ class SGMLText(object):
                 para_mark=para_mark,
                 tab_tags=tab_tags,
                 tab_mark=tab_mark,
+                file_cache=file_cache,
             )
         return
 
@@ -1071,6 +1672,7 @@ class SGMLNode(SGMLText):
         self.attributes = OrderedDict()  # from 'attributes'
         self.self_closer = None
         self.children = []  # Determined by the `populate` method.
+        self._loaded_count = None  # len(children) after populate
 
     @property
     def context(self):
@@ -1117,7 +1719,7 @@ class SGMLNode(SGMLText):
     def cb_done_populate(self, evt):
         echo0("...Done")  # finish the line that cb_progress_populate started.
 
-    def _populate(self, lexer, cb_progress=None):
+    def _populate(self, lexer, cb_progress=None, own_pages=None):
         """Parse chunks from lexer and create children recursively.
 
         This does *not* take cb_done because it is recursive. For the cb_done
@@ -1127,6 +1729,13 @@ class SGMLNode(SGMLText):
             while True:
                 chunkdef = lexer.next(cb_progress=cb_progress)
                 context = chunkdef['context']
+                if ((own_pages is not None) and (context == SGMLLexer.START)
+                        and (chunkdef['tagName'] in PAGE_FILTER_TAGS)):
+                    OwnPage = chunkdef['attributes'].get('OwnPage')
+                    if (OwnPage is not None
+                            and int(OwnPage) not in own_pages):
+                        lexer.skip_element()
+                        continue
                 if context in (SGMLLexer.START, SGMLLexer.CONTENT):
                     if context == SGMLLexer.START:
                         child = SGMLNode.from_chunkdef(chunkdef)
@@ -1139,6 +1748,7 @@ class SGMLNode(SGMLText):
                             child._populate(
                                 lexer,
                                 cb_progress=cb_progress,
+                                own_pages=own_pages,
                             )
                         # else self-closing so next child also belongs to self
                 elif context == SGMLLexer.END:
@@ -1149,8 +1759,10 @@ class SGMLNode(SGMLText):
                                               % context)
         except StopIteration:
             pass
+        self._loaded_count = len(self.children)  # See SGMLElementTree.write
 
-    def populate(self, lexer, cb_progress=None, cb_done=None):
+    def populate(self, lexer, cb_progress=None, cb_done=None,
+                 own_pages=None):
         """
 
         cb_done should *not* be called from here, since it is recursive.
@@ -1161,6 +1773,10 @@ class SGMLNode(SGMLText):
             cb_done (Callable): The done callback is notified when
                 the entire recursive progress is done, unless the
                 'error' key of the sent dict is not None.
+            own_pages (Optional[set[int]]): If not None, skip any
+                PAGE_FILTER_TAGS element with an OwnPage not in the set
+                (0-based, See parse_page_ranges) without making nodes
+                for it or lexing the inside of it.
         """
         if cb_progress is None:
             cb_progress = self.cb_progress_populate
@@ -1169,6 +1785,7 @@ class SGMLNode(SGMLText):
         self._populate(
             lexer,
             cb_progress=cb_progress,
+            own_pages=own_pages,
         )
         cb_done({})
 
@@ -1254,6 +1871,26 @@ class ScribusPageObject(SGMLNode):
     def center_y(self):
         return self.ypos + self.height // 2
 
+    @property
+    def page_x(self):
+        """Get XPOS relative to the left of the page (or master page).
+
+        XPOS itself is relative to the whole canvas (See
+        ScribusPage.get_origin).
+        """
+        page = getattr(self, 'page', None)
+        if page is None:
+            return self.xpos
+        return self.xpos - page.get_origin()[0]
+
+    @property
+    def page_y(self):
+        """Get YPOS relative to the top of the page (or master page)."""
+        page = getattr(self, 'page', None)
+        if page is None:
+            return self.ypos
+        return self.ypos - page.get_origin()[1]
+
 
 class ScribusFrameObject(ScribusPageObject):
     def __init__(self):
@@ -1296,6 +1933,8 @@ class SGMLElementTree(SGMLNode):
         SGMLNode.__init__(self)
         self._lexer = None
         self._pages = None
+        self.image_dir = None  # relative image paths are relative to this
+        self.file_cache = None
 
     @property
     def context(self):
@@ -1316,12 +1955,38 @@ class SGMLElementTree(SGMLNode):
         if self.children is None:
             raise RuntimeError("you must parse first.")
 
+        file_cache = self.get_file_cache(refresh=True)
         for sub in self.children:
             sub._dump_text_unsorted(stream, self, self, None, None,
                                     attribute=attribute,
-                                    image_attribute=image_attribute)
+                                    image_attribute=image_attribute,
+                                    file_cache=file_cache)
+        for line in file_cache.get_missing_report():
+            echo0(line)
+
+    def get_file_cache(self, refresh=False):
+        """Get the cache for looking up images cited by the document.
 
-    def parse(self, lexer):
+        Args:
+            refresh (bool): Start a new cache (such as for another pass,
+                so files changed since the last one are noticed).
+
+        Returns:
+            FileStatCache: The cache (relative to image_dir, which
+                ScribusProject sets to the directory of the SLA file).
+        """
+        if refresh or (self.file_cache is None):
+            self.file_cache = FileStatCache(self.image_dir)
+        return self.file_cache
+
+    def parse(self, lexer, own_pages=None):
+        """Create the tree from the lexer.
+
+        Args:
+            lexer (SGMLLexer): The lexer (with data).
+            own_pages (Optional[set[int]]): Only include objects on these
+                pages (See populate).
+        """
         self._lexer = lexer
         if lexer._data is None:
             raise ValueError(
@@ -1331,13 +1996,171 @@ class SGMLElementTree(SGMLNode):
         echo0("Parsing...")
         min_page = None
         max_page = None
-        self.populate(lexer)
+        self.populate(lexer, own_pages=own_pages)
         # self.children = self._parse(lexer, self, None, None, None)
 
+    def write(self, stream, chunk_size=None):
+        """Write the document, including changes to attributes.
+
+        The data is not regenerated from the tree. Instead, the original
+        data is copied except for start tags where the attributes of the
+        node were changed, so formatting is kept and elements that were
+        skipped while parsing (See populate) are written unchanged.
+
+        Args:
+            stream: A text stream such as an open file.
+            chunk_size (Optional[int]): Write at most this many characters
+                of unchanged data at a time. Defaults to SAVE_CHUNK_SIZE.
+
+        Returns:
+            int: The number of tags that were changed.
+
+        Raises:
+            ValueError: If nodes or text were added, removed, moved or
+                changed since parsing (See _check_children), since only
+                changes to attributes can be written.
+        """
+        if self._lexer is None:
+            raise RuntimeError("you must lex and parse first.")
+        if chunk_size is None:
+            chunk_size = SAVE_CHUNK_SIZE
+        data = self._lexer._data
+        self._check_children(self, data)
+        pos = 0
+        changed = 0
+        pending = list(reversed(self.children))
+        while pending:
+            node = pending.pop()
+            if not isinstance(node, SGMLNode):
+                continue  # Text is copied from the data.
+            if node.start is None:
+                raise ValueError(
+                    "A {} node was not loaded from the data, so it cannot"
+                    " be saved (only attributes can be changed)."
+                    "".format(node.tagName)
+                )
+            self._check_children(node, data)
+            tag = self._changed_start_tag(node)
+            if tag is not None:
+                write_slice(stream, data, pos, node.start, chunk_size)
+                stream.write(tag)
+                pos = node.end
+                changed += 1
+            pending.extend(reversed(node.children))
+        write_slice(stream, data, pos, len(data), chunk_size)
+        return changed
+
+    def _check_children(self, node, data):
+        """Make sure write would not drop changes to children or text.
+
+        Raises:
+            ValueError: If children were removed, added or reordered
+                since parsing, or the value of text was changed (only
+                attributes can be saved).
+        """
+        if len(node.children) != (node._loaded_count or 0):
+            raise ValueError(
+                "Children of a {} node were added or removed, so it cannot"
+                " be saved (only attributes can be changed)."
+                "".format(node.tagName)
+            )
+        prev_start = node.start
+        for child in node.children:
+            if child.start is None:
+                if isinstance(child, SGMLNode):
+                    continue  # See the error in write.
+                raise ValueError(
+                    "Text was added to a {} node, so it cannot be saved"
+                    " (only attributes can be changed)."
+                    "".format(node.tagName)
+                )
+            if (prev_start is not None) and (child.start <= prev_start):
+                raise ValueError(
+                    "Children of a {} node were moved, so it cannot be"
+                    " saved (only attributes can be changed)."
+                    "".format(node.tagName)
+                )
+            prev_start = child.start
+            if isinstance(child, SGMLNode):
+                continue
+            if ((child.value is not None)
+                    and (child.value != data[child.start:child.end])):
+                raise ValueError(
+                    "Text in a {} node was changed, so it cannot be saved"
+                    " (only attributes can be changed)."
+                    "".format(node.tagName)
+                )
+
+    def _changed_start_tag(self, node):
+        """Get a new start tag for node if its attributes were changed.
+
+        Returns:
+            str: The tag generated from node.attributes, or None if the
+                original tag in the data still matches.
+        """
+        chunkdef = {
+            'context': SGMLLexer.START,
+            'tagName': node.tagName,
+            'attributes': node.attributes,
+            'self_closer': node.self_closer,
+        }
+        chunk = self._lexer.chunk_from_chunkdef(chunkdef)
+        data = self._lexer._data
+        if ((len(chunk) == node.end - node.start)
+                and data.startswith(chunk, node.start)):
+            return None
+        # Lex the original only if different, since spacing may differ:
+        original = SGMLLexer(data[node.start:node.end], strict=False).next(
+            cb_progress=no_progress,
+        )
+        if ((original['attributes'] == node.attributes)
+                and (original.get('self_closer') == node.self_closer)):
+            return None
+        return chunk
+
+
+def no_progress(evt):
+    """A cb_progress for SGMLLexer.next that does not show progress."""
+    pass
+
+
+def write_slice(stream, data, start, end, chunk_size=None):
+    """Write data[start:end] in slices of at most chunk_size characters.
+
+    This avoids copying a large part of the data at once (See
+    SAVE_CHUNK_SIZE).
+    """
+    if chunk_size is None:
+        chunk_size = SAVE_CHUNK_SIZE
+    while start < end:
+        stream.write(data[start:min(end, start + chunk_size)])
+        start += chunk_size
+
 
 class ScribusDocRoot(SGMLElementTree):
     def __init__(self):
         SGMLElementTree.__init__(self)
+        self.reading_order = ReadingOrder()
+        self._master_pages = None
+        self.page_origins = None  # See collect_pages
+        self.style_table = None  # See get_style_table
+
+    def get_style_table(self, refresh=False):
+        """Get the paragraph and character styles of the document.
+
+        The table is built once, so each style is resolved only once
+        (See booktacular.morescribus.styles).
+
+        Args:
+            refresh (bool): Build the table again (such as after styles
+                were changed in the tree).
+
+        Returns:
+            StyleTable: The styles.
+        """
+        if refresh or (self.style_table is None):
+            self.style_table = StyleTable.from_root(self)
+        return self.style_table
 
     def get_root(self):
         for sub in self.children:
@@ -1355,13 +2178,36 @@ class ScribusDocRoot(SGMLElementTree):
         real_root = self.get_root()
         return real_root.attributes['TITLE']
 
-    def dump_text(self, stream):
-        '''Dump all text in spatial order, respecting up to 2 columns.
+    def dump_text(self, stream, jobs=None, pages=None, include_master=False,
+                  output_format="markdown", cache=None):
+        '''Dump all text in spatial order, respecting columns.
 
         Also respect multiple sections per page (if there is a box the
         width of the whole page, the column order automatically changes
         - from: left, right
         - to: top-left, top-right, full-width-box, bottom-left, bottom-right
+        See ReadingOrder (and the reading_order attribute) for details.
+
+        Args:
+            stream: A file-like object opened for writing text.
+            jobs (Optional[int]): Number of processes that sort and dump
+                pages. None or 1 (the default) dumps in this process. 0
+                uses one process per CPU. Either way, pages are written
+                in order. Each page is copied to its process (See
+                ScribusPage.to_payload), which usually costs more than
+                sorting it, so only use this for a large book on many
+                CPUs after timing both.
+            pages (Optional[set[int]]): Only dump these pages (0-based,
+                See parse_page_ranges). To also avoid loading other pages,
+                set pages when loading instead (See ScribusProject).
+            include_master (bool): Also dump objects of each page's master
+                page (such as running headers) in reading order.
+            output_format (str): One of DUMP_FORMATS (See
+                booktacular.morescribus.writers).
+            cache (Optional[PageCache]): Only sort and dump pages that
+                changed since they were stored in this cache, and store
+                them (See booktacular.morescribus.pagecache). Call
+                cache.save afterward to keep it.
         '''
         prefix = "[dump_text] "
         if self._lexer is None:
@@ -1370,8 +2216,85 @@ class ScribusDocRoot(SGMLElementTree):
         if self.children is None:
             raise RuntimeError("you must parse first.")
 
-        # if self._pages is None:
-        self.collect_pages()
+        if self._pages is None:
+            self.collect_pages()
+        pages = self.visible_pages(pages=pages)
+        file_cache = self.get_file_cache(refresh=True)
+        writer = get_writer(output_format, stream)
+        writer.start_document(self.get_title())
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+        keys = {}
+        cached = {}
+        if cache is not None:
+            for page in pages:
+                key = cache.get_key(page, include_master=include_master,
+                                    file_cache=file_cache,
+                                    reading_order=self.reading_order)
+                keys[page.number] = key
+                entry = cache.get(page.number, key)
+                if entry is not None:
+                    cached[page.number] = entry
+        todo = [page for page in pages if page.number not in cached]
+
+        def write_pages(results):
+            # results: frames and missing for each page in todo, in order
+            for page in pages:
+                if page.number in cached:
+                    frames, missing = cached[page.number]
+                else:
+                    frames, missing = next(results)
+                    if cache is not None:
+                        cache.set(page.number, keys[page.number], frames,
+                                  missing)
+                writer.start_page(page.number + 1)
+                for record, markdown in frames:
+                    writer.write_frame(record, markdown)
+                file_cache.update_missing(missing)
+
+        def render_pages():
+            for page in todo:
+                prev_len = len(self.children)
+                yield _render_page(page, self.reading_order,
+                                   include_master=include_master,
+                                   file_cache=file_cache)
+                if len(self.children) != prev_len:
+                    raise NotImplementedError(
+                        "element count was reduced from %s to %s"
+                        % (prev_len, len(self.children))
+                    )
+
+        if jobs is not None and jobs > 1 and len(todo) > 1:
+            payloads = [page.to_payload(include_master=include_master)
+                        for page in todo]
+            chunksize = max(1, len(payloads) // (jobs * 4))
+            executor = ProcessPoolExecutor(max_workers=jobs,
+                                           initializer=_init_dump_worker)
+            with executor:
+                write_pages(executor.map(_dump_page_payload, payloads,
+                                         chunksize=chunksize))
+                # ^ map yields in the order of payloads.
+        else:
+            write_pages(render_pages())
+        writer.end_document()
+        if cache is not None:
+            echo0(prefix + "cached=%s" % len(cached))
+        echo0(prefix + "count=%s" % len(pages))
+        for line in file_cache.get_missing_report():
+            echo0(prefix + line)
+
+    def visible_pages(self, pages=None):
+        """Get pages that have objects, in order.
+
+        Call collect_pages first.
+
+        Args:
+            pages (Optional[set[int]]): Only include these pages.
+
+        Returns:
+            list[ScribusPage]: Pages from the first (or 0 if OwnPage of
+                any object is -1) to the last page with any objects.
+        """
         first = None
         last = None
         for key in self._pages.keys():
@@ -1406,41 +2329,318 @@ class ScribusDocRoot(SGMLElementTree):
             #   multiple duplicates and then there is a FRAMEOBJECT
             #   with OwnPage that is >= 0.
             first = 0
-        count = 0
-        stream.write(
-            "\n\n"
-            "# %s\n"
-            % (self.get_title())
-        )
+        results = []
         for index in range(first, last + 1):
+            if pages is not None and index not in pages:
+                continue
             page = self._pages.get(index)
-            if page is None:
+            if page is None or not page.children:
                 echo1("Blank page %s+1=%s (not in %s)"
                       % (repr(index), index + 1,
                          list(sorted(self._pages.keys()))))
                 # There is no PAGEOBJECT/other visible on this page.
                 continue
-            count += 1
-            prev_len = len(self.children)
-            page.sort_children_spatially()
-            if len(self.children) != prev_len:
-                raise NotImplementedError(
-                    "element count was reduced from %s to %s"
-                    % (prev_len, len(self.children))
-                )
-            stream.write(
-                "\n\n"
-                "## Page %s\n"
-                % (index + 1)
-            )
-            page.dump_text(stream)
-        echo0(prefix + "count=%s" % count)
+            results.append(page)
+        return results
 
     def collect_pages(self):
+        """Assign objects to pages and master pages (only once).
+
+        Master pages are cached by name (See get_master_page) and each
+        page's master attribute refers to the cached master. An object
+        without OwnPage is added to the page under its center (See
+        PageOrigins.find_page) after the whole tree is walked, so it does
+        not matter whether PAGE elements come before objects in the file.
+        Such objects are added after the others on their page.
+        """
         if self._pages is not None:
             raise RuntimeError("_pages already collected")
         self._pages = {}  # key is integer
+        self._master_pages = OrderedDict()  # key is NAM
+        self._item_attributes = []  # (ItemAttribute, object) pairs
+        self.page_origins = PageOrigins()
+        self._toc_attribute_names = set()
+        self._unplaced = []  # objects without OwnPage
         self._collect_pages(None, self, None, None, None)
+        for node in self._unplaced:
+            OwnPage = self._find_own_page(node)
+            if OwnPage is not None:
+                self._pages[OwnPage].add_child(node)
+                # ^ find_page only finds pages added by PAGE elements.
+        self._unplaced = None
+
+    def get_toc(self, names=None):
+        """Get table of contents entries in page order.
+
+        Scribus marks an object for the table of contents using an
+        ItemAttribute (under PageItemAttributes) named by the
+        ItemAttributeName of TableOfContents (usually "TOC"). The
+        entries are gathered by collect_pages, so no extra pass over the
+        tree is necessary.
+
+        Args:
+            names (Optional[Iterable[str]]): ItemAttribute names to use.
+                Defaults to the ItemAttributeName of each
+                TableOfContents in the document, or TOC_ATTRIBUTE_NAME.
+
+        Returns:
+            list[OrderedDict]: Entries each with 'title', 'page'
+                (counting from 1 as in Scribus), 'level' (See
+                get_heading_level), 'style' (paragraph style of the
+                object) and 'ItemID', sorted by page then position.
+        """
+        if self._pages is None:
+            self.collect_pages()
+        if names is None:
+            names = self._toc_attribute_names or [TOC_ATTRIBUTE_NAME]
+        names = set(names)
+        keyed = []
+        for node, obj in self._item_attributes:
+            if node.attributes.get('Name') not in names:
+                continue
+            if obj.tagName == "MASTEROBJECT":
+                continue  # OwnPage is a master page index.
+            OwnPage = self._find_own_page(obj)
+            if OwnPage is None or OwnPage < 0:
+                continue  # not visible
+            origin_x, origin_y = (self.page_origins.get_origin(OwnPage)
+                                  or (0.0, 0.0))
+            style = get_paragraph_style(obj)
+            title = (node.attributes.get('Value') or "").strip()
+            if not title:
+                title = get_text(obj).strip()
+            entry = OrderedDict()
+            entry['title'] = title
+            entry['page'] = OwnPage + 1
+            entry['level'] = get_heading_level(style)
+            entry['style'] = style
+            entry['ItemID'] = obj.attributes.get('ItemID')
+            key = (OwnPage,
+                   (obj.get_float('YPOS') or 0.0) - origin_y,
+                   (obj.get_float('XPOS') or 0.0) - origin_x)
+            keyed.append((key, entry))
+        keyed.sort(key=lambda pair: pair[0])
+        return [entry for _, entry in keyed]
+
+    def _find_own_page(self, node):
+        """Get OwnPage, or else find the page under the center of node.
+
+        Some objects (such as from other programs) have no OwnPage, so
+        the page is inferred from the canvas position using page_origins.
+        """
+        OwnPage = node.attributes.get('OwnPage')
+        if OwnPage is not None:
+            return int(OwnPage)
+        XPOS = node.get_float('XPOS')
+        YPOS = node.get_float('YPOS')
+        if XPOS is None or YPOS is None:
+            return None
+        return self.page_origins.find_page(
+            XPOS + (node.get_float('WIDTH') or 0.0) / 2,
+            YPOS + (node.get_float('HEIGHT') or 0.0) / 2,
+        )
+
+    def _get_page(self, number, node, document_node):
+        page = self._pages.get(number)
+        if page is None:
+            page = ScribusPage()
+            page.node = node
+            page.root = self
+            page.document = document_node
+            page.number = number
+            self._pages[number] = page
+        return page
+
+    def _get_master_page(self, name, node, document_node):
+        master = self._master_pages.get(name)
+        if master is None:
+            master = ScribusPage()
+            master.node = node
+            master.root = self
+            master.document = document_node
+            master.number = len(self._master_pages)
+            master.name = name
+            self._master_pages[name] = master
+        return master
+
+    def get_master_page(self, name):
+        """Get a master page by name (NAM, which pages refer to as MNAM).
+
+        Returns:
+            ScribusPage: The cached master page, or None if not present.
+        """
+        if self._master_pages is None:
+            self.collect_pages()
+        return self._master_pages.get(name)
+
+
+def get_paragraph_style(node):
+    """Get the first paragraph style (PARENT of para or trail) of a frame.
+
+    Args:
+        node (SGMLNode): A PAGEOBJECT or other frame with StoryText.
+
+    Returns:
+        str: The style name, or None if the text has no style.
+    """
+    for child in getattr(node, 'children', ()):
+        if getattr(child, 'tagName', None) != "StoryText":
+            continue
+        for sub in child.children:
+            if getattr(sub, 'tagName', None) in ("para", "trail"):
+                style = sub.get("PARENT")
+                if style:
+                    return style
+    return None
+
+
+def is_list_item(node, attribute=LIST_ATTRIBUTE):
+    """Check whether the text of a node starts with a bullet.
+
+    The flag from mark_list_items is used if present, so the text is
+    not checked again.
+    """
+    if (attribute == LIST_ATTRIBUTE) and (node.list_item is not None):
+        return node.list_item
+    return node.startswith(UTF8_BULLET, attribute=attribute)
+
+
+def mark_list_items(node, attribute=LIST_ATTRIBUTE):
+    """Set the list_item flag of a node and everything under it.
+
+    This is done once after parsing (See from_string_scribus) so that
+    dumping does not check the text of each node. If CH of a node is
+    changed after that, call this again.
+
+    Returns:
+        int: The number of list items (nodes starting with a bullet).
+    """
+    count = 0
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        value = node.get_value(attribute=attribute)
+        node.list_item = bool(value) and value.startswith(BULLET)
+        if node.list_item:
+            count += 1
+        children = getattr(node, 'children', None)
+        if children:
+            pending.extend(children)
+    return count
+
+
+def validate_lists(node, attribute=LIST_ATTRIBUTE):
+    """Check the structure of lists in the text of a frame.
+
+    In Scribus format, a list item is a paragraph that starts with a
+    bullet, often in a separate ITEXT before the text of the item. The
+    problems found are:
+    - bullet-mid-paragraph: A bullet is after other text in the same
+      paragraph, so it will not be a list item when dumped.
+    - empty-list-item: A paragraph has only a bullet.
+
+    Args:
+        node (SGMLNode): A frame (or StoryText). Call mark_list_items
+            first if the text was changed after loading.
+
+    Returns:
+        list[OrderedDict]: Problems, each with 'kind' (See above),
+            'index' (of the node in StoryText) and 'text' (of the
+            paragraph so far).
+    """
+    problems = []
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        children = getattr(node, 'children', None)
+        if not children:
+            continue
+        if getattr(node, 'tagName', None) != "StoryText":
+            pending.extend(reversed(children))
+            continue
+        paragraph = []  # text of the current paragraph
+        item_index = None  # where the current list item started
+        for index, child in enumerate(children):
+            tagName = getattr(child, 'tagName', None)
+            if tagName in PARAGRAPH_END_TAGS:
+                if (item_index is not None) \
+                        and not "".join(paragraph).strip(BULLET + " \t"):
+                    problems.append(_list_problem(LIST_EMPTY_ITEM,
+                                                  item_index, paragraph))
+                paragraph = []
+                item_index = None
+                continue
+            value = child.get_value(attribute=attribute)
+            if not value:
+                continue
+            if is_list_item(child, attribute=attribute):
+                if "".join(paragraph).strip():
+                    problems.append(_list_problem(LIST_MID_PARAGRAPH,
+                                                  index, paragraph))
+                elif item_index is None:
+                    item_index = index
+            paragraph.append(value)
+        if (item_index is not None) \
+                and not "".join(paragraph).strip(BULLET + " \t"):
+            problems.append(_list_problem(LIST_EMPTY_ITEM, item_index,
+                                          paragraph))
+    return problems
+
+
+def _list_problem(kind, index, paragraph):
+    problem = OrderedDict()
+    problem['kind'] = kind
+    problem['index'] = index
+    problem['text'] = "".join(paragraph)
+    return problem
+
+
+def get_heading_level(style):
+    """Get the heading level from a style name such as "Name - H2".
+
+    Returns:
+        int: The number after "H" (as a separate word) in the style
+            name, otherwise 1.
+    """
+    if style:
+        match = HEADING_LEVEL_RE.search(style)
+        if match:
+            return int(match.group(1))
+    return 1
+
+
+def get_text(node, attribute="CH"):
+    """Get all text (CH attributes) under a node without formatting."""
+    parts = []
+    value = node.get(attribute)
+    if value:
+        parts.append(value)
+    for child in getattr(node, 'children', ()):
+        parts.append(get_text(child, attribute=attribute))
+    return "".join(parts)
+
+
+def node_from_dict(data):
+    """Create a node from the result of to_dict (the reverse of to_dict).
+
+    Args:
+        data (dict): A dict from to_dict (optionally with 'children').
+
+    Returns:
+        Union[SGMLNode,SGMLText]: A new node without a parent.
+    """
+    chunkdef = OrderedDict()
+    for key, value in data.items():
+        if key != 'children':
+            chunkdef[key] = value
+    if data.get('context') == SGMLLexer.CONTENT:
+        return SGMLText.from_chunkdef(chunkdef)
+    node = SGMLNode.from_chunkdef(chunkdef)
+    for child_data in data.get('children', []):
+        child = node_from_dict(child_data)
+        child.parent = node
+        node.children.append(child)
+    return node
 
 
 def from_string(data):
@@ -1455,17 +2655,23 @@ def from_string(data):
     return root
 
 
-def from_string_scribus(data, skip_blank=True):
+def from_string_scribus(data, skip_blank=True, pages=None):
     """Parse a string.
 
     This should have work-alike inputs & outputs as lxml.etree's
     from_string. Unlike from_string, this returns ScribusDocRoot (a
     subclass which has more features than SGMLElementTree but is
     otherwise identical).
+
+    Args:
+        pages (Optional[set[int]]): Only load objects on these pages
+            (0-based such as from parse_page_ranges). Others are skipped
+            while parsing.
     """
     lexer = SGMLLexer(data, skip_blank=skip_blank)
     root = ScribusDocRoot()
-    root.parse(lexer)
+    root.parse(lexer, own_pages=pages)
+    mark_list_items(root)
     return root
 
 
@@ -1479,27 +2685,74 @@ def parse(stream):
     return from_string(data)
 
 
-def parse_scribus(stream):
+def parse_scribus(stream, pages=None):
     """Parse an open file or stream.
 
     This should have work-alike inputs & outputs as lxml.etree's parse.
     Unlike parse, this returns ScribusDocRoot (a subclass which has more
     features than SGMLElementTree but is otherwise identical).
+
+    Args:
+        pages (Optional[set[int]]): See from_string_scribus.
     """
     data = stream.read()
-    return from_string_scribus(data)
+    return from_string_scribus(data, pages=pages)
+
+
+def parse_page_ranges(text):
+    """Convert page numbers as shown in Scribus to OwnPage numbers.
+
+    Args:
+        text (str): Comma-separated page numbers or inclusive ranges
+            starting at 1, such as "40-55" or "1,3,10-12".
+
+    Returns:
+        set[int]: 0-based page numbers (as in OwnPage attributes).
+    """
+    pages = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if sep else first
+        except ValueError:
+            raise ValueError("Expected a page or range such as 40-55 but got"
+                             " %s" % repr(part))
+        if first < 1 or last < first:
+            raise ValueError("Expected pages counting from 1 such as 40-55"
+                             " but got %s" % repr(part))
+        pages.update(range(first - 1, last))
+    return pages
 
 
 class ScribusProject(object):
     """Manage a scribus file.
     """
     # TODO: Add a get_root() method and get DOCUMENT instead of docroot
-    def __init__(self, path):
+    def __init__(self, path, pages=None, data=None):
+        """Load a Scribus file.
+
+        Args:
+            path (str): The SLA file.
+            pages (Optional[set[int]]): Only load objects on these pages
+                (See from_string_scribus).
+            data (Optional[bytes]): The content of path if the caller
+                already read it (such as to hash it), so it is not read
+                again (gzipped or not, See reload).
+        """
         self._path = path
-        self._original_size = os.path.getsize(self._path)
+        self.pages = pages
+        self.compressed = False  # Set by reload (See is_gzip)
+        if data is not None:
+            self._original_size = len(data)
+        else:
+            self._original_size = os.path.getsize(self._path)
         # self._data = None  # instead use: self.root._lexer._data
         self.root = None  # self._lexer = None  # formerly _sgml
-        self.reload()
+        self.reload(data=data)
 
     def get_path(self):
         return self._path
@@ -1509,161 +2762,96 @@ class ScribusProject(object):
             raise RuntimeError("There is no root. Call parse method first.")
         return self.root.to_dict()
 
-    def reload(self, force=True):
+    def reload(self, force=True, data=None):
         '''Reload from storage.
 
         Keyword arguments:
         force -- Reload even if self._data is already present.
+        data -- The bytes of the file if already read (else read it).
         '''
+        if data is not None:
+            echo1('Parsing "{}"'.format(self._path))
+            self.compressed = data[:len(GZIP_MAGIC)] == GZIP_MAGIC
+            if self.compressed:
+                data = gzip.decompress(data)
+            self.root = from_string_scribus(data.decode("utf-8"),
+                                            pages=self.pages)
+            self.root.image_dir = os.path.dirname(os.path.abspath(self._path))
+            return
         if ((self.root is None) or (self.root._lexer is None)
                 or (self.root._lexer._data is None)) or force:
             echo1('Loading "{}"'.format(self._path))
-            with open(self._path) as stream:
+            self.compressed = is_gzip(self._path)
+            with open_sla(self._path) as stream:
                 # self._data = stream.read()  # instead:self.root._lexer._data
                 # if self._data is not None:
                 # echo0("* lexing...")
                 # self._lexer = SGMLLexer(self._data)#instead:self.root._lexer
                 # echo0("* parsing...")
                 # self.root = parse(self._lexer)  # unsorted
-                self.root = parse_scribus(stream)
+                self.root = parse_scribus(stream, pages=self.pages)
                 # ^ mimic lxml: tree = lxml.etree.parse(in_stream)
+            self.root.image_dir = os.path.dirname(os.path.abspath(self._path))
+            # ^ PFILE paths are relative to the SLA file.
 
-    def save(self):
-        with open(self._path, 'w') as outs:
-            outs.write(self._data)
+    def save(self, path=None, backup=False, compress=None):
+        """Save the project, including changes to attributes.
 
-    def move_images(self, old_dir):
-        '''
-        Move images from the directory that used to contain the SLA
+        The document is streamed (See SGMLElementTree.write) to a
+        temporary file in the same directory, synced to the disk, then
+        renamed over the SLA file, so the SLA file is always either the
+        complete old or the complete new version.
+
+        Args:
+            path (Optional[str]): Where to save. Defaults to the path of
+                the loaded file.
+            backup (bool): Keep the previous version as path + ".bak".
+            compress (Optional[bool]): Save as gzip (.sla.gz). Defaults
+                to True if path ends with ".gz", or if saving to the
+                loaded file and it was compressed.
+
+        Returns:
+            int: The number of tags that were changed.
+        """
+        if self.root is None:
+            raise RuntimeError("There is no root. Call reload method first.")
+        if path is None:
+            path = self._path
+        if compress is None:
+            compress = path.lower().endswith(".gz")
+            if os.path.abspath(path) == os.path.abspath(self._path):
+                compress = compress or self.compressed
+        changed = atomic_write(path, self.root.write, backup=backup,
+                               compress=compress)
+        if os.path.abspath(path) == os.path.abspath(self._path):
+            self._original_size = os.path.getsize(path)
+        echo1('Saved "{}" ({} changed tag(s))'.format(path, changed))
+        return changed
+
+    def move_images(self, old_dir, mode="move", jobs=None, dry_run=False):
+        '''Move images from the directory that used to contain the SLA
         file.
 
-        Sequential arguments:
-        old_dir -- The directory where the SLA file used to reside that
-            has the images cited in the SLA file.
-        '''
-        new_dir = os.path.dirname(os.path.realpath(self._path))
-        if os.path.realpath(old_dir) == new_dir:
-            raise ValueError(
-                'The source and destination directory are the same: "{}".'
-                ''.format(old_dir)
-            )
-        percent_s = None
-        in_size = self._original_size
-        self.reload(force=False)
-        sgml = self._lexer
+        PFILE paths are relative to the SLA file, so they are the same
+        after moving the images and the file is not changed.
 
-        inline_images = []
-        full_paths = []
-        bad_paths = []
+        Args:
+            old_dir (str): The directory where the SLA file used to
+                reside that has the images cited in the SLA file.
+            mode, jobs, dry_run: See bundle.execute_bundle.
 
-        new_data = ""
-        done_mkdir_paths = []
-        for chunkdef in self._lexer:
-            ratio = float(chunkdef['start']) / float(in_size)
-            if percent_s is not None:
-                sys.stderr.write("\b" * len(percent_s))
-                percent_s = None
-            percent_s = str(int(ratio * 100)) + "%"
-            sys.stderr.write(percent_s)
-            sys.stderr.flush()
-            chunk = sgml.chunk_from_chunkdef(chunkdef)
-            attributes = None
-            if chunkdef['context'] == SGMLLexer.START:
-                attributes = chunkdef['attributes']
-            sub = None
-            tagName = chunkdef.get('tagName')
-            if tagName is not None:
-                if get_verbosity() >= 2:
-                    if percent_s is not None:
-                        sys.stderr.write("\b" * len(percent_s))
-                        percent_s = None
-                echo4("tagName=`{}` attributes=`{}`"
-                      "".format(tagName, attributes))
-                if attributes is not None:
-                    # Only opening tags have attributes,
-                    #   not closing tags such as </p>.
-                    sub = attributes.get('PFILE')
-            else:
-                if get_verbosity() >= 2:
-                    if percent_s is not None:
-                        sys.stderr.write("\b" * len(percent_s))
-                        percent_s = None
-                echo4("value=`{}`".format(chunk))
-            isInlineImage = False
-            if ((attributes is not None)
-                    and (attributes.get('isInlineImage') == "1")):
-                isInlineImage = True
-                # An inline image...
-                # Adds:
-                # - ImageData (has base64-encoded data)
-                # - inlineImageExt="png"
-                # - isInlineImage="1"
-                # - ANNAME=" image843"
-                # Changes:
-                # - PFILE=""
-                # - FRTYPE="3"  instead of "0" (always?)
-                # - CLIPEDIT="1" instead of "0" (always?)
-                inline_stats = {
-                    'OwnPage': int(attributes.get('OwnPage')) + 1,
-                    'inlineImageExt': attributes.get('inlineImageExt'),
-                    'FRTYPE': attributes.get('FRTYPE'),
-                    'CLIPEDIT': attributes.get('CLIPEDIT'),
-                    # also has ImageData but that is large (base64).
-                }
-                inline_images.append(inline_stats)
-                # ^ pages start at 0 here, but not in GUI.
-                sub = None
-            if sub is not None:
-                if percent_s is not None:
-                    sys.stderr.write("\b" * len(percent_s))
-                    percent_s = None
-
-                sub_path = os.path.join(old_dir, sub)
-                is_full_path = False
-                if os.path.realpath(sub) == sub:
-                    sub_path = sub
-                    full_paths.append(sub)
-                    is_full_path = True
-
-                write0('* checking `{}`...'.format(sub_path))
-                if isInlineImage:
-                    pass
-                elif os.path.isfile(sub_path):
-                    echo0("OK")
-                    new_path = os.path.join(new_dir, sub)
-                    dst_parent = os.path.dirname(new_path)
-                    if not os.path.isdir(dst_parent):
-                        if dst_parent not in done_mkdir_paths:
-                            print('mkdir "{}"'.format(dst_parent))
-                            done_mkdir_paths.append(dst_parent)
-                            os.makedirs(dst_parent)
-                    print('mv "{}" "{}"'.format(sub_path, new_path))
-                    shutil.move(sub_path, new_path)
-                else:
-                    echo0("NOT FOUND")
-                    bad_paths.append(sub)
-                # Update chunk using the modified property:
-                chunk = self._lexer.chunk_from_chunkdef(chunkdef)
-            new_data += chunk
-            # sys.stdout.write(chunk)
-            # sys.stdout.flush()
-        if percent_s is not None:
-            sys.stderr.write("\b" * len(percent_s))
-            percent_s = None
-        echo0("100%")
-        echo1()
-        if len(bad_paths) > 0:
-            echo1("bad_paths:")
-            for bad_path in bad_paths:
-                echo1('- "{}"'.format(bad_path))
-        if len(full_paths) > 0:
-            echo1("full_paths:")
-            for full_path in full_paths:
-                echo1('- "{}"'.format(full_path))
-        if len(inline_images) > 0:
-            echo1("inline_images (+1 for GUI numbering):")
-            for partial_attributes in inline_images:
-                echo1('- "{}"'.format(partial_attributes))
+        Returns:
+            list[OrderedDict]: See bundle.execute_bundle.
+        '''
+        from booktacular.morescribus.bundle import (
+            execute_bundle,
+            plan_bundle,
+        )
+        # ^ bundle imports this module, so import it only when used.
+        self.reload(force=False)
+        plan = plan_bundle(self._path, old_dir, data=self.root._lexer._data,
+                           file_cache=self.root.get_file_cache(refresh=True))
+        return execute_bundle(plan, mode=mode, jobs=jobs, dry_run=dry_run)
 
     def unordered_unparsed_dump_text(self, stream):
         '''Dump text (in XML order--for spatial order see SGMLElementTree)
@@ -1691,6 +2879,128 @@ class ScribusProject(object):
             stream.write(CH + "\n")
 
 
+def is_sla_path(path):
+    return path.lower().endswith(SLA_EXTENSIONS)
+
+
+def sibling_path(path, suffix):
+    """Get a path beside an SLA file with suffix instead of .sla[.gz]."""
+    for extension in SLA_EXTENSIONS[::-1]:
+        if path.lower().endswith(extension):
+            return path[:-len(extension)] + suffix
+    return os.path.splitext(path)[0] + suffix
+
+
+def is_gzip(path):
+    """Check whether a file is compressed (such as .sla.gz) by content."""
+    with open(path, 'rb') as stream:
+        return stream.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def open_sla(path):
+    """Open an SLA file for reading text, decompressing it if gzipped.
+
+    A gzipped file is decompressed in chunks as the stream is read, so
+    the whole compressed file is not loaded first. Lexing is not
+    streamed though: SGMLLexer needs the whole document as one string,
+    so ScribusProject (and other callers that lex) read all of the
+    decompressed text before parsing. Only saving (See atomic_write)
+    streams through gzip.
+
+    Returns:
+        A text stream (UTF-8 without newline translation, so that saving
+        keeps the same line endings).
+    """
+    if is_gzip(path):
+        return gzip.open(path, 'rt', encoding="utf-8", newline="")
+    return io.open(path, 'r', encoding="utf-8", newline="")
+
+
+def atomic_write(path, write, backup=False, compress=False):
+    """Replace a file with a complete new version.
+
+    The new version is written to a temporary file in the same
+    directory, synced to the disk, then renamed over path, so path is
+    always either the complete old or the complete new version.
+
+    Args:
+        path (str): The file to create or replace.
+        write (Callable): A function that accepts an open text stream
+            (UTF-8, no newline translation) and writes the new version.
+        backup (bool): Keep the previous version as path + ".bak".
+        compress (bool): Compress the file with gzip while writing.
+
+    Returns:
+        Any: The return of write.
+    """
+    dst_dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix="." + os.path.basename(path) + ".",
+        suffix=".tmp",
+        dir=dst_dir,
+    )
+    try:
+        with io.open(fd, 'wb') as raw:
+            stream = raw
+            if compress:
+                name = os.path.basename(path)
+                if name.lower().endswith(".gz"):
+                    name = name[:-3]
+                stream = gzip.GzipFile(filename=name, mode='wb',
+                                       fileobj=raw)
+            outs = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+            result = write(outs)
+            outs.flush()
+            outs.detach()  # Do not close raw before fsync.
+            if compress:
+                stream.close()  # Write the end of the gzip data.
+            raw.flush()
+            os.fsync(raw.fileno())
+        if os.path.isfile(path):
+            shutil.copymode(path, tmp_path)
+            if backup:
+                _make_backup(path, path + ".bak")
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+            # ^ mkstemp only allows the owner to read the file.
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(dst_dir)
+    return result
+
+
+def _make_backup(path, backup_path):
+    """Make backup_path the current version of path before replacing it.
+
+    A hard link is used where possible, since path is replaced (not
+    overwritten) by ScribusProject.save.
+    """
+    if os.path.lexists(backup_path):
+        os.remove(backup_path)
+    try:
+        os.link(path, backup_path)
+    except (OSError, AttributeError):
+        shutil.copy2(path, backup_path)
+
+
+def _fsync_dir(path):
+    """Sync a directory so a rename in it is on the disk (POSIX only)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # Not supported by some filesystems.
+    finally:
+        os.close(fd)
+
+
 def main():
     echo0("You should import this module instead.")
     return 1
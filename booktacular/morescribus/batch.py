@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.batch
+-----------------------------
+
+Run one operation on many SLA (Scribus Project) files at once in a pool
+of processes, so each file does not need a separate sla-dump etc.
+command. A file that fails is reported and the rest of the batch keeps
+going.
+
+Operations:
+dump    Write the text of each file to Markdown beside it (See sla-dump).
+lint    Check the layout of each file (See sla-lint).
+toc     Write the table of contents of each file beside it as
+        <name>.toc.md (See sla-toc).
+bundle  Move images cited by each file from --old-dir (See sla-bundle).
+        Every file is planned first, then each image is transferred
+        once, so books citing the same image do not take it from each
+        other (an image going to several directories is copied to all
+        but the last).
+
+Usage:
+# If you install booktacular you can do:
+sla-batch <operation> <file, directory or glob>... [options]
+
+Options:
+-j, --jobs N      Process N files at a time (default: one per CPU).
+--old-dir DIR     The directory for the bundle operation.
+--mode MODE       How bundle transfers images (default: move; See
+                  sla-bundle).
+--format FORMAT   Report as text (default) or json.
+
+Directories are searched recursively for .sla and .sla.gz files. The
+exit code is 1 if any file failed.
+'''
+from __future__ import print_function
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    ScribusProject,
+    is_sla_path,
+    sibling_path,
+)
+from booktacular.morescribus.bundle import (
+    MOVE,
+    READY,
+    TRANSFER_MODES,
+    execute_transfers,
+    merge_plans,
+    plan_bundle,
+    report_plan,
+    update_manifest,
+)
+from booktacular.morescribus.dumper import dump_sla_text
+from booktacular.morescribus.lint import lint_sla
+from booktacular.morescribus.manifest import AssetManifest
+from booktacular.morescribus.toc import write_toc
+
+
+def find_sla_files(patterns):
+    """Get SLA files from files, directories and glob patterns.
+
+    Args:
+        patterns (Iterable[str]): Each is a file, a directory (searched
+            recursively for SLA_EXTENSIONS) or a glob pattern (where
+            "**" matches any number of directories).
+
+    Returns:
+        list[str]: Paths in the order found, without duplicates.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for sub_root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    if is_sla_path(name):
+                        paths.append(os.path.join(sub_root, name))
+        elif os.path.isfile(pattern):
+            paths.append(pattern)
+        else:
+            paths.extend(sorted(glob.glob(pattern, recursive=True)))
+    results = []
+    done = set()
+    for path in paths:
+        key = os.path.realpath(path)
+        if key in done:
+            continue
+        done.add(key)
+        results.append(path)
+    return results
+
+
+def _dump(path, options):
+    dst_path = sibling_path(path, ".md")
+    dump_sla_text(path, dst_path,
+                  include_master=options.get('include_master', False))
+    return dst_path
+
+
+def _lint(path, options):
+    return len(lint_sla(path, ignore=options.get('ignore')))
+
+
+def _toc(path, options):
+    entries = ScribusProject(path).root.get_toc()
+    dst_path = sibling_path(path, ".toc.md")
+    with io.open(dst_path, 'w', encoding="utf-8") as stream:
+        write_toc(entries, stream)
+    return dst_path
+
+
+def _bundle(path, options):
+    # Only plan here. Workers moving images at the same time could take
+    # an image cited by several files from each other (See
+    # _finish_bundle).
+    old_dir = options.get('old_dir')
+    if not old_dir:
+        raise ValueError("The bundle operation requires old_dir.")
+    if not os.path.isdir(old_dir):
+        raise ValueError('OLD_DIR "{}" does not exist.'.format(old_dir))
+    references = None
+    if options.get('manifest', True):
+        references = AssetManifest(path).get_references()
+    plan = plan_bundle(path, old_dir, references=references)
+    report_plan(plan)
+    return plan
+
+
+def _transfer_key(action):
+    return (os.path.realpath(action['src']), os.path.realpath(action['dst']))
+
+
+def _finish_bundle(results, options):
+    """Transfer the images of every planned file at once.
+
+    Each image is transferred once even if several files cite it (See
+    merge_plans). Each result becomes the number of images transferred
+    for its file, or fails if any of them failed.
+    """
+    plans = [result['result'] for result in results if result['ok']]
+    start = time.perf_counter()
+    transferred = execute_transfers(
+        merge_plans(plans, mode=options.get('mode') or MOVE),
+    )
+    seconds = time.perf_counter() - start
+    errors = {}
+    for item in transferred:
+        if not item['ok']:
+            errors[_transfer_key(item)] = item['error']
+    for result in results:
+        if not result['ok']:
+            continue
+        plan = result['result']
+        ready = plan.get_actions(READY)
+        failed = [errors[_transfer_key(action)] for action in ready
+                  if _transfer_key(action) in errors]
+        result['result'] = len(ready)
+        result['seconds'] = round(result['seconds'] + seconds, 3)
+        if failed:
+            result['ok'] = False
+            result['error'] = "{} image(s) failed: {}".format(len(failed),
+                                                              failed[0])
+        elif options.get('manifest', True):
+            update_manifest(result['path'], plan,
+                            AssetManifest(result['path']))
+
+
+OPERATIONS = OrderedDict([
+    ("dump", _dump),
+    ("lint", _lint),
+    ("toc", _toc),
+    ("bundle", _bundle),
+])
+
+# Operations that need every result before the files are changed, and
+# the function that then finishes them all in this process.
+FINISHERS = {
+    "bundle": _finish_bundle,
+}
+
+
+def run_job(operation, path, options=None):
+    """Run one operation on one file and time it.
+
+    This runs in a worker process (See run_batch), so an exception is
+    returned in the result instead of being raised.
+
+    Returns:
+        OrderedDict: 'path', 'operation', 'ok' (bool), 'seconds',
+            'result' (from the operation, such as the file written or
+            the number of lint issues) and 'error' (None if ok).
+    """
+    result = OrderedDict()
+    result['path'] = path
+    result['operation'] = operation
+    result['ok'] = False
+    result['seconds'] = 0.0
+    result['result'] = None
+    result['error'] = None
+    start = time.perf_counter()
+    try:
+        result['result'] = OPERATIONS[operation](path, options or {})
+        result['ok'] = True
+    except Exception as ex:
+        result['error'] = "{}: {}".format(type(ex).__name__, ex)
+        echo1(traceback.format_exc())
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(paths, operation, jobs=None, options=None, callback=None):
+    """Run an operation on many files in a pool of processes.
+
+    Args:
+        paths (list[str]): SLA files (See find_sla_files).
+        operation (str): A key in OPERATIONS.
+        jobs (Optional[int]): Number of processes. Defaults to one per
+            CPU. If 1, files are processed in this process.
+        options (Optional[dict]): Options for the operation, such as
+            'old_dir' and 'mode' for bundle.
+        callback (Optional[Callable]): Called with each result as soon as
+            its file is done (in the order finished), or for operations
+            in FINISHERS, with each result after all are finished (in
+            the order of paths).
+
+    Returns:
+        list[OrderedDict]: The result of each file (See run_job) in the
+            order of paths.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("operation={} (expected one of {})"
+                         "".format(repr(operation), list(OPERATIONS)))
+    if not jobs:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(paths)) or 1
+    finish = FINISHERS.get(operation)
+    on_done = callback if finish is None else None
+    results = [None] * len(paths)
+    if jobs == 1:
+        for index, path in enumerate(paths):
+            results[index] = run_job(operation, path, options)
+            if on_done is not None:
+                on_done(results[index])
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            for index, path in enumerate(paths):
+                future = executor.submit(run_job, operation, path, options)
+                futures[future] = index
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                if on_done is not None:
+                    on_done(results[index])
+    if finish is not None:
+        finish(results, options or {})
+        if callback is not None:
+            for result in results:
+                callback(result)
+    return results
+
+
+def format_result(result):
+    """Get a single line describing a result for people to read."""
+    if result['ok']:
+        return "OK {:.3f}s {} ({})".format(result['seconds'],
+                                           result['path'], result['result'])
+    return "FAILED {:.3f}s {}: {}".format(result['seconds'], result['path'],
+                                          result['error'])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run an operation on many SLA files in parallel.",
+    )
+    parser.add_argument("operation", choices=list(OPERATIONS))
+    parser.add_argument("paths", nargs="+",
+                        help="SLA files, directories or glob patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Process this many files at a time (default:"
+                        " one per CPU).")
+    parser.add_argument("--old-dir", default=None, dest="old_dir",
+                        help="The directory for the bundle operation.")
+    parser.add_argument("--mode", choices=TRANSFER_MODES, default=MOVE,
+                        help="How the bundle operation transfers images"
+                        " (default: move). Every file is planned before"
+                        " any image is transferred.")
+    parser.add_argument("--format", choices=["text", "json"],
+                        default="text", dest="output_format",
+                        help="Report format.")
+    args = parser.parse_args()
+    paths = find_sla_files(args.paths)
+    if not paths:
+        echo0("Error: No SLA files were found in {}.".format(args.paths))
+        return 2
+    options = {'old_dir': args.old_dir, 'mode': args.mode}
+
+    def report(result):
+        if args.output_format == "text":
+            print(format_result(result))
+            sys.stdout.flush()
+
+    start = time.perf_counter()
+    results = run_batch(paths, args.operation, jobs=args.jobs,
+                        options=options, callback=report)
+    failed = [result for result in results if not result['ok']]
+    if args.output_format == "json":
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    echo0("{} file(s), {} failed, {:.3f}s"
+          "".format(len(results), len(failed),
+                    time.perf_counter() - start))
+    if failed:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
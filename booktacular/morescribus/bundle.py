@@ -8,15 +8,41 @@ This script moves images that the SLA file cites from a different
 directory where it has no missing image errors to the current directory,
 to fix current missing image errors.
 
+The SLA file is lexed once to plan the whole operation (See plan_bundle)
+using one directory listing of each directory (See DirectoryIndex)
+instead of checking each image. Then the files are moved or copied in a
+pool of threads (See execute_bundle).
+
+A manifest of the images and their content hashes is kept beside the
+SLA file (See booktacular.morescribus.manifest), so running it again
+only hashes new or changed images and does not lex an unchanged SLA
+file. Images with the same content under different names are reported.
+
 Usage:
-pull_images <SLA file> <old directory>
+# If you install booktacular you can do:
+sla-bundle <SLA file> <old directory> [options]
 
+Options:
+--mode MODE      move (default), copy, hardlink, reflink (a copy-on-write
+                 clone) or symlink (See booktacular.morescribus.transfer).
+                 A mode that is not possible falls back to a copy.
+--copy           Same as --mode copy.
+-j, --jobs N     Move or copy N files at a time (default: BUNDLE_JOBS).
+-n, --dry-run    Only show what would be done.
+--no-manifest    Do not read or write <name>.assets.json.
+--dedupe         Change PFILE of duplicate images to the first copy (the
+                 previous SLA file is kept as .bak).
 '''
 from __future__ import print_function
 from __future__ import division
+import argparse
+import html
 import sys
 import os
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 if __name__ == "__main__":
     sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
@@ -38,22 +64,57 @@ from hierosoft import (  # noqa: F401
 # )
 
 from booktacular.morescribus import (
-    ScribusProject,
+    SGMLLexer,
+    no_progress,
+    open_sla,
+)
+from booktacular.morescribus.fileindex import (
+    DirectoryIndex,
+    FileStatCache,
+    normalize_relpath,
+)
+from booktacular.morescribus.manifest import (
+    AssetManifest,
+)
+from booktacular.morescribus.rewrite import (
+    rename_rule,
+    rewrite_sla,
+)
+from booktacular.morescribus.transfer import (  # noqa: F401
+    COPY,
+    HARDLINK,
+    MOVE,
+    REFLINK,
+    SYMLINK,
+    TRANSFER_MODES,
+    transfer,
 )
 
 makedir_logged_lines = set()
 
 
-def move_safe(src, dst):
+def move_safe(src, dst, mode=MOVE, dry_run=False):
+    """Move (or otherwise transfer) a file, making its directory.
+
+    Args:
+        mode (str): See transfer.
+        dry_run (bool): Only show the commands.
+
+    Returns:
+        str: The mode used (See transfer).
+    """
     parent_dir = os.path.dirname(dst)
-    if not os.path.isdir(parent_dir):
+    if parent_dir and not os.path.isdir(parent_dir):
         msg = 'mkdir -p "{}"'.format(parent_dir)
         if msg not in makedir_logged_lines:
             makedir_logged_lines.add(msg)
             print(msg)
-        # os.makedirs(parent_dir)
-    print('mv "{}" "{}"'.format(src, dst))
-    # shutil.move(src, dst)
+        if not dry_run:
+            os.makedirs(parent_dir, exist_ok=True)
+    print('{} "{}" "{}"'.format(COMMANDS[mode], src, dst))
+    if dry_run:
+        return mode
+    return transfer(src, dst, mode=mode)
 
 
 '''
@@ -74,12 +135,391 @@ def pull_images(options):
 
 ERROR_MISSING_ARG = 1
 ERROR_BAD_PATH = 2
+ERROR_TRANSFER = 3
+
+# Shell commands equivalent to each mode (for showing a dry run).
+COMMANDS = {
+    MOVE: "mv",
+    COPY: "cp",
+    HARDLINK: "ln",
+    REFLINK: "cp --reflink=auto",
+    SYMLINK: "ln -s",
+}
+
+BUNDLE_JOBS = 8  # Threads, since moving and copying mostly wait for disks.
+
+# The status of each image in a plan:
+READY = "ready"  # in old_dir, so it will be moved or copied.
+MISSING = "missing"  # in neither directory.
+DONE = "done"  # already in the directory of the SLA file.
+FULL_PATH = "full-path"  # not relative, so it is not bundled.
+
+
+def collect_image_references(data):
+    """Get the images cited by an SLA file in one pass of the lexer.
+
+    Args:
+        data (str): The content of an SLA file.
+
+    Returns:
+        tuple(OrderedDict, list): PFILE values each with a list of the
+            pages that cite it (counting from 1, or None for no
+            OwnPage), and inline images (stored in the SLA file, so
+            there is nothing to move) each with 'page',
+            'inlineImageExt' and 'ItemID'.
+    """
+    references = OrderedDict()
+    inline_images = []
+    lexer = SGMLLexer(data)
+    while True:
+        try:
+            chunkdef = lexer.next(cb_progress=no_progress)
+        except StopIteration:
+            break
+        if chunkdef['context'] != SGMLLexer.START:
+            continue
+        attributes = chunkdef['attributes']
+        page = None
+        if attributes.get('OwnPage') is not None:
+            page = int(attributes['OwnPage']) + 1
+            # ^ pages start at 0 here, but not in GUI.
+        if attributes.get('isInlineImage') == "1":
+            inline = OrderedDict()
+            inline['page'] = page
+            inline['inlineImageExt'] = attributes.get('inlineImageExt')
+            inline['ItemID'] = attributes.get('ItemID')
+            inline_images.append(inline)
+            continue
+        pfile = attributes.get('PFILE')
+        if pfile:
+            references.setdefault(pfile, []).append(page)
+    return references, inline_images
+
+
+def _has_file(index, rel_path, file_cache):
+    if rel_path.startswith("../"):
+        return file_cache.isfile(index.abspath(rel_path))  # not indexed
+    return rel_path in index
+
+
+class BundlePlan(object):
+    """What bundling an SLA file will do (See plan_bundle).
+
+    Attributes:
+        old_dir (str): Where the images are now.
+        new_dir (str): The directory of the SLA file.
+        references (OrderedDict): See collect_image_references.
+        actions (list[OrderedDict]): For each cited image: 'pfile',
+            'pages' (See collect_image_references), 'status' (READY,
+            MISSING, DONE or FULL_PATH), 'src' and 'dst'.
+        inline_images (list[OrderedDict]): See collect_image_references.
+    """
+    def __init__(self, old_dir, new_dir):
+        self.old_dir = old_dir
+        self.new_dir = new_dir
+        self.references = OrderedDict()
+        self.actions = []
+        self.inline_images = []
+
+    def get_actions(self, status):
+        return [action for action in self.actions
+                if action['status'] == status]
+
+
+def plan_bundle(sla_path, old_dir, data=None, references=None,
+                file_cache=None):
+    """Find out which images cited by an SLA file can be moved.
+
+    Args:
+        sla_path (str): The SLA file (in the new directory).
+        old_dir (str): The directory where the SLA file used to reside
+            that has the images cited in the SLA file.
+        data (Optional[str]): The content of the SLA file if already
+            loaded (such as by ScribusProject).
+        references (Optional[tuple]): The result of
+            collect_image_references if known (such as from
+            AssetManifest.get_references), so the file is not lexed.
+        file_cache (Optional[FileStatCache]): Where to look up images
+            outside of the indexed directories (such as "../" paths).
+
+    Returns:
+        BundlePlan: The plan for execute_bundle.
+    """
+    new_dir = os.path.dirname(os.path.realpath(sla_path))
+    if os.path.realpath(old_dir) == new_dir:
+        raise ValueError(
+            'The source and destination directory are the same: "{}".'
+            ''.format(old_dir)
+        )
+    if references is not None:
+        references, inline_images = references
+    else:
+        if data is None:
+            with open_sla(sla_path) as stream:
+                data = stream.read()
+        references, inline_images = collect_image_references(data)
+        del data
+    if file_cache is None:
+        file_cache = FileStatCache(new_dir)
+    old_index = DirectoryIndex(old_dir)
+    new_index = DirectoryIndex(new_dir)
+    echo1('Indexed {} file(s) in "{}" and {} in "{}"'
+          ''.format(len(old_index), old_dir, len(new_index), new_dir))
+    plan = BundlePlan(old_dir, new_dir)
+    plan.references = references
+    plan.inline_images = inline_images
+    for pfile, pages in references.items():
+        action = OrderedDict()
+        action['pfile'] = pfile
+        action['pages'] = pages
+        action['status'] = None
+        action['src'] = None
+        action['dst'] = None
+        rel_path = normalize_relpath(pfile)
+        if os.path.isabs(pfile) or os.path.isabs(rel_path):
+            action['status'] = FULL_PATH
+            action['src'] = pfile
+        else:
+            action['src'] = old_index.abspath(rel_path)
+            action['dst'] = new_index.abspath(rel_path)
+            if _has_file(old_index, rel_path, file_cache):
+                action['status'] = READY
+            elif _has_file(new_index, rel_path, file_cache):
+                action['status'] = DONE
+            else:
+                action['status'] = MISSING
+        plan.actions.append(action)
+    return plan
+
+
+def _new_transfer(action, mode, wave=0):
+    item = OrderedDict()
+    item['pfile'] = action['pfile']
+    item['src'] = action['src']
+    item['dst'] = action['dst']
+    item['mode'] = mode
+    item['wave'] = wave
+    return item
+
+
+def _transfer(item):
+    result = OrderedDict()
+    result['pfile'] = item['pfile']
+    result['src'] = item['src']
+    result['dst'] = item['dst']
+    result['ok'] = False
+    result['mode'] = item['mode']
+    result['error'] = None
+    try:
+        result['mode'] = transfer(item['src'], item['dst'],
+                                  mode=item['mode'])
+        result['ok'] = True
+    except OSError as ex:  # including shutil.Error
+        result['error'] = "{}: {}".format(type(ex).__name__, ex)
+    return result
+
+
+def merge_plans(plans, mode=MOVE):
+    """Combine the READY images of several plans so each is done once.
+
+    Several SLA files (such as books sharing an old directory) may cite
+    the same image. An image going to the same place for several plans
+    is transferred once. If mode is MOVE and an image goes to several
+    directories, it is copied to all but the last in wave 0, then moved
+    to the last in wave 1, so no plan finds its image moved away.
+
+    Args:
+        plans (Iterable[BundlePlan]): From plan_bundle, all made before
+            any image is transferred.
+        mode (str): One of TRANSFER_MODES (See transfer).
+
+    Returns:
+        list[OrderedDict]: Transfers for execute_transfers, each with
+            'pfile', 'src', 'dst', 'mode' and 'wave'.
+    """
+    by_src = OrderedDict()
+    for plan in plans:
+        for action in plan.get_actions(READY):
+            destinations = by_src.setdefault(
+                os.path.realpath(action['src']), OrderedDict())
+            destinations.setdefault(os.path.realpath(action['dst']), action)
+    transfers = []
+    for destinations in by_src.values():
+        actions = list(destinations.values())
+        for index, action in enumerate(actions):
+            if mode != MOVE or len(actions) == 1:
+                transfers.append(_new_transfer(action, mode))
+            elif index < len(actions) - 1:
+                transfers.append(_new_transfer(action, COPY))
+            else:
+                transfers.append(_new_transfer(action, MOVE, wave=1))
+    return transfers
+
+
+def execute_transfers(transfers, jobs=None, dry_run=False):
+    """Transfer files in a pool of threads, one wave after another.
+
+    A file that fails is reported in its result and the rest continue.
+
+    Args:
+        transfers (list[OrderedDict]): Each with 'pfile', 'src', 'dst',
+            'mode' (one of TRANSFER_MODES) and 'wave' (See merge_plans).
+        jobs (Optional[int]): Number of threads (default: BUNDLE_JOBS).
+        dry_run (bool): Only show the commands that would be run.
+
+    Returns:
+        list[OrderedDict]: 'pfile', 'src', 'dst', 'ok', 'mode' (the mode
+            used, which may be a fallback) and 'error' (None if ok) for
+            each transfer, in the same order.
+    """
+    for item in transfers:
+        if item['mode'] not in TRANSFER_MODES:
+            raise ValueError("mode={} (expected one of {})"
+                             "".format(repr(item['mode']), TRANSFER_MODES))
+    parents = sorted(set(os.path.dirname(item['dst'])
+                         for item in transfers))
+    for parent in parents:
+        if not os.path.isdir(parent):
+            if dry_run:
+                print('mkdir -p "{}"'.format(parent))
+            else:
+                echo1('mkdir -p "{}"'.format(parent))
+                os.makedirs(parent, exist_ok=True)
+    if dry_run:
+        results = []
+        for item in transfers:
+            print('{} "{}" "{}"'.format(COMMANDS[item['mode']],
+                                        item['src'], item['dst']))
+            result = OrderedDict()
+            result['pfile'] = item['pfile']
+            result['src'] = item['src']
+            result['dst'] = item['dst']
+            result['ok'] = True
+            result['mode'] = item['mode']
+            result['error'] = None
+            results.append(result)
+        return results
+    results = [None] * len(transfers)
+    waves = sorted(set(item['wave'] for item in transfers))
+    with ThreadPoolExecutor(max_workers=jobs or BUNDLE_JOBS) as executor:
+        for wave in waves:
+            indices = [index for index, item in enumerate(transfers)
+                       if item['wave'] == wave]
+            for index, result in zip(indices, executor.map(
+                    lambda index: _transfer(transfers[index]), indices)):
+                results[index] = result
+    for item, result in zip(transfers, results):
+        if result['ok']:
+            if result['mode'] != item['mode']:
+                echo1("{} was not possible, so used {}"
+                      "".format(item['mode'], result['mode']))
+            echo1('{} "{}" "{}"'.format(COMMANDS[result['mode']],
+                                        result['src'], result['dst']))
+        else:
+            echo0('Error: {} "{}" failed: {}'.format(COMMANDS[item['mode']],
+                                                     result['src'],
+                                                     result['error']))
+    return results
+
+
+def execute_bundle(plan, mode=MOVE, jobs=None, dry_run=False):
+    """Transfer the READY images of a plan in a pool of threads.
+
+    A file that fails is reported in its result and the rest continue.
+
+    Args:
+        plan (BundlePlan): From plan_bundle.
+        mode (str): One of TRANSFER_MODES (See transfer).
+        jobs (Optional[int]): Number of threads (default: BUNDLE_JOBS).
+        dry_run (bool): Only show the commands that would be run.
+
+    Returns:
+        list[OrderedDict]: See execute_transfers, for each READY image
+            in the order of plan.actions.
+    """
+    if mode not in TRANSFER_MODES:
+        raise ValueError("mode={} (expected one of {})"
+                         "".format(repr(mode), TRANSFER_MODES))
+    return execute_transfers(
+        [_new_transfer(action, mode) for action in plan.get_actions(READY)],
+        jobs=jobs,
+        dry_run=dry_run,
+    )
+
+
+def report_plan(plan):
+    """Show images that will not be bundled (missing etc.)."""
+    missing = plan.get_actions(MISSING)
+    if missing:
+        echo0("missing (not in either directory):")
+        for action in missing:
+            echo0('- "{}" (pages {})'.format(action['pfile'],
+                                             action['pages']))
+    full_paths = plan.get_actions(FULL_PATH)
+    if full_paths:
+        echo1("full_paths:")
+        for action in full_paths:
+            echo1('- "{}"'.format(action['pfile']))
+    if plan.inline_images:
+        echo1("inline_images:")
+        for inline in plan.inline_images:
+            echo1('- {}'.format(dict(inline)))
+
+
+def update_manifest(dst_file, plan, asset_manifest, dedupe=False,
+                    jobs=None):
+    """Record the bundled images and report (or fix) duplicates.
+
+    Args:
+        dst_file (str): The SLA file.
+        plan (BundlePlan): The plan after execute_bundle.
+        asset_manifest (AssetManifest): The manifest of dst_file.
+        dedupe (bool): Change the PFILE of each duplicate image to the
+            first image with the same content (using rewrite_sla).
+        jobs (Optional[int]): Threads for hashing.
+
+    Returns:
+        OrderedDict: See AssetManifest.find_duplicates.
+    """
+    asset_manifest.set_references(plan.references, plan.inline_images)
+    rel_paths = [normalize_relpath(action['pfile'])
+                 for action in plan.actions
+                 if action['status'] in (READY, DONE)]
+    asset_manifest.update(rel_paths, jobs=jobs)
+    echo1("Hashed {} new or changed image(s)".format(asset_manifest.hashed))
+    duplicates = asset_manifest.find_duplicates(rel_paths)
+    for paths in duplicates.values():
+        echo0('duplicates of "{}": {}'.format(paths[0], paths[1:]))
+    if dedupe and duplicates:
+        canonical = {}
+        for paths in duplicates.values():
+            for rel_path in paths[1:]:
+                canonical[rel_path] = paths[0]
+        rules = []
+        merged = OrderedDict()
+        for pfile, pages in plan.references.items():
+            new_pfile = canonical.get(normalize_relpath(pfile))
+            if new_pfile is not None:
+                rules.append(rename_rule("PFILE", html.unescape(pfile),
+                                         html.unescape(new_pfile)))
+                # ^ References are as in the file, but rules get and
+                #   return unescaped values (See RewriteRule).
+            else:
+                new_pfile = pfile
+            merged.setdefault(new_pfile, []).extend(pages)
+        rewrite_sla(dst_file, rules, backup=True)
+        echo0("Changed {} duplicate PFILE(s)".format(len(rules)))
+        plan.references = merged
+        asset_manifest.set_references(merged, plan.inline_images)
+    asset_manifest.save()
+    return duplicates
 
 
-def pull_images(dst_file, old_dir):
+def pull_images(dst_file, old_dir, mode=MOVE, jobs=None, dry_run=False,
+                manifest=True, dedupe=False):
     # EXAMPLE_OUT_FILE = os.path.splitext(dst_file)[0] + ".example-output.sla"
     if not os.path.isfile(dst_file):
-        echo0('Error: "{}" does not exist.')
+        echo0('Error: "{}" does not exist.'.format(dst_file))
         return ERROR_BAD_PATH
     # set_verbosity(1)
     # echo0('The module will run in the example with verbosity={}.'
@@ -98,10 +538,36 @@ def pull_images(dst_file, old_dir):
         echo0('Looking for missing files to move from "{}" for "{}"'
               ''.format(old_dir, os.path.split(dst_file)[1]))
 
-    project = ScribusProject(dst_file)
-    project.move_images(old_dir)
-    # project.save()
-    # echo0('Done writing "{}"'.format(project.get_path()))
+    asset_manifest = None
+    references = None
+    if manifest:
+        asset_manifest = AssetManifest(dst_file)
+        references = asset_manifest.get_references()
+        if references is not None:
+            echo1('"{}" did not change, so the images it cites are from'
+                  ' "{}"'.format(dst_file, asset_manifest.path))
+    plan = plan_bundle(dst_file, old_dir, references=references)
+    report_plan(plan)
+    results = execute_bundle(plan, mode=mode, jobs=jobs, dry_run=dry_run)
+    if (asset_manifest is not None) and not dry_run:
+        update_manifest(dst_file, plan, asset_manifest, dedupe=dedupe,
+                        jobs=jobs)
+    failed = [result for result in results if not result['ok']]
+    done_s = {
+        MOVE: "Moved",
+        COPY: "Copied",
+        HARDLINK: "Hard linked",
+        REFLINK: "Cloned",
+        SYMLINK: "Symlinked",
+    }[mode]
+    if dry_run:
+        done_s = "Would " + mode
+    echo0("{} {} image(s), {} failed, {} missing, {} already done"
+          "".format(done_s, len(results) - len(failed), len(failed),
+                    len(plan.get_actions(MISSING)),
+                    len(plan.get_actions(DONE))))
+    if failed:
+        return ERROR_TRANSFER
     return 0
 
 
@@ -111,16 +577,45 @@ def main():
     EXAMPLE_FILE = "The Path of Resistance.sla"
     OLD_DIR = os.path.join(replace_vars("%CLOUD%"), "Tabletop", "Campaigns",
                            "The Path of Resistance")
-    if len(sys.argv) != 3:
+    parser = argparse.ArgumentParser(
+        description="Move images cited by an SLA file from its old"
+        " directory.",
+    )
+    parser.add_argument("dst_file", nargs="?", default=None,
+                        help="SLA file (in the new directory)")
+    parser.add_argument("old_dir", nargs="?", default=None,
+                        help="The directory that has the images")
+    parser.add_argument("--mode", choices=TRANSFER_MODES, default=MOVE,
+                        help="How to put each image in the new directory"
+                        " (a mode that is not possible falls back to a"
+                        " copy).")
+    parser.add_argument("--copy", action="store_const", const=COPY,
+                        dest="mode",
+                        help="Same as --mode copy.")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Move or copy this many files at a time.")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        dest="dry_run",
+                        help="Only show what would be done.")
+    parser.add_argument("--no-manifest", action="store_false",
+                        dest="manifest",
+                        help="Do not read or write <name>.assets.json.")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Change PFILE of duplicate images to the"
+                        " first copy.")
+    args = parser.parse_args()
+    if args.old_dir is None:
         echo0("Error: You must specify the new file and the old directory"
               " to gather files used by the file.")
         if os.path.isdir(OLD_DIR):
             echo0("Such as:")
-            echo0('pull_images "{}" "{}"'.format(EXAMPLE_FILE, OLD_DIR))
-        return 1
+            echo0('sla-bundle "{}" "{}"'.format(EXAMPLE_FILE, OLD_DIR))
+        return ERROR_MISSING_ARG
     # dst_file = EXAMPLE_FILE
 
-    return pull_images(sys.argv[1], sys.argv[2])
+    return pull_images(args.dst_file, args.old_dir, mode=args.mode,
+                       jobs=args.jobs, dry_run=args.dry_run,
+                       manifest=args.manifest, dedupe=args.dedupe)
 
 
 if __name__ == "__main__":
@@ -3,21 +3,56 @@
 booktacular.morescribus.compare
 -------------------------------
 
-Compare two SLA (Scribus Project) files by only their text. The changes
-to the text-only temporary files being compared will not be written
-back to the original files.
+Compare two SLA (Scribus Project) files by only their text, or by their
+objects (See --structure).
+
+The text of each file is dumped in reading order (See
+ScribusDocRoot.dump_text) in memory, then compared in this process (See
+diff_lines) and shown as a unified diff, JSON or side-by-side HTML. Each
+change is labeled with the page it is on. Otherwise the text is shown
+in meld (the changes to the text-only temporary files being compared
+will not be written back to the original files).
 
 Usage:
 # Typically you would install booktacular and do:
-sla-meld <file1.sla> <file2.sla>
+sla-meld <file1.sla> <file2.sla> [options]
 # directly use it via
 # python3 compare.py <file1.sla> <file2.sla>
+
+Options:
+--format FORMAT  unified, json or html. If not set, meld is used if
+                 installed, otherwise unified.
+-o, --output     Write the diff to this file instead of standard output.
+-U, --context N  Lines of context around each change (default: 3).
+-j, --jobs N     Load the files in N processes (default: 2, so both
+                 load at once; 1 loads them one after the other).
+--masters        Also compare objects from master pages.
+--structure      Compare objects (frames) instead of text: added,
+                 removed, moved and resized objects, changed images
+                 (PFILE), text, styles and other attributes, matched by
+                 ItemID (See StructureDiff). The unified format is one
+                 line per change.
+
+With --format (or without meld), the exit code is 0 if the text is the
+same, otherwise 1 (like diff).
 '''
 from __future__ import print_function
-import sys
+import argparse
+import bisect
+import difflib
+import hashlib
+import html
+import io
+import json
 import os
-import tempfile
+import re
 import subprocess
+import sys
+import tempfile
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
 
 from booktacular.find_hierosoft import hierosoft  # noqa: F401
 # ^ also works for submodules since changes sys.path
@@ -34,8 +69,53 @@ from hierosoft import (  # noqa: F401
 
 from booktacular.morescribus import (
     ScribusProject,
+    get_text,
 )
 
+DIFF_FORMATS = ("unified", "json", "html")
+DIFF_CONTEXT = 3  # lines around each change, as in diff -u
+COMPARE_JOBS = 2  # Load both files at once (each in a process).
+PAGE_HEADING_RE = re.compile(r"^## Page (\d+)$")
+# ^ written before the text of each page by ScribusDocRoot.dump_text
+
+SMALL_DIFF_AREA = 250000
+# ^ Ranges without unique lines are compared with difflib (which is
+#   quadratic) only if the product of their lengths is this small.
+
+EQUAL = "equal"
+REPLACE = "replace"
+DELETE = "delete"
+INSERT = "insert"
+
+# Objects compared by diff_structure:
+STRUCTURE_TAGS = ("PAGEOBJECT", "MASTEROBJECT", "FRAMEOBJECT")
+MASTER_TAGS = ("MASTEROBJECT",)  # only compared with include_master
+MOVE_ATTRIBUTES = ("XPOS", "YPOS", "OwnPage")
+SIZE_ATTRIBUTES = ("WIDTH", "HEIGHT")
+STYLE_ATTRIBUTES = ("PARENT", "CPARENT", "FONT", "FONTSIZE", "FCOLOR",
+                    "FEATURES")
+# ^ formatting of text in StoryText
+
+# Kinds of changes found by diff_structure:
+ADDED = "added"
+REMOVED = "removed"
+MOVED = "moved"
+RESIZED = "resized"
+IMAGE_CHANGED = "image"  # PFILE
+TEXT_CHANGED = "text"
+STYLE_CHANGED = "style"
+ATTRIBUTES_CHANGED = "attributes"  # any other attribute of the object
+
+HTML_STYLE = """
+table.diff { border-collapse: collapse; font-family: monospace; }
+table.diff td { padding: 0 0.5em; vertical-align: top;
+                white-space: pre-wrap; }
+table.diff th { background: #eee; text-align: left; }
+td.lineno { color: #888; text-align: right; }
+tr.delete td.old, tr.replace td.old { background: #fdd; }
+tr.insert td.new, tr.replace td.new { background: #dfd; }
+"""
+
 
 def usage():
     echo0()
@@ -43,7 +123,710 @@ def usage():
     echo0()
 
 
-def meld_sla(paths, tmp_path=None):
+def get_text_lines(project, include_master=False):
+    """Get the text of a project in reading order as lines.
+
+    Args:
+        project (ScribusProject): A loaded project.
+        include_master (bool): See ScribusDocRoot.dump_text.
+
+    Returns:
+        list[str]: Lines without newlines.
+    """
+    stream = StringIO()
+    project.root.dump_text(stream, include_master=include_master)
+    return stream.getvalue().splitlines()
+
+
+def _load_text_lines(path, include_master=False):
+    return get_text_lines(ScribusProject(path),
+                          include_master=include_master)
+
+
+def load_both(function, paths, jobs=None, **kwargs):
+    """Run function on each path at once, each in another process.
+
+    Parsing takes most of the time of a comparison, so loading both
+    files at once takes about half as long on a computer with more than
+    one CPU.
+
+    Args:
+        function (Callable): A module-level function (so it can be sent
+            to a process) that is given a path and kwargs.
+        paths (list): The files (or whatever function accepts, such as
+            a tuple with a path).
+        jobs (Optional[int]): Number of processes (default:
+            COMPARE_JOBS). If 1, the files are loaded in this process.
+
+    Returns:
+        list: The result of function for each path, in the same order.
+    """
+    if jobs is None:
+        jobs = COMPARE_JOBS
+    jobs = min(jobs, len(paths))
+    if jobs <= 1:
+        return [function(path, **kwargs) for path in paths]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(function, path, **kwargs)
+                   for path in paths]
+        return [future.result() for future in futures]
+
+
+def get_line_pages(lines):
+    """Get the page of each line (See PAGE_HEADING_RE).
+
+    Returns:
+        list[int]: The page (counting from 1) of each line, or None
+            before the first page.
+    """
+    pages = []
+    page = None
+    for line in lines:
+        match = PAGE_HEADING_RE.match(line)
+        if match:
+            page = int(match.group(1))
+        pages.append(page)
+    return pages
+
+
+def _unique_pairs(a, b, alo, ahi, blo, bhi):
+    """Get (i, j) of each value that is once in a[alo:ahi] and once in
+    b[blo:bhi], in the order of a."""
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        if entry is None:
+            counts[a[i]] = [1, i, 0, None]
+        else:
+            entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[2] += 1
+            entry[3] = j
+    return sorted((entry[1], entry[3]) for entry in counts.values()
+                  if entry[0] == 1 and entry[2] == 1)
+
+
+def _longest_increasing(pairs):
+    """Get the longest run of pairs where j also increases (patience
+    sorting, O(n log n))."""
+    tops = []  # j of the top card of each pile
+    top_indices = []  # index in pairs of the top card of each pile
+    previous = [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect.bisect_left(tops, j)
+        if pile > 0:
+            previous[index] = top_indices[pile - 1]
+        if pile == len(tops):
+            tops.append(j)
+            top_indices.append(index)
+        else:
+            tops[pile] = j
+            top_indices[pile] = index
+    result = []
+    index = top_indices[-1] if top_indices else None
+    while index is not None:
+        result.append(pairs[index])
+        index = previous[index]
+    result.reverse()
+    return result
+
+
+def diff_lines(a, b):
+    """Compare two lists of lines using the patience diff algorithm.
+
+    Lines are replaced by numbers (one per distinct line) first, so each
+    comparison is of two integers. Lines that occur once in each side
+    (such as the heading of each page) are matched in order, then the
+    ranges between them are compared the same way, after skipping lines
+    that are the same at the start and end of each range. The time is
+    close to linear in the number of lines, unlike difflib which is
+    quadratic for large changes (it is only used for small ranges where
+    no line is unique, See SMALL_DIFF_AREA).
+
+    Args:
+        a (list[str]): The old lines.
+        b (list[str]): The new lines.
+
+    Returns:
+        list[tuple]: Opcodes (tag, i1, i2, j1, j2) as from
+            difflib.SequenceMatcher.get_opcodes, where tag is EQUAL,
+            REPLACE, DELETE or INSERT.
+    """
+    numbers = {}
+    a = [numbers.setdefault(line, len(numbers)) for line in a]
+    b = [numbers.setdefault(line, len(numbers)) for line in b]
+    matches = []
+    pending = [(0, len(a), 0, len(b))]
+    # ^ Work is done last-in-first-out, so push later ranges first and
+    #   each match is found in order.
+    while pending:
+        item = pending.pop()
+        if len(item) == 2:
+            matches.append(item)
+            continue
+        alo, ahi, blo, bhi = item
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            pending.append((ahi, bhi))  # last first, so done in order
+        if alo == ahi or blo == bhi:
+            continue  # only deleted or only inserted lines are left
+        work = []
+        prev_i, prev_j = alo, blo
+        for i, j in _longest_increasing(_unique_pairs(a, b, alo, ahi,
+                                                      blo, bhi)):
+            if prev_i < i and prev_j < j:
+                work.append((prev_i, i, prev_j, j))
+            work.append((i, j))
+            prev_i, prev_j = i + 1, j + 1
+        if not work:
+            # No line is once in each (such as only blank lines differ).
+            if (ahi - alo) * (bhi - blo) <= SMALL_DIFF_AREA:
+                matcher = difflib.SequenceMatcher(None, a[alo:ahi],
+                                                  b[blo:bhi], autojunk=False)
+                for i, j, size in matcher.get_matching_blocks():
+                    for offset in range(size):
+                        matches.append((alo + i + offset, blo + j + offset))
+            continue  # Otherwise all of the lines are replaced.
+        if prev_i < ahi and prev_j < bhi:
+            work.append((prev_i, ahi, prev_j, bhi))
+        pending.extend(reversed(work))
+    return _matches_to_opcodes(matches, len(a), len(b))
+
+
+def _matches_to_opcodes(matches, a_len, b_len):
+    opcodes = []
+    i = j = 0
+    for match_i, match_j in matches + [(a_len, b_len)]:
+        if i < match_i and j < match_j:
+            opcodes.append((REPLACE, i, match_i, j, match_j))
+        elif i < match_i:
+            opcodes.append((DELETE, i, match_i, j, j))
+        elif j < match_j:
+            opcodes.append((INSERT, i, i, j, match_j))
+        i, j = match_i, match_j
+        if (i, j) == (a_len, b_len):
+            break
+        if opcodes and opcodes[-1][0] == EQUAL:
+            tag, i1, _, j1, _ = opcodes[-1]
+            opcodes[-1] = (EQUAL, i1, i + 1, j1, j + 1)
+        else:
+            opcodes.append((EQUAL, i, i + 1, j, j + 1))
+        i += 1
+        j += 1
+    return opcodes
+
+
+def group_opcodes(opcodes, context=DIFF_CONTEXT):
+    """Split opcodes into hunks with context lines around each change
+    (like difflib.SequenceMatcher.get_grouped_opcodes).
+
+    Returns:
+        list[list[tuple]]: The opcodes of each hunk.
+    """
+    codes = list(opcodes)
+    if not codes:
+        return []
+    if codes[0][0] == EQUAL:
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = (tag, max(i1, i2 - context), i2, max(j1, j2 - context),
+                    j2)
+    if codes[-1][0] == EQUAL:
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = (tag, i1, min(i2, i1 + context), j1,
+                     min(j2, j1 + context))
+    groups = []
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == EQUAL and i2 - i1 > context * 2:
+            group.append((tag, i1, i1 + context, j1, j1 + context))
+            groups.append(group)
+            group = []
+            i1, j1 = i2 - context, j2 - context
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == EQUAL):
+        groups.append(group)
+    return [group for group in groups
+            if any(code[0] != EQUAL for code in group)]
+
+
+def _format_range(start, count):
+    """Format a range for a unified diff hunk header (as GNU diff does,
+    an empty range is after the line before it)."""
+    if count == 1:
+        return "{}".format(start)
+    if count == 0:
+        start -= 1
+    return "{},{}".format(start, count)
+
+
+class TextDiff(object):
+    """The differences between the text of two SLA files.
+
+    Args:
+        a_lines (list[str]): The old text (See get_text_lines).
+        b_lines (list[str]): The new text.
+        a_name (str): The old file, for headings.
+        b_name (str): The new file, for headings.
+
+    Attributes:
+        opcodes (list[tuple]): See diff_lines.
+    """
+    def __init__(self, a_lines, b_lines, a_name="a", b_name="b"):
+        self.a_lines = a_lines
+        self.b_lines = b_lines
+        self.a_name = a_name
+        self.b_name = b_name
+        self.opcodes = diff_lines(a_lines, b_lines)
+        self._a_pages = get_line_pages(a_lines)
+        self._b_pages = get_line_pages(b_lines)
+
+    def has_changes(self):
+        return any(code[0] != EQUAL for code in self.opcodes)
+
+    def get_page(self, i, j):
+        """Get the page of a change at a_lines[i] or b_lines[j]."""
+        if j < len(self._b_pages) and self._b_pages[j] is not None:
+            return self._b_pages[j]
+        if i < len(self._a_pages):
+            return self._a_pages[i]
+        if self._b_pages:
+            return self._b_pages[-1]
+        return None
+
+    def get_hunks(self, context=DIFF_CONTEXT):
+        """Get each group of changes with its context.
+
+        Returns:
+            list[OrderedDict]: Each with 'page' (of the first change,
+                counting from 1), 'a_start' and 'b_start' (counting from
+                1), 'a_count', 'b_count' and 'lines' (each a list of tag
+                and text, where tag is " ", "-" or "+").
+        """
+        hunks = []
+        for group in group_opcodes(self.opcodes, context=context):
+            first = [code for code in group if code[0] != EQUAL][0]
+            hunk = OrderedDict()
+            hunk['page'] = self.get_page(first[1], first[3])
+            hunk['a_start'] = group[0][1] + 1
+            hunk['a_count'] = group[-1][2] - group[0][1]
+            hunk['b_start'] = group[0][3] + 1
+            hunk['b_count'] = group[-1][4] - group[0][3]
+            lines = []
+            for tag, i1, i2, j1, j2 in group:
+                if tag == EQUAL:
+                    lines.extend([" ", line] for line in self.a_lines[i1:i2])
+                    continue
+                lines.extend(["-", line] for line in self.a_lines[i1:i2])
+                lines.extend(["+", line] for line in self.b_lines[j1:j2])
+            hunk['lines'] = lines
+            hunks.append(hunk)
+        return hunks
+
+    def write_unified(self, stream, context=DIFF_CONTEXT):
+        """Write a unified diff (as from diff -u) where each hunk
+        header ends with the page."""
+        hunks = self.get_hunks(context=context)
+        if not hunks:
+            return
+        stream.write("--- {}\n+++ {}\n".format(self.a_name, self.b_name))
+        for hunk in hunks:
+            stream.write("@@ -{} +{} @@ Page {}\n".format(
+                _format_range(hunk['a_start'], hunk['a_count']),
+                _format_range(hunk['b_start'], hunk['b_count']),
+                hunk['page']))
+            for tag, line in hunk['lines']:
+                stream.write(tag + line + "\n")
+
+    def write_json(self, stream, context=DIFF_CONTEXT):
+        data = OrderedDict()
+        data['a'] = self.a_name
+        data['b'] = self.b_name
+        data['hunks'] = self.get_hunks(context=context)
+        json.dump(data, stream, indent=2)
+        stream.write("\n")
+
+    def write_html(self, stream, context=DIFF_CONTEXT):
+        """Write a standalone HTML page with the changes side by side."""
+        escape = html.escape
+        stream.write(
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            "<title>{} vs {}</title>\n<style>{}</style>\n</head>\n<body>\n"
+            "<table class=\"diff\">\n<tr><th></th><th>{}</th><th></th>"
+            "<th>{}</th></tr>\n"
+            "".format(escape(self.a_name), escape(self.b_name), HTML_STYLE,
+                      escape(self.a_name), escape(self.b_name))
+        )
+        for group in group_opcodes(self.opcodes, context=context):
+            first = [code for code in group if code[0] != EQUAL][0]
+            stream.write("<tr><th colspan=\"4\">Page {}</th></tr>\n"
+                         "".format(self.get_page(first[1], first[3])))
+            for tag, i1, i2, j1, j2 in group:
+                count = max(i2 - i1, j2 - j1)
+                for offset in range(count):
+                    i = i1 + offset
+                    j = j1 + offset
+                    old = (i + 1, self.a_lines[i]) if i < i2 else ("", "")
+                    new = (j + 1, self.b_lines[j]) if j < j2 else ("", "")
+                    stream.write(
+                        "<tr class=\"{}\"><td class=\"lineno\">{}</td>"
+                        "<td class=\"old\">{}</td><td class=\"lineno\">{}"
+                        "</td><td class=\"new\">{}</td></tr>\n"
+                        "".format(tag, old[0], escape(old[1]), new[0],
+                                  escape(new[1]))
+                    )
+        stream.write("</table>\n</body>\n</html>\n")
+
+    def write(self, stream, output_format="unified", context=DIFF_CONTEXT):
+        if output_format not in DIFF_FORMATS:
+            raise ValueError("output_format={} (expected one of {})"
+                             "".format(repr(output_format), DIFF_FORMATS))
+        getattr(self, "write_" + output_format)(stream, context=context)
+
+
+def diff_sla(paths, include_master=False, jobs=None):
+    """Compare the text of two SLA files.
+
+    Args:
+        paths (list[str]): The old and new SLA file.
+        include_master (bool): See ScribusDocRoot.dump_text.
+        jobs (Optional[int]): See load_both.
+
+    Returns:
+        TextDiff: The differences.
+    """
+    if len(paths) != 2:
+        raise ValueError("You must provide 2 paths, each to an SLA file.")
+    a_lines, b_lines = load_both(_load_text_lines, paths, jobs=jobs,
+                                 include_master=include_master)
+    return TextDiff(a_lines, b_lines, a_name=paths[0], b_name=paths[1])
+
+
+def _get_story_styles(node):
+    """Get the formatting of the text of an object in order."""
+    styles = []
+    pending = [child for child in reversed(getattr(node, 'children', ()))
+               if getattr(child, 'tagName', None) == "StoryText"]
+    while pending:
+        sub = pending.pop()
+        attributes = getattr(sub, 'attributes', None)
+        if attributes:
+            styles.append((sub.tagName,) + tuple(
+                "{}={}".format(name, attributes[name])
+                for name in STYLE_ATTRIBUTES if name in attributes
+            ))
+        pending.extend(reversed(getattr(sub, 'children', ())))
+    return styles
+
+
+class ObjectSummary(object):
+    """What diff_structure compares about one object (frame).
+
+    Attributes:
+        key (tuple): tagName and ItemID (or a content hash if there is no
+            ItemID or it is not unique).
+        attributes (OrderedDict): Attributes of the object itself.
+        text (str): See get_text.
+        styles (list[tuple]): Formatting of the text in order.
+        content_hash (str): A hash of what the object shows (tagName,
+            text, styles, PFILE and size) but not where it is.
+    """
+    def __init__(self, node):
+        self.tagName = node.tagName
+        self.attributes = OrderedDict(node.attributes)
+        self.text = "".join(get_text(child) for child in node.children
+                            if getattr(child, 'tagName', None) ==
+                            "StoryText")
+        self.styles = _get_story_styles(node)
+        digest = hashlib.sha1()
+        for part in ([self.tagName, self.text, repr(self.styles),
+                      self.attributes.get("PFILE") or ""]
+                     + [self.attributes.get(name) or ""
+                        for name in SIZE_ATTRIBUTES]):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        self.content_hash = digest.hexdigest()
+        self.key = None
+
+    def get_page(self):
+        """Get the page counting from 1 (None if not on a page)."""
+        own_page = self.attributes.get("OwnPage")
+        if own_page is None or int(own_page) < 0:
+            return None
+        return int(own_page) + 1
+
+
+def index_objects(root, include_master=False):
+    """Get each object in a document by its key (See ObjectSummary).
+
+    Args:
+        root (ScribusDocRoot): The parsed document.
+        include_master (bool): Also get objects of master pages (See
+            MASTER_TAGS).
+
+    Returns:
+        OrderedDict: Each ObjectSummary by key, in document order.
+    """
+    summaries = []
+    id_counts = {}
+    pending = list(reversed(root.children))
+    while pending:
+        node = pending.pop()
+        tagName = getattr(node, 'tagName', None)
+        if tagName == "StoryText":
+            continue  # Text is in the summary of its frame.
+        if (tagName in MASTER_TAGS) and not include_master:
+            continue
+        if tagName in STRUCTURE_TAGS:
+            summary = ObjectSummary(node)
+            summaries.append(summary)
+            item_id = (tagName, summary.attributes.get("ItemID"))
+            id_counts[item_id] = id_counts.get(item_id, 0) + 1
+        pending.extend(reversed(getattr(node, 'children', None) or ()))
+    objects = OrderedDict()
+    hash_counts = {}
+    for summary in summaries:
+        item_id = (summary.tagName, summary.attributes.get("ItemID"))
+        if item_id[1] is not None and id_counts[item_id] == 1:
+            summary.key = item_id
+        else:
+            count = hash_counts.get(summary.content_hash, 0)
+            hash_counts[summary.content_hash] = count + 1
+            summary.key = (summary.tagName,
+                           "{}:{}".format(summary.content_hash, count))
+        objects[summary.key] = summary
+    return objects
+
+
+def _change(kind, old, new, **kwargs):
+    summary = new if new is not None else old
+    change = OrderedDict()
+    change['kind'] = kind
+    change['tagName'] = summary.tagName
+    change['ItemID'] = summary.attributes.get("ItemID")
+    change['page'] = summary.get_page()
+    for key, value in kwargs.items():
+        change[key] = value
+    return change
+
+
+def _compare_attributes(old, new, names):
+    changed = OrderedDict()
+    for name in names:
+        old_value = old.attributes.get(name)
+        new_value = new.attributes.get(name)
+        if old_value != new_value:
+            changed[name] = [old_value, new_value]
+    return changed
+
+
+def compare_objects(old, new):
+    """Get the changes to one object (See diff_structure)."""
+    changes = []
+    moved = _compare_attributes(old, new, MOVE_ATTRIBUTES)
+    if moved:
+        changes.append(_change(MOVED, old, new, attributes=moved,
+                               old_page=old.get_page()))
+    resized = _compare_attributes(old, new, SIZE_ATTRIBUTES)
+    if resized:
+        changes.append(_change(RESIZED, old, new, attributes=resized))
+    image = _compare_attributes(old, new, ("PFILE",))
+    if image:
+        changes.append(_change(IMAGE_CHANGED, old, new, attributes=image))
+    if old.text != new.text:
+        changes.append(_change(TEXT_CHANGED, old, new, old_text=old.text,
+                               new_text=new.text))
+    if old.styles != new.styles:
+        old_styles = set(old.styles)
+        new_styles = set(new.styles)
+        changes.append(_change(
+            STYLE_CHANGED, old, new,
+            removed=sorted(" ".join(style)
+                           for style in old_styles - new_styles),
+            added=sorted(" ".join(style)
+                         for style in new_styles - old_styles),
+        ))
+    done = set(MOVE_ATTRIBUTES + SIZE_ATTRIBUTES + ("PFILE",))
+    # ^ ItemID is only different if matched by content_hash.
+    names = [name for name in old.attributes if name not in done]
+    names.extend(name for name in new.attributes
+                 if name not in done and name not in old.attributes)
+    others = _compare_attributes(old, new, names)
+    if others:
+        changes.append(_change(ATTRIBUTES_CHANGED, old, new,
+                               attributes=others))
+    return changes
+
+
+def _load_objects(path, include_master=False):
+    return index_objects(ScribusProject(path).root,
+                         include_master=include_master)
+
+
+class StructureDiff(object):
+    """The differences between the objects of two SLA files.
+
+    Objects are matched by ItemID, then objects left over in each file
+    are matched by content hash (such as a frame that was cut and pasted,
+    so it has a new ItemID). Each step uses dicts, so the time is linear
+    in the number of objects.
+
+    Args:
+        old_root (Union[ScribusDocRoot,OrderedDict]): The old document,
+            or its objects from index_objects (such as from another
+            process).
+        new_root (Union[ScribusDocRoot,OrderedDict]): The new document
+            (or its objects).
+        include_master (bool): Also compare objects of master pages (See
+            index_objects). Only used for a document, not for objects.
+
+    Attributes:
+        changes (list[OrderedDict]): Each with 'kind' (ADDED, REMOVED,
+            MOVED, RESIZED, IMAGE_CHANGED, TEXT_CHANGED, STYLE_CHANGED or
+            ATTRIBUTES_CHANGED), 'tagName', 'ItemID' and 'page'
+            (counting from 1, of the new object unless removed), then
+            details for the kind (such as 'attributes' with [old, new]
+            for each changed attribute).
+    """
+    def __init__(self, old_root, new_root, a_name="a", b_name="b",
+                 include_master=False):
+        self.a_name = a_name
+        self.b_name = b_name
+        old_objects = old_root
+        if not isinstance(old_objects, OrderedDict):
+            old_objects = index_objects(old_root,
+                                        include_master=include_master)
+        if isinstance(new_root, OrderedDict):
+            new_objects = OrderedDict(new_root)  # copy (matches are popped)
+        else:
+            new_objects = index_objects(new_root,
+                                        include_master=include_master)
+        pairs = []
+        removed = []
+        for key, old in old_objects.items():
+            new = new_objects.pop(key, None)
+            if new is None:
+                removed.append(old)
+            else:
+                pairs.append((old, new))
+        added_by_hash = OrderedDict()
+        for new in new_objects.values():
+            added_by_hash.setdefault(new.content_hash, []).append(new)
+        self.changes = []
+        for old in removed:
+            candidates = added_by_hash.get(old.content_hash)
+            if candidates:
+                pairs.append((old, candidates.pop(0)))
+            else:
+                self.changes.append(_change(REMOVED, old, None))
+        for old, new in pairs:
+            self.changes.extend(compare_objects(old, new))
+        for candidates in added_by_hash.values():
+            for new in candidates:
+                self.changes.append(_change(ADDED, None, new))
+
+    def has_changes(self):
+        return bool(self.changes)
+
+    def write_unified(self, stream, context=None):
+        """Write one line per change for people to read."""
+        for change in self.changes:
+            line = "page {page}: {kind}: {tagName} ItemID={ItemID}".format(
+                **change)
+            if 'attributes' in change:
+                line += " " + ", ".join(
+                    "{}: {} -> {}".format(name, *values)
+                    for name, values in change['attributes'].items()
+                )
+            if change['kind'] == TEXT_CHANGED:
+                line += ": {} -> {}".format(repr(change['old_text']),
+                                            repr(change['new_text']))
+            elif change['kind'] == STYLE_CHANGED:
+                line += ": -{} +{}".format(change['removed'],
+                                           change['added'])
+            stream.write(line + "\n")
+
+    def write_json(self, stream, context=None):
+        data = OrderedDict()
+        data['a'] = self.a_name
+        data['b'] = self.b_name
+        data['changes'] = self.changes
+        json.dump(data, stream, indent=2)
+        stream.write("\n")
+
+    def write_html(self, stream, context=None):
+        escape = html.escape
+        stream.write(
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            "<title>{} vs {}</title>\n<style>{}</style>\n</head>\n<body>\n"
+            "<table class=\"diff\">\n<tr><th>Page</th><th>Change</th>"
+            "<th>Object</th><th>Details</th></tr>\n"
+            "".format(escape(self.a_name), escape(self.b_name), HTML_STYLE)
+        )
+        for change in self.changes:
+            details = OrderedDict(
+                (key, value) for key, value in change.items()
+                if key not in ('kind', 'tagName', 'ItemID', 'page')
+            )
+            stream.write(
+                "<tr class=\"{kind}\"><td>{page}</td><td>{kind}</td>"
+                "<td>{tagName} {ItemID}</td><td>{details}</td></tr>\n"
+                "".format(details=escape(json.dumps(details)),
+                          **change)
+            )
+        stream.write("</table>\n</body>\n</html>\n")
+
+    def write(self, stream, output_format="unified", context=None):
+        if output_format not in DIFF_FORMATS:
+            raise ValueError("output_format={} (expected one of {})"
+                             "".format(repr(output_format), DIFF_FORMATS))
+        getattr(self, "write_" + output_format)(stream, context=context)
+
+
+def diff_structure(paths, jobs=None, include_master=False):
+    """Compare the objects of two SLA files (See StructureDiff).
+
+    Args:
+        paths (list[str]): The old and new SLA file.
+        jobs (Optional[int]): See load_both.
+        include_master (bool): See index_objects.
+
+    Returns:
+        StructureDiff: The differences.
+    """
+    if len(paths) != 2:
+        raise ValueError("You must provide 2 paths, each to an SLA file.")
+    old_objects, new_objects = load_both(_load_objects, paths, jobs=jobs,
+                                         include_master=include_master)
+    return StructureDiff(old_objects, new_objects, a_name=paths[0],
+                         b_name=paths[1])
+
+
+def _dump_to_file(job, include_master=False):
+    path, tmp_path = job
+    project = ScribusProject(path)
+    with open(tmp_path, 'w') as f:
+        echo1('* dumping temp file "{}"'.format(tmp_path))
+        project.root.dump_text(f, include_master=include_master)
+    return tmp_path
+
+
+def meld_sla(paths, tmp_path=None, jobs=None, include_master=False):
+    """Show the text of two SLA files in meld.
+
+    Args:
+        paths (list[str]): The old and new SLA file.
+        tmp_path (Optional[str]): Where to dump the text (Defaults to a
+            new temporary directory).
+        jobs (Optional[int]): See load_both.
+        include_master (bool): See ScribusDocRoot.dump_text.
+    """
     tmpdir = None
     try:
         if tmp_path is None:
@@ -52,7 +835,6 @@ def meld_sla(paths, tmp_path=None):
         if len(paths) != 2:
             raise ValueError("You must provide 2 paths, each to an SLA file.")
         tmp_paths = []
-        projects = []
         for path in paths:
             name = os.path.split(path)[1]
             no_ext_name = os.path.splitext(name)[0]
@@ -64,11 +846,8 @@ def meld_sla(paths, tmp_path=None):
                 new_name = "{}-{}.txt".format(no_ext_name, i)
                 this_tmp_path = os.path.join(tmp_path, new_name)
             tmp_paths.append(this_tmp_path)
-            project = ScribusProject(path)
-            projects.append(project)
-            with open(this_tmp_path, 'w') as f:
-                print('* dumping temp file "{}"'.format(this_tmp_path))
-                project.dump_text(f)
+        load_both(_dump_to_file, list(zip(paths, tmp_paths)), jobs=jobs,
+                  include_master=include_master)
         cmd_parts = ["meld", tmp_paths[0], tmp_paths[1]]
         '''
         meldq = None
@@ -89,15 +868,60 @@ def meld_sla(paths, tmp_path=None):
 
 
 def main():
-    if len(sys.argv) != 3:
-        echo0("Error: You must provide two paths, each to an SLA file.")
-        return 1
-    paths = sys.argv[1:]
+    parser = argparse.ArgumentParser(
+        description="Compare the text of two SLA files.",
+    )
+    parser.add_argument("paths", nargs=2, help="The old and new SLA file")
+    parser.add_argument("--format", choices=DIFF_FORMATS, default=None,
+                        dest="output_format",
+                        help="Show the differences in this format instead"
+                        " of in meld.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write the differences to this file.")
+    parser.add_argument("-U", "--context", type=int, default=DIFF_CONTEXT,
+                        help="Lines of context around each change.")
+    parser.add_argument("--masters", action="store_true",
+                        help="Also compare objects from master pages.")
+    parser.add_argument("-j", "--jobs", type=int, default=COMPARE_JOBS,
+                        help="Load the files in this many processes (1 to"
+                        " load them one after the other).")
+    parser.add_argument("--structure", action="store_true",
+                        help="Compare the objects (frames) by ItemID"
+                        " instead of the text, such as to find moved"
+                        " frames and changed images or styles.")
+    args = parser.parse_args()
     '''
     if (sys.version_info.major >= 3) and (sys.version_info.minor >= 10):
         with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmpdir:
             tmp_path = tmpdir.name
             meld_sla(paths, tmp_path)
     '''
-    meld_sla(paths)
+    output_format = args.output_format
+    if output_format is None:
+        if not args.structure:
+            if which("meld") is not None:
+                meld_sla(args.paths, jobs=args.jobs,
+                         include_master=args.masters)
+                return 0
+            echo1("meld is not installed, so showing a unified diff.")
+        output_format = "unified"
+    if args.structure:
+        text_diff = diff_structure(args.paths, jobs=args.jobs,
+                                   include_master=args.masters)
+    else:
+        text_diff = diff_sla(args.paths, include_master=args.masters,
+                             jobs=args.jobs)
+    if args.output:
+        with io.open(args.output, 'w', encoding="utf-8") as stream:
+            text_diff.write(stream, output_format=output_format,
+                            context=args.context)
+    else:
+        text_diff.write(sys.stdout, output_format=output_format,
+                        context=args.context)
+    if text_diff.has_changes():
+        return 1
     return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
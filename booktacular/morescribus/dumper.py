@@ -7,14 +7,30 @@ dump sla as text.
 
 Usage:
 # If you install booktacular you can do:
-sla-dump <file.sla>
+sla-dump <file.sla> [<file.md>] [options]
+
+Options:
+--format FORMAT  markdown (default), text, html or jsonl (one JSON object
+                 per frame with page, ItemID, bbox, style and text).
+-j, --jobs N     Sort and dump pages in N processes (0: one per CPU). Off
+                 by default, since copying each page to a process usually
+                 takes longer than sorting it.
+--pages RANGES   Only load and dump these pages, counting from 1 (such
+                 as 40-55 or 1,3,10-12).
+--masters        Also dump master page objects (such as running headers).
+--watch          Dump again each time the SLA file is saved (until Ctrl+C).
+--no-cache       Dump every page instead of only pages that changed since
+                 the last dump (See booktacular.morescribus.pagecache).
 '''
 from __future__ import print_function
+import argparse
 import sys
 import os
 import tempfile
 import shutil
 
+from io import StringIO
+
 from booktacular.find_hierosoft import hierosoft  # noqa: F401
 # ^ also works for submodules since changes sys.path
 
@@ -30,6 +46,19 @@ from hierosoft import (  # noqa: F401
 
 from booktacular.morescribus import (
     ScribusProject,
+    parse_page_ranges,
+    sibling_path,
+)
+from booktacular.morescribus.pagecache import (
+    PageCache,
+)
+from booktacular.morescribus.writers import (
+    DUMP_FORMATS,
+    WRITERS,
+)
+from booktacular.morescribus.watch import (
+    watch,
+    write_if_changed,
 )
 
 if sys.version_info.major < 3:
@@ -43,14 +72,65 @@ def usage():
     echo0()
 
 
-def dump_sla_text(src_path, dst_path, tmp_dir=None):
+def dump_project_text(project, stream, jobs=None, include_master=False,
+                      output_format="markdown", use_cache=True):
+    """Dump the text of a loaded SLA file, reusing unchanged pages.
+
+    Args:
+        project (ScribusProject): The loaded SLA file.
+        stream: A file-like object opened for writing text.
+        use_cache (bool): Only sort and dump pages that changed since the
+            last dump of the same SLA file (See PageCache), and update
+            the cache beside it (only a warning is shown if it cannot be
+            saved).
+        jobs, include_master, output_format: See dump_sla_text.
+    """
+    cache = None
+    if use_cache:
+        cache = PageCache(project.get_path())
+    project.root.dump_text(stream, jobs=jobs, include_master=include_master,
+                           output_format=output_format, cache=cache)
+    if cache is None:
+        return
+    if project.pages is None:
+        cache.prune(page.number for page in project.root.visible_pages())
+        # ^ Otherwise keep pages that were not loaded.
+    try:
+        cache.save()
+    except OSError as ex:
+        # such as if the directory of the SLA file is read-only
+        echo0('Warning: The page cache "{}" could not be saved ({})'
+              ''.format(cache.path, ex))
+
+
+def dump_sla_text(src_path, dst_path, tmp_dir=None, jobs=None, pages=None,
+                  include_master=False, output_format="markdown",
+                  use_cache=True):
+    """Dump the text of an SLA file to a Markdown (or other) file.
+
+    Args:
+        src_path (str): The SLA file.
+        dst_path (str): The file to create or replace.
+        tmp_dir (Optional[str]): Where to write the temporary file
+            (Defaults to a new temporary directory).
+        jobs (Optional[int]): Number of processes for sorting and dumping
+            pages (See ScribusDocRoot.dump_text).
+        pages (Optional[set[int]]): Only load and dump these pages
+            (0-based, See parse_page_ranges).
+        include_master (bool): Also dump objects from master pages.
+        output_format (str): One of DUMP_FORMATS (See
+            booktacular.morescribus.writers).
+        use_cache (bool): See dump_project_text.
+    """
     tmpdir = None
     name = os.path.split(src_path)[1]
     no_ext_name, new_dot_ext = os.path.splitext(name)
     try:
         if tmp_dir is None:
             tmpdir = tempfile.TemporaryDirectory()
-        tmp_dir_path = tmpdir.name
+            tmp_dir_path = tmpdir.name
+        else:
+            tmp_dir_path = tmp_dir
 
         name = os.path.split(src_path)[1]
         no_ext_name = os.path.splitext(name)[0]
@@ -62,17 +142,20 @@ def dump_sla_text(src_path, dst_path, tmp_dir=None):
         #     i += 1
         #     new_name = "{}-{}{}".format(no_ext_name, i, new_dot_ext)
         #     tmp_path = os.path.join(tmp_path, new_name)
-        project = ScribusProject(src_path)
+        project = ScribusProject(src_path, pages=pages)
         # write to a tmp file to ensure a crash doesn't cause a
         #   partial write to dst_path!
         with open(tmp_path, 'w') as stream:
-            print('* dumping temp file "{}"'.format(tmp_path))
+            echo1('* dumping temp file "{}"'.format(tmp_path))
             # project.root.dump_text_unsorted(stream)
-            project.root.dump_text(stream)
+            dump_project_text(project, stream, jobs=jobs,
+                              include_master=include_master,
+                              output_format=output_format,
+                              use_cache=use_cache)
         if os.path.isfile(dst_path):
-            print("* removing old %s" % repr(dst_path))
+            echo1("* removing old %s" % repr(dst_path))
             os.remove(dst_path)
-        print("* saving to %s" % repr(dst_path))
+        echo1("* saving to %s" % repr(dst_path))
         shutil.move(tmp_path, dst_path)
         # echo0("Writing json...")
         # json_name = "{}.json".format(no_ext_name)
@@ -90,10 +173,36 @@ def dump_sla_text(src_path, dst_path, tmp_dir=None):
             pass
 
 
+def watch_sla_text(src_path, dst_path, jobs=None, pages=None,
+                   include_master=False, output_format="markdown",
+                   use_cache=True):
+    """Dump the text again each time the SLA file is saved.
+
+    The output file is only replaced if the text changed (See
+    booktacular.morescribus.watch).
+
+    Args:
+        src_path (str): The SLA file.
+        dst_path (str): The file to create or replace.
+        jobs, pages, include_master, output_format, use_cache: See
+            dump_sla_text.
+    """
+    def dump(project):
+        stream = StringIO()
+        dump_project_text(project, stream, jobs=jobs,
+                          include_master=include_master,
+                          output_format=output_format, use_cache=use_cache)
+        if write_if_changed(dst_path, stream.getvalue()):
+            echo0('* updated "{}"'.format(dst_path))
+        else:
+            echo0('* the text in "{}" did not change'.format(dst_path))
+
+    return watch(src_path, dump, pages=pages)
+
+
 MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
 REPO_DIR = os.path.dirname(MODULE_DIR)
 try_file = "The Path of Resistance.sla"
-src_path = None
 
 
 def main():
@@ -102,9 +211,41 @@ def main():
     For the one that automatically uses the book, use
     dump_book1_text instead.
     """
-    if len(sys.argv) > 1:
-        if not os.path.isfile(sys.argv[1]):
-            raise FileNotFoundError(sys.argv[1])
+    parser = argparse.ArgumentParser(
+        description="Dump the text of an SLA file as Markdown (or text,"
+        " HTML or JSON Lines).",
+    )
+    parser.add_argument("src_path", nargs="?", default=None,
+                        help="SLA file (default: %s)" % repr(try_file))
+    parser.add_argument("dst_path", nargs="?", default=None,
+                        help="Output file (default: same name as SLA, with"
+                        " the extension of the format)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Sort and dump pages in this many processes"
+                        " (0: one per CPU). Off by default, since copying"
+                        " each page to a process usually takes longer than"
+                        " sorting it, so only try it for a large book on"
+                        " many CPUs.")
+    parser.add_argument("--pages", type=parse_page_ranges, default=None,
+                        help="Only load and dump these pages, counting"
+                        " from 1 (such as 40-55 or 1,3,10-12).")
+    parser.add_argument("--masters", action="store_true",
+                        help="Also dump master page objects (such as"
+                        " running headers).")
+    parser.add_argument("--format", dest="output_format",
+                        choices=DUMP_FORMATS, default="markdown",
+                        help="markdown (default), text, html or jsonl"
+                        " (one JSON object per frame).")
+    parser.add_argument("--watch", action="store_true",
+                        help="Dump again each time the SLA file is saved.")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                        help="Dump every page instead of only pages that"
+                        " changed since the last dump.")
+    args = parser.parse_args()
+    src_path = args.src_path
+    if src_path is not None:
+        if not os.path.isfile(src_path):
+            raise FileNotFoundError(src_path)
     elif os.path.isfile(try_file):
         print("* using detected %s" % repr(try_file))
         src_path = try_file
@@ -114,20 +255,28 @@ def main():
             " or specify an sla file."
             "" % repr(try_file)
         )
-    if len(sys.argv) > 2:
-        dst_path = sys.argv[2]
+    if args.dst_path is not None:
+        dst_path = args.dst_path
     else:
-        dst_dir, name = os.path.split(src_path)
-        name_no_ext, _ = os.path.splitext(name)
-        dst_name = name_no_ext + ".md"
-        dst_path = os.path.join(dst_dir, dst_name)
+        dst_path = sibling_path(src_path,
+                                WRITERS[args.output_format].extension)
+        # ^ such as book.md for book.sla.gz (not book.sla.md)
     '''
     if (sys.version_info.major >= 3) and (sys.version_info.minor >= 10):
         with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmpdir:
             tmp_path = tmpdir.name
             meld_sla(paths, tmp_path)
     '''
-    dump_sla_text(src_path, dst_path)
+    if args.watch:
+        watch_sla_text(src_path, dst_path, jobs=args.jobs, pages=args.pages,
+                       include_master=args.masters,
+                       output_format=args.output_format,
+                       use_cache=args.use_cache)
+        return 0
+    dump_sla_text(src_path, dst_path, jobs=args.jobs, pages=args.pages,
+                  include_master=args.masters,
+                  output_format=args.output_format,
+                  use_cache=args.use_cache)
     return 0
 
 
@@ -144,10 +293,7 @@ def dump_book1_text():
             "" % repr(try_file)
         )
     src_path = try_file
-    dst_dir, name = os.path.split(src_path)
-    name_no_ext, _ = os.path.splitext(name)
-    dst_name = name_no_ext + ".md"
-    dst_path = os.path.join(dst_dir, dst_name)
+    dst_path = sibling_path(src_path, WRITERS["markdown"].extension)
     '''
     if (sys.version_info.major >= 3) and (sys.version_info.minor >= 10):
         with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmpdir:
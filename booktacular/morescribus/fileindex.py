@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.fileindex
+---------------------------------
+
+List the files under a directory once (with os.scandir) so that many
+paths can be looked up without a system call for each one, such as all
+of the images cited by a large SLA file (See DirectoryIndex), or list
+only the directories of the files that are requested (See
+FileStatCache).
+'''
+from __future__ import print_function
+import os
+import posixpath
+
+from collections import OrderedDict
+
+
+def normalize_relpath(path):
+    """Get a relative path in the form used as a DirectoryIndex key.
+
+    Backslashes (from SLA files saved on Windows) become "/", and "."
+    and ".." parts are resolved.
+    """
+    path = posixpath.normpath(path.replace("\\", "/"))
+    if path == ".":
+        return ""
+    return path
+
+
+class DirectoryIndex(object):
+    """The files under a directory.
+
+    Each directory is read once with os.scandir, which gets the type of
+    each entry from the directory listing itself on most platforms, so
+    looking up a file does not stat it. Symlinks to directories are not
+    followed (so there are no loops).
+
+    Args:
+        root (str): The directory to index.
+
+    Attributes:
+        root (str): The directory that was indexed.
+        dirs (set[str]): Relative paths of the subdirectories.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.dirs = set()
+        self._entries = {}  # relative path (See normalize_relpath) to entry
+        if os.path.isdir(root):
+            self._scan()
+
+    def _scan(self):
+        pending = [""]
+        while pending:
+            rel_dir = pending.pop()
+            try:
+                iterator = os.scandir(os.path.join(self.root, rel_dir))
+            except OSError:
+                continue  # such as permission denied
+            with iterator:
+                for entry in iterator:
+                    rel_path = posixpath.join(rel_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        self.dirs.add(rel_path)
+                        pending.append(rel_path)
+                    elif entry.is_file():
+                        self._entries[rel_path] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, rel_path):
+        return normalize_relpath(rel_path) in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def has_dir(self, rel_path):
+        rel_path = normalize_relpath(rel_path)
+        return (rel_path == "") or (rel_path in self.dirs)
+
+    def stat(self, rel_path):
+        """Get the stat result of a file in the index.
+
+        The result is cached by os.DirEntry (and is free on Windows).
+
+        Returns:
+            os.stat_result: The stat result, or None if not in the index.
+        """
+        entry = self._entries.get(normalize_relpath(rel_path))
+        if entry is None:
+            return None
+        return entry.stat()
+
+    def abspath(self, rel_path):
+        return os.path.join(self.root, *normalize_relpath(rel_path).split("/"))
+
+
+class FileStatCache(object):
+    """Get the metadata of files cited by a document with one listing of
+    each directory instead of a system call (or network round trip) for
+    each file.
+
+    Each directory is read with os.scandir the first time a file in it
+    is requested (or in prefetch), then remembered. The cache is for one
+    pass such as a dump, so changes made after that are not noticed.
+
+    Args:
+        base_dir (Optional[str]): The directory that relative paths are
+            relative to (usually that of the SLA file). Defaults to the
+            current working directory.
+
+    Attributes:
+        missing (OrderedDict): Each missing path (as cited) requested
+            using add_missing, with the list of pages that cite it
+            (counting from 1, or None if not known).
+    """
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir
+        self.missing = OrderedDict()
+        self._listings = {}  # normcase of directory to {normcase name: entry}
+
+    def abspath(self, path):
+        """Get the path to a file cited in an SLA file."""
+        if os.sep != "\\":
+            path = path.replace("\\", "/")  # saved on Windows
+        if not os.path.isabs(path):
+            path = os.path.join(self.base_dir or os.getcwd(), path)
+        return os.path.normpath(path)
+
+    def _listing(self, parent):
+        key = os.path.normcase(parent)
+        listing = self._listings.get(key)
+        if listing is not None:
+            return listing
+        listing = {}
+        try:
+            with os.scandir(parent) as iterator:
+                for entry in iterator:
+                    listing[os.path.normcase(entry.name)] = entry
+        except OSError:
+            pass  # The directory is missing (so are its files).
+        self._listings[key] = listing
+        return listing
+
+    def prefetch(self, paths):
+        """List the directories of paths (such as all PFILE values)."""
+        for parent in set(os.path.dirname(self.abspath(path))
+                          for path in paths):
+            self._listing(parent)
+
+    def stat(self, path):
+        """Get the stat result of a file.
+
+        Args:
+            path (str): An absolute path or one relative to base_dir.
+
+        Returns:
+            os.stat_result: The stat result, or None if path is not a
+                file.
+        """
+        parent, name = os.path.split(self.abspath(path))
+        entry = self._listing(parent).get(os.path.normcase(name))
+        if entry is None:
+            return None
+        try:
+            if not entry.is_file():
+                return None
+            return entry.stat()
+        except OSError:
+            return None  # such as a broken symlink
+
+    def isfile(self, path):
+        return self.stat(path) is not None
+
+    def getmtime(self, path):
+        """Get the modified time of a file, or None if missing."""
+        stat = self.stat(path)
+        if stat is None:
+            return None
+        return stat.st_mtime
+
+    def add_missing(self, path, page=None):
+        """Record that path is cited (on page, counting from 1) but
+        missing."""
+        pages = self.missing.setdefault(path, [])
+        if page not in pages:
+            pages.append(page)
+
+    def update_missing(self, missing):
+        """Merge missing from another cache (such as in a worker)."""
+        for path, pages in missing.items():
+            for page in pages:
+                self.add_missing(path, page=page)
+
+    def get_missing_report(self):
+        """Get lines describing missing files for people to read.
+
+        Returns:
+            list[str]: No lines if nothing is missing.
+        """
+        if not self.missing:
+            return []
+        lines = ["missing images ({}):".format(len(self.missing))]
+        for path, pages in self.missing.items():
+            lines.append('- "{}" (pages {})'.format(path, pages))
+        return lines
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.lint
+----------------------------
+
+Check the layout of every page of an SLA (Scribus Project) file in one
+pass before a print release. The following kinds of issues are found:
+- overlap: Two frames overlap (ignoring groups, which contain others).
+- outside-safe-area: A frame extends into the margins (BORDERLEFT etc.).
+- outside-bleed: A frame extends past the bleed.
+- off-page: A frame is not on its page at all.
+- zero-size: A frame has no width or no height.
+- missing-image: The image (PFILE) of a frame does not exist (relative
+  paths are relative to the SLA file).
+- bullet-mid-paragraph, empty-list-item: A list in the text of a frame
+  is not well-formed (See validate_lists).
+
+Usage:
+# If you install booktacular you can do:
+sla-lint <file.sla> [options]
+
+Options:
+--format FORMAT  text (default) or json (machine-readable).
+--pages RANGES   Only load and check these pages, counting from 1.
+--no-masters     Do not check master page objects (running headers etc.)
+                 against objects on each page.
+--ignore KIND    Do not report this kind of issue (can be repeated).
+--watch          Check again each time the SLA file is saved (until
+                 Ctrl+C), showing the issues only if they changed.
+
+The exit code is 0 if there are no issues, otherwise 1 (so a release
+script can stop on it).
+'''
+from __future__ import print_function
+from __future__ import division
+import argparse
+import heapq
+import json
+import math
+import sys
+import os
+
+from collections import OrderedDict
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    LIST_EMPTY_ITEM,
+    LIST_MID_PARAGRAPH,
+    ScribusProject,
+    parse_page_ranges,
+    validate_lists,
+)
+from booktacular.morescribus.watch import watch
+
+OVERLAP = "overlap"
+OUTSIDE_SAFE_AREA = "outside-safe-area"
+OUTSIDE_BLEED = "outside-bleed"
+OFF_PAGE = "off-page"
+ZERO_SIZE = "zero-size"
+MISSING_IMAGE = "missing-image"
+ISSUE_KINDS = (OVERLAP, OUTSIDE_SAFE_AREA, OUTSIDE_BLEED, OFF_PAGE,
+               ZERO_SIZE, MISSING_IMAGE, LIST_MID_PARAGRAPH, LIST_EMPTY_ITEM)
+
+LINT_TAGS = ("PAGEOBJECT", "MASTEROBJECT", "FRAMEOBJECT")
+PTYPE_LINE = "5"
+PTYPE_GROUP = "12"
+
+TOLERANCE = 0.01  # points, so rounding in Scribus is not an issue.
+
+
+def get_bbox(obj):
+    """Get the bounding box of an object relative to its page.
+
+    Scribus rotates (ROT in degrees) around XPOS, YPOS, so the box
+    contains all 4 rotated corners.
+
+    Returns:
+        tuple[float]: left, top, right, bottom in points.
+    """
+    x = obj.page_x
+    y = obj.page_y
+    width = obj.width or 0.0
+    height = obj.height or 0.0
+    rotation = obj.get_float("ROT")
+    if not rotation:
+        return (x, y, x + width, y + height)
+    radians = math.radians(rotation)
+    cos_r = math.cos(radians)
+    sin_r = math.sin(radians)
+    xs = []
+    ys = []
+    for corner_x, corner_y in ((0, 0), (width, 0), (0, height),
+                               (width, height)):
+        xs.append(x + corner_x * cos_r - corner_y * sin_r)
+        ys.append(y + corner_x * sin_r + corner_y * cos_r)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _issue(kind, page, obj, bbox, **kwargs):
+    issue = OrderedDict()
+    issue['kind'] = kind
+    issue['page'] = page.number + 1  # as shown in Scribus
+    issue['ItemID'] = obj.get("ItemID")
+    issue['tagName'] = obj.tagName
+    issue['bbox'] = [round(value, 3) for value in bbox]
+    for key, value in kwargs.items():
+        issue[key] = value
+    return issue
+
+
+def _find_overlaps(page, boxes):
+    """Find overlapping boxes using a sweep line from left to right.
+
+    Only boxes whose x-ranges are still open (active) at the left edge
+    of each box are compared. Active boxes are also kept in a heap by
+    right edge, so each box is dropped once in O(log n) when the sweep
+    passes it. The cost is O(n log n) plus the number of pairs whose
+    x-ranges overlap (such as a column of frames), rather than O(n^2)
+    for every page.
+
+    Args:
+        page (ScribusPage): The page being checked.
+        boxes (list[tuple]): (bbox, obj, is_master) for each object.
+    """
+    issues = []
+    active = OrderedDict()  # index: (bbox, obj, is_master) in sweep order
+    ends = []  # heap of (right, index) of active boxes
+    for index, (bbox, obj, is_master) in enumerate(
+            sorted(boxes, key=lambda box: box[0][0])):
+        left, top, right, bottom = bbox
+        while ends and ends[0][0] <= left + TOLERANCE:
+            del active[heapq.heappop(ends)[1]]
+        for other_bbox, other, other_is_master in active.values():
+            if is_master and other_is_master:
+                continue  # The same on every page so report it once.
+            overlap_w = min(right, other_bbox[2]) - left
+            overlap_h = min(bottom, other_bbox[3]) - max(top, other_bbox[1])
+            if overlap_w > TOLERANCE and overlap_h > TOLERANCE:
+                issues.append(_issue(
+                    OVERLAP, page, obj, bbox,
+                    other=other.get("ItemID"),
+                    area=round(overlap_w * overlap_h, 3),
+                ))
+        active[index] = (bbox, obj, is_master)
+        heapq.heappush(ends, (right, index))
+    return issues
+
+
+def lint_page(page, include_master=True, file_cache=None):
+    """Check the layout of one page.
+
+    Args:
+        page (ScribusPage): A page from ScribusDocRoot after
+            collect_pages.
+        include_master (bool): Also check the objects of the page's
+            master page against objects on this page.
+        file_cache (Optional[FileStatCache]): Where to look up images.
+            Defaults to that of page.root (See
+            ScribusDocRoot.get_file_cache).
+
+    Returns:
+        list[OrderedDict]: Issues, each with 'kind' (one of
+            ISSUE_KINDS), 'page' (counting from 1), 'ItemID', 'tagName'
+            and 'bbox' (left, top, right, bottom relative to the page).
+            An overlap also has 'other' (ItemID) and 'area'. A missing
+            image also has 'pfile'. A list issue also has 'index' and
+            'text' (See validate_lists).
+    """
+    issues = []
+    if file_cache is None and page.root is not None:
+        file_cache = page.root.get_file_cache()
+    width = page.get_float('PAGEWIDTH')
+    height = page.get_float('PAGEHEIGHT')
+    margin_l, margin_t, margin_r, margin_b = page.get_margins()
+    bleed_l, bleed_t, bleed_r, bleed_b = page.get_bleeds()
+    master_ids = set()
+    if include_master and page.master is not None:
+        master_ids = set(id(obj) for obj in page.master.children)
+    boxes = []
+    for obj in page.get_children(include_master=include_master):
+        if obj.tagName not in LINT_TAGS:
+            continue
+        is_master = id(obj) in master_ids
+        bbox = get_bbox(obj)
+        left, top, right, bottom = bbox
+        if not is_master:
+            pfile = obj.get("PFILE")
+            if (pfile and (file_cache is not None)
+                    and (obj.get("isInlineImage") != "1")
+                    and not file_cache.isfile(pfile)):
+                issues.append(_issue(MISSING_IMAGE, page, obj, bbox,
+                                     pfile=pfile))
+            for problem in validate_lists(obj):
+                issues.append(_issue(problem['kind'], page, obj, bbox,
+                                     index=problem['index'],
+                                     text=problem['text']))
+            ptype = obj.get("PTYPE")
+            if ((right - left <= 0) or (bottom - top <= 0)) \
+                    and ptype != PTYPE_LINE:
+                issues.append(_issue(ZERO_SIZE, page, obj, bbox))
+                continue
+            if ((right <= 0) or (bottom <= 0) or (left >= width)
+                    or (top >= height)):
+                issues.append(_issue(OFF_PAGE, page, obj, bbox))
+                continue
+            if ((left < -bleed_l - TOLERANCE)
+                    or (top < -bleed_t - TOLERANCE)
+                    or (right > width + bleed_r + TOLERANCE)
+                    or (bottom > height + bleed_b + TOLERANCE)):
+                issues.append(_issue(OUTSIDE_BLEED, page, obj, bbox))
+            elif ((left < margin_l - TOLERANCE)
+                    or (top < margin_t - TOLERANCE)
+                    or (right > width - margin_r + TOLERANCE)
+                    or (bottom > height - margin_b + TOLERANCE)):
+                issues.append(_issue(OUTSIDE_SAFE_AREA, page, obj, bbox))
+        if obj.get("PTYPE") != PTYPE_GROUP:
+            boxes.append((bbox, obj, is_master))
+    issues.extend(_find_overlaps(page, boxes))
+    return issues
+
+
+def lint_root(root, include_master=True, ignore=None):
+    """Check every page of a parsed document in one pass.
+
+    Args:
+        root (ScribusDocRoot): The parsed document.
+        include_master (bool): See lint_page.
+        ignore (Optional[Iterable[str]]): Kinds of issues to leave out.
+
+    Returns:
+        list[OrderedDict]: Issues in page order (See lint_page).
+    """
+    if root._pages is None:
+        root.collect_pages()
+    ignore = set(ignore) if ignore else set()
+    file_cache = root.get_file_cache(refresh=True)
+    issues = []
+    for number in sorted(root._pages.keys()):
+        if number < 0:
+            continue  # Not visible (See ScribusDocRoot.visible_pages).
+        for issue in lint_page(root._pages[number],
+                               include_master=include_master,
+                               file_cache=file_cache):
+            if issue['kind'] not in ignore:
+                issues.append(issue)
+    return issues
+
+
+def lint_sla(path, pages=None, include_master=True, ignore=None):
+    """Load an SLA file and check its layout (See lint_root).
+
+    Args:
+        pages (Optional[set[int]]): Only load and check these pages
+            (0-based, See parse_page_ranges).
+    """
+    project = ScribusProject(path, pages=pages)
+    return lint_root(project.root, include_master=include_master,
+                     ignore=ignore)
+
+
+def format_issue(issue):
+    """Get a single line describing an issue for people to read."""
+    line = ("page {page}: {kind}: {tagName} ItemID={ItemID} bbox={bbox}"
+            "".format(**issue))
+    if issue['kind'] == OVERLAP:
+        line += " overlaps ItemID={} (area={})".format(issue['other'],
+                                                       issue['area'])
+    elif issue['kind'] == MISSING_IMAGE:
+        line += ' PFILE="{}"'.format(issue['pfile'])
+    elif issue['kind'] in (LIST_MID_PARAGRAPH, LIST_EMPTY_ITEM):
+        line += " at {}: {}".format(issue['index'], repr(issue['text']))
+    return line
+
+
+def write_issues(issues, stream, output_format="text"):
+    if output_format == "json":
+        json.dump(issues, stream, indent=2)
+        stream.write("\n")
+        return
+    for issue in issues:
+        stream.write(format_issue(issue) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the layout of an SLA file.",
+    )
+    parser.add_argument("src_path", help="SLA file")
+    parser.add_argument("--format", choices=["text", "json"],
+                        default="text", dest="output_format",
+                        help="Output format (json is machine-readable).")
+    parser.add_argument("--pages", type=parse_page_ranges, default=None,
+                        help="Only load and check these pages, counting"
+                        " from 1 (such as 40-55 or 1,3,10-12).")
+    parser.add_argument("--no-masters", action="store_true",
+                        help="Do not check master page objects.")
+    parser.add_argument("--ignore", action="append", choices=ISSUE_KINDS,
+                        default=[],
+                        help="Do not report this kind of issue.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Check again each time the file is saved.")
+    args = parser.parse_args()
+    if not os.path.isfile(args.src_path):
+        echo0('Error: "{}" does not exist.'.format(args.src_path))
+        return 2
+    if args.watch:
+        prev_issues = [None]
+
+        def check(project):
+            issues = lint_root(project.root,
+                               include_master=not args.no_masters,
+                               ignore=args.ignore)
+            if issues == prev_issues[0]:
+                echo0("The {} issue(s) did not change.".format(len(issues)))
+                return
+            prev_issues[0] = issues
+            write_issues(issues, sys.stdout, output_format=args.output_format)
+            echo0("{} issue(s)".format(len(issues)))
+
+        watch(args.src_path, check, pages=args.pages)
+        return 0
+    issues = lint_sla(args.src_path, pages=args.pages,
+                      include_master=not args.no_masters,
+                      ignore=args.ignore)
+    write_issues(issues, sys.stdout, output_format=args.output_format)
+    echo1("{} issue(s)".format(len(issues)))
+    if issues:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
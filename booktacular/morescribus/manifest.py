@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.manifest
+--------------------------------
+
+Keep a manifest of the images (assets) cited by an SLA (Scribus
+Project) file beside it as <name>.assets.json. It records the path,
+size, modified time and content hash (SHA-256) of each asset, and which
+images the SLA file cites as of its own size and modified time.
+
+On the next run, an asset with the same size and modified time is not
+hashed again, and the SLA file is not lexed again if it did not change,
+so bundling a large book again is almost instant. Assets with the same
+hash under different names are duplicates (See find_duplicates).
+'''
+from __future__ import print_function
+import hashlib
+import io
+import json
+import os
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    atomic_write,
+    sibling_path,
+)
+from booktacular.morescribus.fileindex import (
+    normalize_relpath,
+)
+
+MANIFEST_SUFFIX = ".assets.json"
+MANIFEST_VERSION = 1
+HASH_JOBS = 4  # Threads (hashlib does not hold the GIL for large data).
+
+
+def manifest_path(sla_path):
+    return sibling_path(sla_path, MANIFEST_SUFFIX)
+
+
+def hash_file(path):
+    """Get the SHA-256 of a file's content, reading it in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        while True:
+            block = stream.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stamp(stat):
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class AssetManifest(object):
+    """The assets of one SLA file (See the module documentation).
+
+    Args:
+        sla_path (str): The SLA file. The manifest is loaded from beside
+            it if present.
+
+    Attributes:
+        path (str): The manifest file.
+        assets (OrderedDict): Each relative path (See normalize_relpath)
+            with 'size', 'mtime_ns' and 'sha256'.
+        hashed (int): How many files were hashed (not in the manifest
+            or changed) since loading.
+    """
+    def __init__(self, sla_path):
+        self.sla_path = sla_path
+        self.path = manifest_path(sla_path)
+        self.base_dir = os.path.dirname(os.path.abspath(sla_path))
+        self.assets = OrderedDict()
+        self.hashed = 0
+        self._sla = None
+        self._references = None
+        self._inline_images = None
+        if os.path.isfile(self.path):
+            self.load()
+
+    def load(self):
+        with io.open(self.path, 'r', encoding="utf-8") as stream:
+            data = json.load(stream, object_pairs_hook=OrderedDict)
+        if data.get('version') != MANIFEST_VERSION:
+            echo0('Warning: ignoring "{}" (version {})'
+                  ''.format(self.path, data.get('version')))
+            return
+        self.assets = data.get('assets', OrderedDict())
+        self._sla = data.get('sla')
+        self._references = data.get('references')
+        self._inline_images = data.get('inline_images')
+
+    def save(self):
+        data = OrderedDict()
+        data['version'] = MANIFEST_VERSION
+        data['sla'] = self._sla
+        data['references'] = self._references
+        data['inline_images'] = self._inline_images
+        data['assets'] = self.assets
+        atomic_write(self.path,
+                     lambda stream: stream.write(json.dumps(data, indent=2)))
+
+    def _sla_stamp(self):
+        stat = os.stat(self.sla_path)
+        stamp = OrderedDict()
+        stamp['size'], stamp['mtime_ns'] = _stamp(stat)
+        return stamp
+
+    def get_references(self):
+        """Get the images cited by the SLA file as of the last run.
+
+        Returns:
+            tuple(OrderedDict, list): See
+                bundle.collect_image_references, or None if the SLA file
+                changed (or there is no manifest yet).
+        """
+        if (self._references is None) or (self._sla is None):
+            return None
+        if self._sla != self._sla_stamp():
+            return None
+        return (OrderedDict(self._references),
+                list(self._inline_images or []))
+
+    def set_references(self, references, inline_images):
+        """Record the images cited by the SLA file as it is now."""
+        self._references = OrderedDict(references)
+        self._inline_images = list(inline_images)
+        self._sla = self._sla_stamp()
+
+    def update(self, rel_paths, jobs=None):
+        """Hash any new or changed assets.
+
+        Args:
+            rel_paths (Iterable[str]): Paths relative to the directory of
+                the SLA file. Missing files are removed from the manifest.
+            jobs (Optional[int]): Threads for hashing (default:
+                HASH_JOBS).
+
+        Returns:
+            int: How many files were hashed.
+        """
+        stale = []
+        for rel_path in rel_paths:
+            rel_path = normalize_relpath(rel_path)
+            try:
+                stat = os.stat(os.path.join(self.base_dir, rel_path))
+            except OSError:
+                self.assets.pop(rel_path, None)
+                continue
+            size, mtime_ns = _stamp(stat)
+            entry = self.assets.get(rel_path)
+            if ((entry is not None) and (entry.get('size') == size)
+                    and (entry.get('mtime_ns') == mtime_ns)):
+                continue
+            stale.append((rel_path, size, mtime_ns))
+        paths = [os.path.join(self.base_dir, rel_path)
+                 for rel_path, _, _ in stale]
+        with ThreadPoolExecutor(max_workers=jobs or HASH_JOBS) as executor:
+            hashes = list(executor.map(hash_file, paths))
+        for (rel_path, size, mtime_ns), sha256 in zip(stale, hashes):
+            entry = OrderedDict()
+            entry['size'] = size
+            entry['mtime_ns'] = mtime_ns
+            entry['sha256'] = sha256
+            self.assets[rel_path] = entry
+        self.hashed += len(stale)
+        return len(stale)
+
+    def find_duplicates(self, rel_paths=None):
+        """Find assets that have the same content.
+
+        Args:
+            rel_paths (Optional[Iterable[str]]): Only consider these
+                (such as the ones the SLA file cites), in this order.
+
+        Returns:
+            OrderedDict: Each hash that more than one asset has, with
+                the list of their relative paths (the first one is the
+                canonical copy).
+        """
+        if rel_paths is None:
+            rel_paths = list(self.assets.keys())
+        by_hash = OrderedDict()
+        done = set()
+        for rel_path in rel_paths:
+            rel_path = normalize_relpath(rel_path)
+            entry = self.assets.get(rel_path)
+            if (entry is None) or (rel_path in done):
+                continue
+            done.add(rel_path)
+            by_hash.setdefault(entry['sha256'], []).append(rel_path)
+        return OrderedDict(
+            (sha256, paths) for sha256, paths in by_hash.items()
+            if len(paths) > 1
+        )
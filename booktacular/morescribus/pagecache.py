@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.pagecache
+---------------------------------
+
+Keep the dumped frames of each page (See ScribusPage.get_frames) beside
+an SLA file as <name>.pages.json so the next dump only sorts and
+renders pages that changed. Each page is keyed by a hash (See
+PageCache.get_key) of its objects and story text (without positions in
+the file, so editing one page does not change the key of later pages),
+its origin, its size and margins (which decide which objects span
+columns, See ReadingOrder.sort), the reading order settings, master
+page objects if included, and the modified time of its images (since
+the image lines show the date).
+
+The frames are the same for every output format (See
+booktacular.morescribus.writers), so one cache serves them all.
+'''
+from __future__ import print_function
+import hashlib
+import io
+import json
+import os
+
+from collections import OrderedDict
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    atomic_write,
+    sibling_path,
+)
+
+PAGE_CACHE_SUFFIX = ".pages.json"
+PAGE_CACHE_VERSION = 1
+# ^ Increase this whenever the dumper's output for the same page changes.
+PAGE_SETTINGS = ("PAGEWIDTH", "PAGEHEIGHT", "BORDERLEFT", "BORDERTOP",
+                 "BORDERRIGHT", "BORDERBOTTOM")
+# ^ DOCUMENT attributes used by a page that does not set its own (See
+#   ScribusPage.get_float).
+
+
+def page_cache_path(sla_path):
+    return sibling_path(sla_path, PAGE_CACHE_SUFFIX)
+
+
+def _json_default(value):
+    # such as ReadingOrder
+    return vars(value)
+
+
+class PageCache(object):
+    """The dumped frames of each page of one SLA file.
+
+    Args:
+        sla_path (str): The SLA file. The cache is loaded from beside it
+            if present.
+
+    Attributes:
+        path (str): The cache file.
+        pages (OrderedDict): Each page number (0-based, as a str) with
+            'key', 'frames' and 'missing' (See FileStatCache.missing).
+        hits (int): Pages that were used from the cache since loading.
+        misses (int): Pages that had to be dumped since loading.
+    """
+    def __init__(self, sla_path):
+        self.sla_path = sla_path
+        self.path = page_cache_path(sla_path)
+        self.pages = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._changed = False
+        if os.path.isfile(self.path):
+            self.load()
+
+    def load(self):
+        try:
+            with io.open(self.path, 'r', encoding="utf-8") as stream:
+                data = json.load(stream, object_pairs_hook=OrderedDict)
+        except ValueError as ex:
+            echo0('Warning: ignoring "{}" ({})'.format(self.path, ex))
+            return
+        if data.get('version') != PAGE_CACHE_VERSION:
+            echo0('Warning: ignoring "{}" (version {})'
+                  ''.format(self.path, data.get('version')))
+            return
+        self.pages = data.get('pages', OrderedDict())
+
+    def save(self):
+        """Write the cache if any page was added or changed."""
+        if not self._changed:
+            return
+        data = OrderedDict()
+        data['version'] = PAGE_CACHE_VERSION
+        data['pages'] = self.pages
+        atomic_write(self.path,
+                     lambda stream: stream.write(json.dumps(data)))
+        self._changed = False
+
+    def get_key(self, page, include_master=False, file_cache=None,
+                reading_order=None):
+        """Hash everything that affects the dumped frames of a page.
+
+        Call this before sorting the page, since sorting changes the
+        order of page.children.
+
+        Args:
+            page (ScribusPage): A page of a parsed SLA file.
+            include_master (bool): See ScribusDocRoot.dump_text.
+            file_cache (Optional[FileStatCache]): Where to look up the
+                modified time of images.
+            reading_order (Optional[ReadingOrder]): The settings that
+                will be used to sort the page.
+
+        Returns:
+            str: A SHA-256 hex digest.
+        """
+        children = page.get_children(include_master=include_master)
+        images = []
+        if file_cache is not None:
+            for child in children:
+                image = child.get("PFILE")
+                if image:
+                    images.append([image, file_cache.getmtime(image)])
+        page_attributes = None
+        if page.page_node is not None:
+            page_attributes = page.page_node.attributes
+        defaults = None
+        if page.document is not None:
+            defaults = [page.document.attributes.get(name)
+                        for name in PAGE_SETTINGS]
+        data = [
+            PAGE_CACHE_VERSION,
+            page.number,
+            page.get_origin(),
+            page_attributes,
+            defaults,
+            include_master,
+            reading_order,
+            images,
+            [child.to_dict(enable_locations=False) for child in children],
+        ]
+        digest = hashlib.sha256()
+        digest.update(json.dumps(data, default=_json_default)
+                      .encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, number, key):
+        """Get the frames of a page if the key did not change.
+
+        Args:
+            number (int): The page number (0-based).
+            key (str): The result of get_key for the page.
+
+        Returns:
+            tuple(list, OrderedDict): frames and missing images, or None
+                if the page is not cached with the same key.
+        """
+        entry = self.pages.get(str(number))
+        if entry is None or entry['key'] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['frames'], OrderedDict(entry['missing'])
+
+    def set(self, number, key, frames, missing):
+        """Store the frames of a page (See get)."""
+        entry = OrderedDict()
+        entry['key'] = key
+        entry['frames'] = frames
+        entry['missing'] = list(missing.items())
+        self.pages[str(number)] = entry
+        self._changed = True
+
+    def prune(self, numbers):
+        """Remove pages except numbers, such as after pages were deleted.
+
+        Args:
+            numbers (Iterable[int]): Page numbers (0-based) to keep.
+        """
+        keep = set(str(number) for number in numbers)
+        for number in list(self.pages.keys()):
+            if number not in keep:
+                del self.pages[number]
+                self._changed = True
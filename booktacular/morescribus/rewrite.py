@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.rewrite
+-------------------------------
+
+Change attributes of many tags in an SLA (Scribus Project) file in one
+pass, such as to move images to another directory or rename a style.
+Each rule is (tagName, attribute, predicate, transform), and all rules
+are applied while the file is lexed once. Tags that are not changed are
+copied from the original data.
+
+Example:
+    rules = [
+        prefix_rule("PFILE", "images/", "../images/"),
+        rename_rule("PARENT", "Body", "Body Text"),
+        rename_rule("NAME", "Body", "Body Text", tagName="STYLE"),
+    ]
+    rewrite_sla("book.sla", rules, backup=True)
+
+Usage:
+# If you install booktacular you can do:
+sla-rewrite <file.sla> [options]
+
+Options:
+--prefix ATTRIBUTE OLD NEW  Change the start of ATTRIBUTE values from OLD
+                            to NEW (can be repeated).
+--rename ATTRIBUTE OLD NEW  Change ATTRIBUTE values that are OLD to NEW
+                            (can be repeated).
+-o, --output PATH           Save to PATH instead of replacing the file.
+--backup                    Keep the previous version as <file.sla>.bak.
+'''
+from __future__ import print_function
+import argparse
+import html
+import sys
+import os
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    SGMLLexer,
+    SGMLNode,
+    atomic_write,
+    is_gzip,
+    no_progress,
+    open_sla,
+    write_slice,
+)
+
+
+def escape_value(value):
+    """Escape an attribute value as Scribus does (such as & as &amp;)."""
+    return (value.replace("&", "&amp;").replace("<", "&lt;")
+            .replace(">", "&gt;").replace('"', "&quot;"))
+
+
+class RewriteRule(object):
+    """Change one attribute of matching tags.
+
+    Values are unescaped for predicate and transform (such as "Q&A"
+    instead of "Q&amp;A" as in the file), and the new value is escaped
+    again (See escape_value).
+
+    Args:
+        tagName (Optional[str]): Only change this kind of tag (None for
+            any kind).
+        attribute (str): The attribute to change.
+        predicate (Optional[Callable]): Gets the old value and returns
+            True if the rule applies. If None, the rule applies to every
+            tag that has the attribute.
+        transform (Callable): Gets the old value and returns the new
+            value.
+    """
+    def __init__(self, tagName, attribute, predicate, transform):
+        self.tagName = tagName
+        self.attribute = attribute
+        self.predicate = predicate
+        self.transform = transform
+
+    def apply(self, attributes):
+        """Change the attribute in attributes if the rule applies.
+
+        Returns:
+            bool: True if the value was changed.
+        """
+        raw_value = attributes.get(self.attribute)
+        if raw_value is None:
+            return False
+        value = html.unescape(raw_value)
+        if (self.predicate is not None) and not self.predicate(value):
+            return False
+        new_value = self.transform(value)
+        if new_value == value:
+            return False  # Keep the original escaping.
+        attributes[self.attribute] = escape_value(new_value)
+        return True
+
+
+def prefix_rule(attribute, old, new, tagName=None):
+    """Make a rule that changes the start of values from old to new."""
+    return RewriteRule(
+        tagName,
+        attribute,
+        lambda value: value.startswith(old),
+        lambda value: new + value[len(old):],
+    )
+
+
+def rename_rule(attribute, old, new, tagName=None):
+    """Make a rule that changes values that are old to new."""
+    return RewriteRule(
+        tagName,
+        attribute,
+        lambda value: value == old,
+        lambda value: new,
+    )
+
+
+class Rewriter(object):
+    """Apply many rules in one pass.
+
+    Rules are grouped by tagName once, so each tag is only checked
+    against the rules for its tagName and the rules for any tagName.
+
+    Args:
+        rules (Iterable[Union[RewriteRule,tuple]]): Rules, or tuples of
+            RewriteRule arguments (tagName, attribute, predicate,
+            transform).
+
+    Attributes:
+        rules (list[RewriteRule]): The rules in the order given.
+        counts (list[int]): How many values each rule changed.
+    """
+    def __init__(self, rules):
+        self.rules = []
+        for rule in rules:
+            if not isinstance(rule, RewriteRule):
+                rule = RewriteRule(*rule)
+            self.rules.append(rule)
+        self.counts = [0] * len(self.rules)
+        self._by_tag = {}
+        self._any_tag = []
+        for index, rule in enumerate(self.rules):
+            if rule.tagName is None:
+                self._any_tag.append((index, rule))
+            else:
+                self._by_tag.setdefault(rule.tagName, []).append(
+                    (index, rule))
+
+    def rewrite_attributes(self, tagName, attributes):
+        """Apply the rules for tagName to attributes.
+
+        Rules are applied in order, so a rule gets the value from any
+        earlier rule for the same attribute.
+
+        Returns:
+            bool: True if any value was changed.
+        """
+        changed = False
+        rules = self._by_tag.get(tagName)
+        if rules and self._any_tag:
+            rules = sorted(rules + self._any_tag, key=lambda pair: pair[0])
+        elif not rules:
+            rules = self._any_tag
+        for index, rule in rules:
+            if rule.apply(attributes):
+                self.counts[index] += 1
+                changed = True
+        return changed
+
+    def rewrite(self, data, stream):
+        """Write data with the rules applied (one pass over the tags).
+
+        Args:
+            data (str): The content of an SLA file.
+            stream: A text stream such as an open file.
+
+        Returns:
+            int: The number of tags that were changed.
+        """
+        lexer = SGMLLexer(data)
+        pos = 0
+        changed = 0
+        while True:
+            try:
+                chunkdef = lexer.next(cb_progress=no_progress)
+            except StopIteration:
+                break
+            if chunkdef['context'] != SGMLLexer.START:
+                continue
+            if not self.rewrite_attributes(chunkdef['tagName'],
+                                           chunkdef['attributes']):
+                continue
+            write_slice(stream, data, pos, chunkdef['start'])
+            stream.write(lexer.chunk_from_chunkdef(chunkdef))
+            pos = chunkdef['end']
+            changed += 1
+        write_slice(stream, data, pos, len(data))
+        return changed
+
+    def rewrite_tree(self, root):
+        """Apply the rules to a loaded document instead.
+
+        Save the project afterward to write the changes (See
+        ScribusProject.save).
+
+        Args:
+            root (SGMLElementTree): The parsed document.
+
+        Returns:
+            int: The number of tags that were changed.
+        """
+        changed = 0
+        pending = list(root.children)
+        while pending:
+            node = pending.pop()
+            if not isinstance(node, SGMLNode):
+                continue
+            if self.rewrite_attributes(node.tagName, node.attributes):
+                changed += 1
+            pending.extend(node.children)
+        return changed
+
+
+def rewrite_sla(src_path, rules, dst_path=None, backup=False):
+    """Apply rules to an SLA file and save it atomically.
+
+    A gzipped file (.sla.gz) is saved gzipped.
+
+    Args:
+        src_path (str): The SLA file.
+        rules (Iterable[Union[RewriteRule,tuple]]): See Rewriter.
+        dst_path (Optional[str]): Where to save. Defaults to src_path.
+        backup (bool): Keep the previous version as dst_path + ".bak".
+
+    Returns:
+        Rewriter: The rewriter, which has the count for each rule.
+    """
+    if dst_path is None:
+        dst_path = src_path
+    rewriter = Rewriter(rules)
+    with open_sla(src_path) as stream:
+        data = stream.read()
+    changed = atomic_write(
+        dst_path,
+        lambda outs: rewriter.rewrite(data, outs),
+        backup=backup,
+        compress=is_gzip(src_path),
+    )
+    echo1('Changed {} tag(s) in "{}"'.format(changed, dst_path))
+    return rewriter
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Change attributes of many tags in an SLA file.",
+    )
+    parser.add_argument("src_path", help="SLA file")
+    parser.add_argument("--prefix", nargs=3, action="append", default=[],
+                        metavar=("ATTRIBUTE", "OLD", "NEW"),
+                        help="Change the start of values from OLD to NEW.")
+    parser.add_argument("--rename", nargs=3, action="append", default=[],
+                        metavar=("ATTRIBUTE", "OLD", "NEW"),
+                        help="Change values that are OLD to NEW.")
+    parser.add_argument("-o", "--output", default=None, dest="dst_path",
+                        help="Save to this path instead of replacing the"
+                        " file.")
+    parser.add_argument("--backup", action="store_true",
+                        help="Keep the previous version as .bak.")
+    args = parser.parse_args()
+    if not os.path.isfile(args.src_path):
+        echo0('Error: "{}" does not exist.'.format(args.src_path))
+        return 2
+    rules = [prefix_rule(*values) for values in args.prefix]
+    rules += [rename_rule(*values) for values in args.rename]
+    if not rules:
+        echo0("Error: Specify at least one --prefix or --rename.")
+        return 2
+    rewriter = rewrite_sla(args.src_path, rules, dst_path=args.dst_path,
+                           backup=args.backup)
+    for rule, count in zip(rewriter.rules, rewriter.counts):
+        echo0("{}: {} value(s) changed".format(rule.attribute, count))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.stats
+-----------------------------
+
+Count the characters, words, paragraphs, frames and images of an SLA
+(Scribus Project) file per page and per paragraph style (PARENT of each
+para or trail), in one pass of the lexer (the document tree is not
+built). Master page objects are not counted.
+
+The counts are kept beside the SLA file as <name>.stats.json with the
+size and modified time of the SLA file, so asking again is instant
+until the file is saved.
+
+Usage:
+# If you install booktacular you can do:
+sla-stats <file.sla> [options]
+
+Options:
+--pages RANGES   Only total these pages, counting from 1 (such as 40-55
+                 or 1,3,10-12).
+--by BY          page, style or total (default: page and style).
+--format FORMAT  text (default) or json.
+--no-cache       Count again even if the SLA file did not change.
+'''
+from __future__ import print_function
+import argparse
+import html
+import io
+import json
+import os
+import sys
+
+from collections import OrderedDict
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    SGMLLexer,
+    atomic_write,
+    no_progress,
+    open_sla,
+    parse_page_ranges,
+    sibling_path,
+)
+from booktacular.morescribus.text import (
+    SOFT_HYPHEN,
+    WORD_PATTERN,
+)
+
+STATS_SUFFIX = ".stats.json"
+STATS_VERSION = 1
+# ^ Increase this whenever collect_stats counts differently.
+
+COUNTS = ("characters", "words", "paragraphs", "frames", "images")
+NO_STYLE = "Default Paragraph Style"  # as shown in Scribus
+FRAME_TAGS = ("PAGEOBJECT",)
+PARAGRAPH_END_TAGS = ("para", "trail")
+BREAK_TAGS = {
+    'tab': "\t",
+    'breakline': "\n",
+    'breakcol': "\n",
+    'breakframe': "\n",
+}
+
+
+def stats_path(sla_path):
+    return sibling_path(sla_path, STATS_SUFFIX)
+
+
+def new_counts():
+    return OrderedDict((name, 0) for name in COUNTS)
+
+
+def add_counts(total, counts):
+    """Add each of counts to total (in place)."""
+    for name in COUNTS:
+        total[name] += counts[name]
+    return total
+
+
+class DocumentStats(object):
+    """Counts of one SLA file (See collect_stats).
+
+    Attributes:
+        pages (OrderedDict): Each page number (counting from 1, or None
+            for the pasteboard) with its counts (See COUNTS).
+        styles (OrderedDict): Each paragraph style (NO_STYLE if not set)
+            with its counts. A frame or image is counted for each style
+            it contains, and images have no style.
+    """
+    def __init__(self):
+        self.pages = OrderedDict()
+        self.styles = OrderedDict()
+
+    def get_page(self, page):
+        counts = self.pages.get(page)
+        if counts is None:
+            counts = new_counts()
+            self.pages[page] = counts
+        return counts
+
+    def get_style(self, style):
+        counts = self.styles.get(style)
+        if counts is None:
+            counts = new_counts()
+            self.styles[style] = counts
+        return counts
+
+    def get_total(self, pages=None):
+        """Add up the counts of all pages or of some pages.
+
+        Args:
+            pages (Optional[set[int]]): Page numbers counting from 1.
+                The pasteboard is only included if pages is None.
+        """
+        total = new_counts()
+        for page, counts in self.pages.items():
+            if pages is None or page in pages:
+                add_counts(total, counts)
+        return total
+
+    def to_dict(self):
+        data = OrderedDict()
+        data['pages'] = [[page, counts] for page, counts
+                         in self.pages.items()]
+        data['styles'] = [[style, counts] for style, counts
+                          in self.styles.items()]
+        data['total'] = self.get_total()
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        stats = DocumentStats()
+        for page, counts in data['pages']:
+            stats.pages[page] = counts
+        for style, counts in data['styles']:
+            stats.styles[style] = counts
+        return stats
+
+
+def collect_stats(data):
+    """Count the text of an SLA file in one pass of the lexer.
+
+    Args:
+        data (str): The content of an SLA file.
+
+    Returns:
+        DocumentStats: The counts, with pages in order of page number
+            and styles in order of appearance.
+    """
+    stats = DocumentStats()
+    lexer = SGMLLexer(data, skip_blank=True)
+    frames = []  # stack of [page, has_text, styles] (groups nest)
+    parts = []  # text of the current paragraph
+    while True:
+        try:
+            chunkdef = lexer.next(cb_progress=no_progress)
+        except StopIteration:
+            break
+        context = chunkdef['context']
+        if context == SGMLLexer.END:
+            if chunkdef['tagName'] in FRAME_TAGS and frames:
+                _end_frame(stats, frames.pop())
+                del parts[:]
+            continue
+        if context != SGMLLexer.START:
+            continue
+        tag = chunkdef['tagName']
+        attributes = chunkdef['attributes']
+        if tag in FRAME_TAGS:
+            page = None
+            own_page = attributes.get('OwnPage')
+            if own_page is not None and int(own_page) >= 0:
+                page = int(own_page) + 1
+                # ^ pages start at 0 here, but not in GUI.
+            if attributes.get('PFILE') or (
+                    attributes.get('isInlineImage') == "1"):
+                stats.get_page(page)['images'] += 1
+            frame = [page, False, set()]
+            if chunkdef.get('self_closer') is None:
+                frames.append(frame)
+            else:
+                _end_frame(stats, frame)
+            continue
+        if not frames:
+            continue  # such as ITEXT of a MASTEROBJECT
+        if tag == "ITEXT":
+            value = attributes.get('CH')
+            if value:
+                if "&" in value:
+                    value = html.unescape(value)
+                parts.append(value)
+        elif tag in BREAK_TAGS:
+            parts.append(BREAK_TAGS[tag])
+        elif tag in PARAGRAPH_END_TAGS:
+            _end_paragraph(stats, frames[-1],
+                           attributes.get('PARENT') or NO_STYLE, parts)
+            del parts[:]
+    stats.pages = OrderedDict(sorted(
+        stats.pages.items(),
+        key=lambda item: -1 if item[0] is None else item[0],
+    ))
+    return stats
+
+
+def _end_paragraph(stats, frame, style, parts):
+    text = "".join(parts).replace(SOFT_HYPHEN, "")
+    if not text.strip():
+        return  # An empty paragraph is only spacing.
+    counts = new_counts()
+    counts['characters'] = len(text)
+    counts['words'] = len(WORD_PATTERN.findall(text))
+    counts['paragraphs'] = 1
+    add_counts(stats.get_page(frame[0]), counts)
+    add_counts(stats.get_style(style), counts)
+    frame[1] = True
+    frame[2].add(style)
+
+
+def _end_frame(stats, frame):
+    page, has_text, styles = frame
+    if not has_text:
+        return
+    stats.get_page(page)['frames'] += 1
+    for style in styles:
+        stats.get_style(style)['frames'] += 1
+
+
+def _sla_stamp(sla_path):
+    stat = os.stat(sla_path)
+    stamp = OrderedDict()
+    stamp['size'] = stat.st_size
+    stamp['mtime_ns'] = stat.st_mtime_ns
+    return stamp
+
+
+def get_stats(sla_path, use_cache=True):
+    """Get the counts of an SLA file, counting only if it changed.
+
+    Args:
+        sla_path (str): The SLA file.
+        use_cache (bool): Use and update <name>.stats.json beside the
+            SLA file (See the module docstring). If it cannot be saved,
+            only a warning is shown.
+
+    Returns:
+        DocumentStats: See collect_stats.
+    """
+    path = stats_path(sla_path)
+    stamp = _sla_stamp(sla_path)
+    if use_cache and os.path.isfile(path):
+        try:
+            with io.open(path, 'r', encoding="utf-8") as stream:
+                data = json.load(stream, object_pairs_hook=OrderedDict)
+        except ValueError as ex:
+            echo0('Warning: ignoring "{}" ({})'.format(path, ex))
+            data = {}
+        if (data.get('version') == STATS_VERSION
+                and data.get('sla') == stamp):
+            return DocumentStats.from_dict(data)
+    with open_sla(sla_path) as stream:
+        stats = collect_stats(stream.read())
+    if use_cache:
+        data = OrderedDict()
+        data['version'] = STATS_VERSION
+        data['sla'] = stamp
+        data.update(stats.to_dict())
+        try:
+            atomic_write(path, lambda stream: stream.write(
+                json.dumps(data, indent=2)))
+        except OSError as ex:
+            # such as if the directory of the SLA file is read-only
+            echo0('Warning: The counts could not be saved to "{}" ({})'
+                  ''.format(path, ex))
+    return stats
+
+
+def write_table(stream, title, rows):
+    """Write counts as a table for people to read.
+
+    Args:
+        title (str): The heading of the first column.
+        rows (Iterable[tuple]): Each name and its counts.
+    """
+    rows = [(str(name), counts) for name, counts in rows]
+    width = max([len(title)] + [len(name) for name, _ in rows])
+    stream.write(title.ljust(width)
+                 + "".join(" {:>10}".format(name) for name in COUNTS)
+                 + "\n")
+    for name, counts in rows:
+        stream.write(name.ljust(width)
+                     + "".join(" {:>10}".format(counts[key])
+                               for key in COUNTS)
+                     + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Count the text of an SLA file per page and style.",
+    )
+    parser.add_argument("src_path", help="SLA file")
+    parser.add_argument("--pages", type=parse_page_ranges, default=None,
+                        help="Only total these pages, counting from 1"
+                        " (such as 40-55 or 1,3,10-12).")
+    parser.add_argument("--by", choices=["page", "style", "total"],
+                        default=None,
+                        help="Only show this (default: page and style).")
+    parser.add_argument("--format", choices=["text", "json"],
+                        default="text", dest="output_format",
+                        help="Output format.")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                        help="Count again even if the SLA file did not"
+                        " change.")
+    args = parser.parse_args()
+    stats = get_stats(args.src_path, use_cache=args.use_cache)
+    pages = None
+    if args.pages is not None:
+        pages = set(number + 1 for number in args.pages)
+        # ^ parse_page_ranges is 0-based, but pages here count from 1.
+    page_rows = [("pasteboard" if page is None else page, counts)
+                 for page, counts in stats.pages.items()
+                 if pages is None or page in pages]
+    total = stats.get_total(pages=pages)
+    if args.output_format == "json":
+        data = OrderedDict()
+        if args.by in (None, "page"):
+            data['pages'] = [[page, counts] for page, counts in page_rows]
+        if args.by in (None, "style"):
+            data['styles'] = [[style, counts] for style, counts
+                              in stats.styles.items()]
+        data['total'] = total
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    if args.by in (None, "page"):
+        write_table(sys.stdout, "page", page_rows)
+        sys.stdout.write("\n")
+    if args.by in (None, "style"):
+        if pages is not None:
+            echo0("Note: Counts by style are for the whole document.")
+        write_table(sys.stdout, "style", stats.styles.items())
+        sys.stdout.write("\n")
+    write_table(sys.stdout, "", [("total", total)])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.styles
+------------------------------
+
+Resolve the effective formatting (such as FONT and FONTSIZE) of text in
+an SLA (Scribus Project) file. Paragraph styles (STYLE, named by NAME)
+inherit from PARENT and may base their text on a character style
+(CPARENT). Character styles (CHARSTYLE, named by CNAME) inherit from
+CPARENT. Paragraphs (para or trail after their text) name a paragraph
+style with PARENT, and runs of text (ITEXT) may name a character style
+with CPARENT. Both may also have local attributes.
+
+From lowest to highest precedence, the formatting of a run is:
+1. The default character style (DefaultStyle="1").
+2. The character style of the paragraph style (CPARENT), then the
+   paragraph style and its ancestors (the default paragraph style
+   first).
+3. Local attributes of the paragraph (para or trail).
+4. The character style of the run (CPARENT) and its ancestors (except
+   the default character style, which is already the base).
+5. Local attributes of the run (ITEXT).
+
+A StyleTable is built once per document (See
+ScribusDocRoot.get_style_table), and each style and each combination of
+styles and local attributes is only resolved once. So far only
+get_font_report uses it: the records of sla-dump still have the raw
+paragraph style (PARENT), since pages dumped in worker processes or
+from the page cache do not have the styles of the document.
+'''
+from __future__ import print_function
+from collections import OrderedDict
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+PARAGRAPH_STYLE_TAG = "STYLE"
+CHARACTER_STYLE_TAG = "CHARSTYLE"
+DEFAULT_PARAGRAPH_STYLE = "Default Paragraph Style"
+DEFAULT_CHARACTER_STYLE = "Default Character Style"
+# ^ Names used if no style has DefaultStyle="1".
+
+REFERENCE_ATTRIBUTES = ("NAME", "CNAME", "PARENT", "CPARENT", "DefaultStyle")
+# ^ Name styles rather than format text, so they are not resolved.
+TEXT_ATTRIBUTES = ("CH",)  # content of ITEXT, not formatting
+PARAGRAPH_TAGS = ("para", "trail")
+
+
+def _formatting(attributes, exclude=()):
+    return [(key, value) for key, value in attributes.items()
+            if key not in REFERENCE_ATTRIBUTES and key not in exclude]
+
+
+def _overrides_key(attributes, exclude=()):
+    if not attributes:
+        return ()
+    return tuple(sorted(_formatting(attributes, exclude=exclude)))
+
+
+class StyleTable(object):
+    """The paragraph and character styles of one document.
+
+    Resolved attributes are shared by every caller asking for the same
+    combination, so copy them before changing them.
+
+    Args:
+        paragraph_styles (OrderedDict): Each NAME with the attributes of
+            its STYLE.
+        character_styles (OrderedDict): Each CNAME with the attributes of
+            its CHARSTYLE.
+        default_paragraph_style (Optional[str]): Defaults to the STYLE
+            with DefaultStyle="1", else DEFAULT_PARAGRAPH_STYLE.
+        default_character_style (Optional[str]): Defaults to the
+            CHARSTYLE with DefaultStyle="1", else DEFAULT_CHARACTER_STYLE.
+    """
+    def __init__(self, paragraph_styles, character_styles,
+                 default_paragraph_style=None, default_character_style=None):
+        self.paragraph_styles = paragraph_styles
+        self.character_styles = character_styles
+        if default_paragraph_style is None:
+            default_paragraph_style = self._find_default(
+                paragraph_styles, DEFAULT_PARAGRAPH_STYLE)
+        if default_character_style is None:
+            default_character_style = self._find_default(
+                character_styles, DEFAULT_CHARACTER_STYLE)
+        self.default_paragraph_style = default_paragraph_style
+        self.default_character_style = default_character_style
+        self._paragraph_cache = {}
+        self._character_cache = {}
+        self._chain_cache = {}  # See _chain_formatting
+        self._cache = {}
+
+    @staticmethod
+    def _find_default(styles, name):
+        for style_name, attributes in styles.items():
+            if attributes.get("DefaultStyle") == "1":
+                return style_name
+        return name
+
+    @staticmethod
+    def from_root(root):
+        """Collect the styles of a parsed document.
+
+        Args:
+            root (ScribusDocRoot): The parsed document.
+        """
+        paragraph_styles = OrderedDict()
+        character_styles = OrderedDict()
+        document = root.get_root()
+        for child in getattr(document, 'children', None) or ():
+            tag = getattr(child, 'tagName', None)
+            if tag == PARAGRAPH_STYLE_TAG:
+                name = child.attributes.get("NAME")
+                if name is not None:
+                    paragraph_styles[name] = child.attributes
+            elif tag == CHARACTER_STYLE_TAG:
+                name = child.attributes.get("CNAME")
+                if name is not None:
+                    character_styles[name] = child.attributes
+        return StyleTable(paragraph_styles, character_styles)
+
+    def _chain(self, styles, name, parent_attribute, kind):
+        """Get the attributes of a style and its ancestors, root first."""
+        chain = []
+        seen = set()
+        while name is not None and name not in seen:
+            attributes = styles.get(name)
+            if attributes is None:
+                echo1("Warning: There is no {} style named {}"
+                      "".format(kind, repr(name)))
+                break
+            seen.add(name)
+            chain.append(attributes)
+            name = attributes.get(parent_attribute)
+        if name is not None and name in seen:
+            echo0("Warning: The {} style {} inherits from itself"
+                  "".format(kind, repr(name)))
+        chain.reverse()
+        return chain
+
+    def get_character_style(self, name=None):
+        """Get the effective attributes of a character style.
+
+        Args:
+            name (Optional[str]): The CNAME (the default character style
+                if None).
+
+        Returns:
+            OrderedDict: Formatting attributes (shared, See StyleTable).
+        """
+        if name is None:
+            name = self.default_character_style
+        resolved = self._character_cache.get(name)
+        if resolved is not None:
+            return resolved
+        resolved = OrderedDict()
+        chain = self._chain(self.character_styles, name, "CPARENT",
+                            "character")
+        default = self.default_character_style
+        if (name != default) and (not chain
+                                  or chain[0].get("CNAME") != default):
+            resolved.update(self.get_character_style())
+            # ^ Every character style is based on the default.
+        for attributes in chain:
+            resolved.update(_formatting(attributes))
+        self._character_cache[name] = resolved
+        return resolved
+
+    def get_paragraph_style(self, name=None):
+        """Get the effective attributes of a paragraph style.
+
+        Args:
+            name (Optional[str]): The NAME (the default paragraph style
+                if None).
+
+        Returns:
+            OrderedDict: Formatting attributes, including those of the
+                text (shared, See StyleTable).
+        """
+        if name is None:
+            name = self.default_paragraph_style
+        resolved = self._paragraph_cache.get(name)
+        if resolved is not None:
+            return resolved
+        chain = self._chain(self.paragraph_styles, name, "PARENT",
+                            "paragraph")
+        default = self.default_paragraph_style
+        if (name != default) and (not chain
+                                  or chain[0].get("NAME") != default):
+            chain = (self._chain(self.paragraph_styles, default, "PARENT",
+                                 "paragraph")
+                     + chain)
+        character_style = None
+        for attributes in chain:
+            character_style = attributes.get("CPARENT", character_style)
+        resolved = OrderedDict(self.get_character_style(character_style))
+        for attributes in chain:
+            resolved.update(_formatting(attributes))
+        self._paragraph_cache[name] = resolved
+        return resolved
+
+    def resolve(self, paragraph_style=None, character_style=None,
+                paragraph_overrides=None, overrides=None):
+        """Get the effective attributes of text (See the module docstring).
+
+        Args:
+            paragraph_style (Optional[str]): The PARENT of the paragraph.
+            character_style (Optional[str]): The CPARENT of the run.
+            paragraph_overrides (Optional[dict]): Attributes of the para
+                or trail (style names are ignored).
+            overrides (Optional[dict]): Attributes of the ITEXT (style
+                names and CH are ignored).
+
+        Returns:
+            OrderedDict: Formatting attributes (shared, See StyleTable).
+        """
+        key = (paragraph_style, character_style,
+               _overrides_key(paragraph_overrides),
+               _overrides_key(overrides, exclude=TEXT_ATTRIBUTES))
+        resolved = self._cache.get(key)
+        if resolved is not None:
+            return resolved
+        resolved = OrderedDict(self.get_paragraph_style(paragraph_style))
+        resolved.update(key[2])
+        if character_style is not None:
+            resolved.update(
+                (name, value) for name, value
+                in self._chain_formatting(character_style))
+        resolved.update(key[3])
+        self._cache[key] = resolved
+        return resolved
+
+    def _chain_formatting(self, character_style):
+        # Only the attributes set by the style and its ancestors (not the
+        #   default character style) override the paragraph style.
+        items = self._chain_cache.get(character_style)
+        if items is not None:
+            return items
+        formatting = OrderedDict()
+        for attributes in self._chain(self.character_styles,
+                                      character_style, "CPARENT",
+                                      "character"):
+            if attributes.get("CNAME") == self.default_character_style:
+                continue
+            formatting.update(_formatting(attributes))
+        items = tuple(formatting.items())
+        self._chain_cache[character_style] = items
+        return items
+
+    def get_runs(self, node):
+        """Get each run of text in a frame with its effective attributes.
+
+        The paragraph style of a run is only known at the end of its
+        paragraph (the para or trail after the text), or else from the
+        PARENT of the DefaultStyle of the story.
+
+        Args:
+            node (SGMLNode): A PAGEOBJECT or other frame with StoryText.
+
+        Returns:
+            list[tuple(str, OrderedDict)]: The text (CH) of each ITEXT
+                and its attributes (shared, See StyleTable), in order.
+        """
+        runs = []
+        for story in getattr(node, 'children', None) or ():
+            if getattr(story, 'tagName', None) != "StoryText":
+                continue
+            story_style = None
+            pending = []  # ITEXT nodes of the current paragraph
+            for child in story.children:
+                tag = getattr(child, 'tagName', None)
+                if tag == "DefaultStyle":
+                    story_style = child.attributes.get("PARENT")
+                elif tag == "ITEXT":
+                    pending.append(child)
+                elif tag in PARAGRAPH_TAGS:
+                    style = child.attributes.get("PARENT") or story_style
+                    self._add_runs(runs, pending, style, child.attributes)
+                    pending = []
+            if pending:
+                self._add_runs(runs, pending, story_style, None)
+        return runs
+
+    def _add_runs(self, runs, text_nodes, paragraph_style,
+                  paragraph_overrides):
+        for text_node in text_nodes:
+            runs.append((
+                text_node.attributes.get("CH") or "",
+                self.resolve(paragraph_style=paragraph_style,
+                             character_style=text_node.attributes.get(
+                                 "CPARENT"),
+                             paragraph_overrides=paragraph_overrides,
+                             overrides=text_node.attributes),
+            ))
+
+
+def get_font_report(root, children=None):
+    """Count the characters set in each font and size.
+
+    Args:
+        root (ScribusDocRoot): The parsed document.
+        children (Optional[Iterable[SGMLNode]]): Only count these frames
+            (such as the children of some pages). Defaults to every
+            page object (See collect_pages).
+
+    Returns:
+        OrderedDict: (FONT, FONTSIZE) with the number of characters, most
+            used first.
+    """
+    style_table = root.get_style_table()
+    if children is None:
+        if root._pages is None:
+            root.collect_pages()
+        children = [child for page in root.visible_pages()
+                    for child in page.children]
+    counts = OrderedDict()
+    for child in children:
+        for text, attributes in style_table.get_runs(child):
+            key = (attributes.get("FONT"), attributes.get("FONTSIZE"))
+            counts[key] = counts.get(key, 0) + len(text)
+    return OrderedDict(sorted(counts.items(), key=lambda item: -item[1]))
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.text
+----------------------------
+
+Split the text of SLA (Scribus Project) files into words the same way
+everywhere, such as for the full-text index (See
+booktacular.morescribus.textindex) and word counts (See
+booktacular.morescribus.stats). This module only uses the standard
+library so that importing it is cheap.
+'''
+from __future__ import print_function
+import re
+
+SOFT_HYPHEN = u"\u00ad"
+WORD_PATTERN = re.compile(u"[\\w\u00ad]+(?:['\u2019][\\w\u00ad]+)*",
+                          re.UNICODE)
+# ^ Keep soft hyphens (often inside of words in Scribus) and
+#   apostrophes inside of words (such as "don't").
+
+
+def normalize_term(word):
+    """Get the term for a word (case and soft hyphens are ignored)."""
+    word = word.replace(SOFT_HYPHEN, "")
+    if hasattr(word, 'casefold'):
+        return word.casefold()
+    return word.lower()  # Python 2
+
+
+def tokenize(text):
+    """Split text into terms.
+
+    Returns:
+        list[tuple(str, int)]: Each term (See normalize_term) and its
+            offset in text.
+    """
+    return [(normalize_term(match.group(0)), match.start())
+            for match in WORD_PATTERN.finditer(text)]
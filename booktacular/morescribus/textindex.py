@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.textindex
+---------------------------------
+
+Keep a full-text (inverted) index of the text (CH) of many SLA (Scribus
+Project) files, so words and phrases can be found in every book at once
+without parsing or dumping any of them again.
+
+The index is an SQLite database of each word (term, lowercase) with the
+file, page, ItemID and offset in the text of the frame (See
+ScribusPage.get_frames). A file is only parsed again if its size or
+modified time changed and then its content hash (SHA-256) changed, so
+updating the index of a collection of books is almost instant. Queries
+use the term index of the database, so they do not load the whole
+index.
+
+Usage:
+# If you install booktacular you can do:
+sla-index <file, directory or glob>... [options]
+sla-grep <words> [<file, directory or glob>...] [options]
+
+Options:
+--index PATH      The index file (default: sla-index.sqlite in the
+                  current directory).
+-j, --jobs N      Parse N changed files at a time (default: one per CPU).
+--prune           (sla-index) Remove files that no longer exist.
+-w, --words       (sla-grep) Find frames with all of the words anywhere
+                  instead of the words as a phrase.
+--format FORMAT   (sla-grep) text (default) or json.
+
+Directories are searched recursively for .sla and .sla.gz files. If
+sla-grep is given files, they are indexed first if they changed and
+only they are searched. The exit code of sla-grep is 1 if nothing was
+found.
+'''
+from __future__ import print_function
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    ScribusProject,
+)
+from booktacular.morescribus.batch import find_sla_files
+from booktacular.morescribus.manifest import hash_file
+from booktacular.morescribus.text import tokenize
+
+INDEX_NAME = "sla-index.sqlite"
+INDEX_VERSION = 1
+# ^ Increase this whenever the schema or tokenize changes.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER,
+    page INTEGER,
+    item_id TEXT,
+    text TEXT
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT,
+    frame_id INTEGER,
+    position INTEGER,
+    offset INTEGER
+);
+CREATE INDEX IF NOT EXISTS postings_term ON postings (term);
+CREATE INDEX IF NOT EXISTS postings_frame ON postings (frame_id);
+CREATE INDEX IF NOT EXISTS frames_file ON frames (file_id);
+"""
+
+
+def read_frames(path):
+    """Load an SLA file and get the text of each frame with text.
+
+    This runs in a worker process when indexing several files (See
+    TextIndex.update).
+
+    Returns:
+        tuple(str, list): The title of the document (None if not set),
+            and (page, ItemID, text) for each frame in reading order,
+            where page counts from 1 and text is the same as in
+            ScribusPage.get_frames.
+    """
+    root = ScribusProject(path).root
+    root.collect_pages()
+    title = root.get_root().attributes.get('TITLE')
+    frames = []
+    for page in root.visible_pages():
+        page.sort_children_spatially(reading_order=root.reading_order)
+        # ^ so matches on a page are in reading order
+        for record, _ in page.get_frames():
+            if record['text']:
+                frames.append((record['page'], record['ItemID'],
+                               record['text']))
+    return title, frames
+
+
+def get_line(text, offset):
+    """Get the line of text (paragraph) that contains offset."""
+    start = text.rfind("\n", 0, offset) + 1
+    end = text.find("\n", offset)
+    if end < 0:
+        end = len(text)
+    return text[start:end].strip()
+
+
+class TextIndex(object):
+    """An index of the text of many SLA files (See the module docstring).
+
+    Args:
+        path (str): The index file. It is created if it does not exist,
+            and started over if it is from another INDEX_VERSION.
+
+    Attributes:
+        path (str): The index file.
+        connection (sqlite3.Connection): The open database (See close).
+    """
+    def __init__(self, path=INDEX_NAME):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or int(row[0]) != INDEX_VERSION:
+            if row is not None:
+                echo0('Warning: rebuilding "{}" (version {})'
+                      ''.format(path, row[0]))
+            self.clear()
+
+    def close(self):
+        self.connection.close()
+
+    def clear(self):
+        """Remove every file from the index."""
+        with self.connection:
+            self.connection.execute("DELETE FROM postings")
+            self.connection.execute("DELETE FROM frames")
+            self.connection.execute("DELETE FROM files")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value)"
+                " VALUES ('version', ?)", (str(INDEX_VERSION),))
+
+    def get_paths(self):
+        """Get the absolute path of each indexed file."""
+        return [row[0] for row in self.connection.execute(
+            "SELECT path FROM files ORDER BY path")]
+
+    def _remove(self, file_id):
+        self.connection.execute(
+            "DELETE FROM postings WHERE frame_id IN"
+            " (SELECT id FROM frames WHERE file_id = ?)", (file_id,))
+        self.connection.execute("DELETE FROM frames WHERE file_id = ?",
+                                (file_id,))
+        self.connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def remove(self, path):
+        """Remove a file from the index (if present)."""
+        row = self.connection.execute(
+            "SELECT id FROM files WHERE path = ?",
+            (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return False
+        with self.connection:
+            self._remove(row[0])
+        return True
+
+    def prune(self):
+        """Remove files that no longer exist from the index.
+
+        Returns:
+            list[str]: The paths that were removed.
+        """
+        removed = [path for path in self.get_paths()
+                   if not os.path.isfile(path)]
+        for path in removed:
+            self.remove(path)
+        return removed
+
+    def _add(self, path, stat, sha256, title, frames):
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "INSERT INTO files (path, size, mtime_ns, sha256, title)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, sha256, title))
+        file_id = cursor.lastrowid
+        for page, item_id, text in frames:
+            cursor.execute(
+                "INSERT INTO frames (file_id, page, item_id, text)"
+                " VALUES (?, ?, ?, ?)", (file_id, page, item_id, text))
+            frame_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO postings (term, frame_id, position, offset)"
+                " VALUES (?, ?, ?, ?)",
+                [(term, frame_id, position, offset)
+                 for position, (term, offset) in enumerate(tokenize(text))])
+
+    def update(self, paths, jobs=None):
+        """Index files that are new or changed since they were indexed.
+
+        Args:
+            paths (Iterable[str]): SLA files (See find_sla_files).
+            jobs (Optional[int]): Number of processes for parsing changed
+                files. Defaults to one per CPU. If 1, files are parsed
+                in this process.
+
+        Returns:
+            OrderedDict: 'indexed' and 'unchanged' lists of paths.
+        """
+        result = OrderedDict()
+        result['indexed'] = []
+        result['unchanged'] = []
+        todo = []
+        for path in paths:
+            key = os.path.abspath(path)
+            stat = os.stat(key)
+            row = self.connection.execute(
+                "SELECT id, size, mtime_ns, sha256 FROM files"
+                " WHERE path = ?", (key,)).fetchone()
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            if row is not None and (row[1], row[2]) == stamp:
+                result['unchanged'].append(path)
+                continue
+            sha256 = hash_file(key)
+            if row is not None and row[3] == sha256:
+                with self.connection:
+                    self.connection.execute(
+                        "UPDATE files SET size = ?, mtime_ns = ?"
+                        " WHERE id = ?",
+                        (stat.st_size, stat.st_mtime_ns, row[0]))
+                result['unchanged'].append(path)
+                continue
+            todo.append((path, key, stat, sha256, row))
+        if not todo:
+            return result
+        if not jobs:
+            jobs = os.cpu_count() or 1
+        jobs = min(jobs, len(todo))
+        keys = [key for _, key, _, _, _ in todo]
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                parsed = list(executor.map(read_frames, keys))
+        else:
+            parsed = [read_frames(key) for key in keys]
+        with self.connection:
+            for (path, key, stat, sha256, row), (title, frames) in zip(
+                    todo, parsed):
+                if row is not None:
+                    self._remove(row[0])
+                self._add(key, stat, sha256, title, frames)
+                result['indexed'].append(path)
+        return result
+
+    def _get_postings(self, term, file_ids=None):
+        rows = self.connection.execute(
+            "SELECT postings.frame_id, postings.position, postings.offset,"
+            " frames.file_id FROM postings"
+            " JOIN frames ON frames.id = postings.frame_id"
+            " WHERE postings.term = ?", (term,))
+        if file_ids is None:
+            return [row[:3] for row in rows]
+        return [row[:3] for row in rows if row[3] in file_ids]
+
+    def search(self, query, words=False, paths=None):
+        """Find a phrase (or all of its words) in the indexed files.
+
+        Args:
+            query (str): One or more words. Case, punctuation and soft
+                hyphens are ignored.
+            words (bool): Find frames that have all of the words in any
+                order instead of the words as a phrase.
+            paths (Optional[Iterable[str]]): Only search these files.
+
+        Returns:
+            list[OrderedDict]: 'path', 'title', 'page' (counting from 1),
+                'ItemID', 'offset' (in the text of the frame) and 'line'
+                (the paragraph) of each match, in the order of the
+                files, pages and frames.
+        """
+        terms = [term for term, _ in tokenize(query)]
+        if not terms:
+            return []
+        file_ids = None
+        if paths is not None:
+            file_ids = set()
+            for path in paths:
+                row = self.connection.execute(
+                    "SELECT id FROM files WHERE path = ?",
+                    (os.path.abspath(path),)).fetchone()
+                if row is not None:
+                    file_ids.add(row[0])
+        postings = {}
+        for term in set(terms):
+            postings[term] = self._get_postings(term, file_ids=file_ids)
+        if words:
+            frame_ids = None
+            for term in terms:
+                term_frames = set(row[0] for row in postings[term])
+                if frame_ids is None:
+                    frame_ids = term_frames
+                else:
+                    frame_ids &= term_frames
+            first = OrderedDict()
+            for frame_id, _, offset in sorted(postings[terms[0]]):
+                if frame_id in frame_ids and frame_id not in first:
+                    first[frame_id] = offset
+            matches = list(first.items())
+        else:
+            following = [set((row[0], row[1]) for row in postings[term])
+                         for term in terms[1:]]
+            matches = sorted(
+                (frame_id, offset)
+                for frame_id, position, offset in postings[terms[0]]
+                if all((frame_id, position + index) in found
+                       for index, found in enumerate(following, 1))
+            )
+        return self._get_results(matches)
+
+    def _get_results(self, matches):
+        results = []
+        frames = {}
+        for frame_id, offset in matches:
+            frame = frames.get(frame_id)
+            if frame is None:
+                frame = self.connection.execute(
+                    "SELECT files.path, files.title, frames.page,"
+                    " frames.item_id, frames.text FROM frames"
+                    " JOIN files ON files.id = frames.file_id"
+                    " WHERE frames.id = ?", (frame_id,)).fetchone()
+                frames[frame_id] = frame
+            result = OrderedDict()
+            result['path'] = frame[0]
+            result['title'] = frame[1]
+            result['page'] = frame[2]
+            result['ItemID'] = frame[3]
+            result['offset'] = offset
+            result['line'] = get_line(frame[4], offset)
+            results.append(result)
+        results.sort(key=lambda result: (result['path'], result['page']))
+        # ^ stable, so frames stay in the order they were indexed
+        return results
+
+
+def format_match(result):
+    """Get a single line describing a match (like grep) for people."""
+    return "{}:{}:{}: {}".format(result['path'], result['page'],
+                                 result['ItemID'], result['line'])
+
+
+def index_main():
+    parser = argparse.ArgumentParser(
+        description="Update the full-text index of SLA files.",
+    )
+    parser.add_argument("paths", nargs="+",
+                        help="SLA files, directories or glob patterns")
+    parser.add_argument("--index", default=INDEX_NAME,
+                        help="The index file (default: %(default)s).")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Parse this many changed files at a time"
+                        " (default: one per CPU).")
+    parser.add_argument("--prune", action="store_true",
+                        help="Remove files that no longer exist.")
+    args = parser.parse_args()
+    paths = find_sla_files(args.paths)
+    if not paths:
+        echo0("Error: No SLA files were found in {}.".format(args.paths))
+        return 2
+    text_index = TextIndex(args.index)
+    try:
+        if args.prune:
+            for path in text_index.prune():
+                echo0("* removed {}".format(path))
+        result = text_index.update(paths, jobs=args.jobs)
+    finally:
+        text_index.close()
+    for path in result['indexed']:
+        echo0("* indexed {}".format(path))
+    echo0("{} indexed, {} unchanged"
+          "".format(len(result['indexed']), len(result['unchanged'])))
+    return 0
+
+
+def grep_main():
+    parser = argparse.ArgumentParser(
+        description="Find words or a phrase in indexed SLA files.",
+    )
+    parser.add_argument("query", help="One or more words")
+    parser.add_argument("paths", nargs="*",
+                        help="Only search these SLA files, directories or"
+                        " glob patterns (indexed first if changed).")
+    parser.add_argument("--index", default=INDEX_NAME,
+                        help="The index file (default: %(default)s).")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Parse this many changed files at a time"
+                        " (default: one per CPU).")
+    parser.add_argument("-w", "--words", action="store_true",
+                        help="Find frames with all of the words in any"
+                        " order instead of the phrase.")
+    parser.add_argument("--format", choices=["text", "json"],
+                        default="text", dest="output_format",
+                        help="Output format.")
+    args = parser.parse_args()
+    paths = None
+    if args.paths:
+        paths = find_sla_files(args.paths)
+        if not paths:
+            echo0("Error: No SLA files were found in {}."
+                  "".format(args.paths))
+            return 2
+    text_index = TextIndex(args.index)
+    try:
+        if paths is not None:
+            text_index.update(paths, jobs=args.jobs)
+        results = text_index.search(args.query, words=args.words,
+                                    paths=paths)
+    finally:
+        text_index.close()
+    if args.output_format == "json":
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for result in results:
+            print(format_match(result))
+    if not results:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(grep_main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.toc
+---------------------------
+
+Get the table of contents (objects marked with the TOC ItemAttribute in
+Scribus) of an SLA file as Markdown, JSON or a PDF outline.
+
+Usage:
+# If you install booktacular you can do:
+sla-toc <file.sla> [options]
+
+Options:
+--format FORMAT  markdown (default), json, or outline (JSON list of
+                 [level, title, page] as used by PyMuPDF's set_toc).
+--pdf PDF        Set the bookmarks of an exported PDF file to the table
+                 of contents (requires PyMuPDF).
+--watch          Update the output (or PDF) each time the SLA file is
+                 saved and the table of contents changed (until Ctrl+C).
+'''
+from __future__ import print_function
+import argparse
+import json
+import sys
+import os
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    ScribusProject,
+)
+from booktacular.morescribus.watch import watch
+
+
+def get_toc(root):
+    """Get the table of contents of a parsed document.
+
+    Args:
+        root (ScribusDocRoot): The parsed document.
+
+    Returns:
+        list[OrderedDict]: See ScribusDocRoot.get_toc.
+    """
+    return root.get_toc()
+
+
+def toc_to_outline(entries):
+    """Convert entries to a PDF outline.
+
+    The level of each entry is limited to one more than the previous
+    one, since a PDF outline cannot skip levels.
+
+    Returns:
+        list[list]: [level, title, page] for each entry (the format of
+            PyMuPDF's Document.set_toc).
+    """
+    outline = []
+    prev_level = 0
+    for entry in entries:
+        level = max(1, min(entry['level'], prev_level + 1))
+        outline.append([level, entry['title'], entry['page']])
+        prev_level = level
+    return outline
+
+
+def toc_to_markdown(entries):
+    """Convert entries to a nested Markdown list with page numbers."""
+    lines = []
+    for level, title, page in toc_to_outline(entries):
+        lines.append("{}- {} (p. {})".format("  " * (level - 1), title, page))
+    return "\n".join(lines) + "\n"
+
+
+def write_toc(entries, stream, output_format="markdown"):
+    if output_format == "json":
+        json.dump(entries, stream, indent=2)
+        stream.write("\n")
+    elif output_format == "outline":
+        json.dump(toc_to_outline(entries), stream)
+        stream.write("\n")
+    else:
+        stream.write(toc_to_markdown(entries))
+
+
+def set_pdf_outline(pdf_path, entries):
+    """Replace the bookmarks of a PDF file with the table of contents."""
+    import fitz  # PyMuPDF (only required for this feature)
+    doc = fitz.open(pdf_path)
+    try:
+        doc.set_toc(toc_to_outline(entries))
+        doc.saveIncr()
+    finally:
+        doc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Get the table of contents of an SLA file.",
+    )
+    parser.add_argument("src_path", help="SLA file")
+    parser.add_argument("--format", choices=["markdown", "json", "outline"],
+                        default="markdown", dest="output_format",
+                        help="Output format.")
+    parser.add_argument("--pdf", default=None,
+                        help="Set the bookmarks of this PDF file.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Update each time the SLA file is saved.")
+    args = parser.parse_args()
+    if not os.path.isfile(args.src_path):
+        echo0('Error: "{}" does not exist.'.format(args.src_path))
+        return 2
+    if args.watch:
+        prev_entries = [None]
+
+        def update(project):
+            entries = get_toc(project.root)
+            if entries == prev_entries[0]:
+                echo0("The table of contents did not change.")
+                return
+            prev_entries[0] = entries
+            if args.pdf:
+                set_pdf_outline(args.pdf, entries)
+                echo0('Set {} bookmark(s) in "{}"'
+                      ''.format(len(entries), args.pdf))
+            else:
+                write_toc(entries, sys.stdout,
+                          output_format=args.output_format)
+
+        watch(args.src_path, update)
+        return 0
+    entries = get_toc(ScribusProject(args.src_path).root)
+    if args.pdf:
+        set_pdf_outline(args.pdf, entries)
+        echo0('Set {} bookmark(s) in "{}"'.format(len(entries), args.pdf))
+    else:
+        write_toc(entries, sys.stdout, output_format=args.output_format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.transfer
+--------------------------------
+
+Put a file at another path by moving, copying, hard linking, cloning
+(reflink, copy-on-write) or symlinking it, such as to make a
+self-contained release folder of a book with large images. If a mode
+is not possible (such as a hard link to another filesystem, or a clone
+on a filesystem that cannot clone), the next mode in FALLBACKS is used,
+ending with a copy.
+
+Copies use os.copy_file_range or os.sendfile where available so the
+data does not pass through Python, otherwise a large buffer.
+'''
+from __future__ import print_function
+import os
+import shutil
+import sys
+
+MOVE = "move"
+COPY = "copy"
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+SYMLINK = "symlink"
+TRANSFER_MODES = (MOVE, COPY, HARDLINK, REFLINK, SYMLINK)
+
+FALLBACKS = {
+    HARDLINK: REFLINK,
+    REFLINK: COPY,
+    SYMLINK: COPY,
+}
+
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl (from linux/fs.h) to clone a file
+
+
+def _copy_range(src_fd, dst_fd, size):
+    """Copy in the kernel, or return False if not supported.
+
+    Raises:
+        OSError: If only part of the file could be copied (such as if
+            the file got shorter while copying).
+    """
+    use_sendfile = False
+    if not hasattr(os, 'copy_file_range'):
+        if not (hasattr(os, 'sendfile')
+                and sys.platform.startswith("linux")):
+            return False
+        # ^ Only Linux can sendfile to a regular file.
+        use_sendfile = True
+    offset = 0
+    try:
+        while offset < size:
+            count = min(COPY_BUFFER_SIZE, size - offset)
+            if use_sendfile:
+                sent = os.sendfile(dst_fd, src_fd, offset, count)
+            else:
+                sent = os.copy_file_range(src_fd, dst_fd, count)
+            if sent == 0:
+                break
+            offset += sent
+    except OSError:
+        if offset == 0:
+            return False  # such as not supported by the filesystem
+        raise
+    if offset < size:
+        if offset == 0:
+            return False  # such as a filesystem where it copies nothing
+        raise OSError("Only {} of {} bytes could be copied (the file may"
+                      " have been changed)".format(offset, size))
+    return True
+
+
+def copy_file(src, dst):
+    """Copy a file's content and metadata (like shutil.copy2).
+
+    Returns:
+        str: dst
+    """
+    with open(src, 'rb') as src_stream:
+        size = os.fstat(src_stream.fileno()).st_size
+        with open(dst, 'wb') as dst_stream:
+            if not _copy_range(src_stream.fileno(), dst_stream.fileno(),
+                               size):
+                src_stream.seek(0)
+                shutil.copyfileobj(src_stream, dst_stream,
+                                   COPY_BUFFER_SIZE)
+    shutil.copystat(src, dst)
+    return dst
+
+
+def reflink_file(src, dst):
+    """Clone a file so both share the data until one is changed.
+
+    Raises:
+        OSError: If cloning is not supported (such as on ext4 or on
+            another filesystem than src).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("Cloning files requires fcntl (not on {})"
+                      "".format(sys.platform))
+    with open(src, 'rb') as src_stream:
+        with open(dst, 'wb') as dst_stream:
+            try:
+                fcntl.ioctl(dst_stream.fileno(), FICLONE,
+                            src_stream.fileno())
+            except OSError:
+                dst_stream.close()
+                os.remove(dst)
+                raise
+    shutil.copystat(src, dst)
+    return dst
+
+
+def _symlink(src, dst):
+    target = os.path.relpath(os.path.abspath(src),
+                             os.path.dirname(os.path.abspath(dst)))
+    os.symlink(target, dst)
+
+
+def _transfer_once(src, dst, mode):
+    if mode == MOVE:
+        shutil.move(src, dst, copy_function=copy_file)
+    elif mode == COPY:
+        copy_file(src, dst)
+    elif mode == HARDLINK:
+        os.link(src, dst)
+    elif mode == REFLINK:
+        reflink_file(src, dst)
+    elif mode == SYMLINK:
+        _symlink(src, dst)
+    else:
+        raise ValueError("mode={} (expected one of {})"
+                         "".format(repr(mode), TRANSFER_MODES))
+
+
+def transfer(src, dst, mode=MOVE):
+    """Put src at dst using mode, or else its fallbacks.
+
+    An existing file at dst is replaced.
+
+    Args:
+        src (str): An existing file.
+        dst (str): The new path (the directory must exist).
+        mode (str): One of TRANSFER_MODES.
+
+    Returns:
+        str: The mode that worked (See FALLBACKS).
+    """
+    if mode not in TRANSFER_MODES:
+        raise ValueError("mode={} (expected one of {})"
+                         "".format(repr(mode), TRANSFER_MODES))
+    if os.path.lexists(dst) and (mode != MOVE):
+        if os.path.samefile(src, dst):
+            return mode  # already there, such as linked before
+        os.remove(dst)
+    while True:
+        try:
+            _transfer_once(src, dst, mode)
+            return mode
+        except (OSError, NotImplementedError):
+            if mode not in FALLBACKS:
+                raise
+            mode = FALLBACKS[mode]
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.watch
+-----------------------------
+
+Run a tool again each time an SLA (Scribus Project) file is saved, such
+as to keep the Markdown from sla-dump current while editing. This is
+used by the --watch option of sla-dump, sla-lint and sla-toc.
+
+The file is polled (os.stat), which works on every platform and network
+drive. A change is only handled once the file has stopped changing for
+the debounce time, since Scribus may write the file in several steps
+(or save repeatedly). A save that does not change the content (by hash)
+does not run the tool at all.
+'''
+from __future__ import print_function
+import hashlib
+import io
+import os
+import sys
+import time
+import traceback
+
+from booktacular.find_hierosoft import hierosoft  # noqa: F401
+# ^ also works for submodules since changes sys.path
+
+from hierosoft import (  # noqa: F401
+    echo0,
+    echo1,
+)
+
+from booktacular.morescribus import (
+    ScribusProject,
+    atomic_write,
+)
+
+WATCH_INTERVAL = 0.25  # seconds between checks
+WATCH_DEBOUNCE = 0.5  # seconds the file must be unchanged
+
+
+class FileWatcher(object):
+    """Detect when a file was changed then stopped changing.
+
+    Args:
+        path (str): The file to watch.
+        interval (Optional[float]): Seconds between checks (See wait).
+            Defaults to WATCH_INTERVAL.
+        debounce (Optional[float]): Seconds that a changed file must stay
+            the same before it is considered saved. Defaults to
+            WATCH_DEBOUNCE.
+        clock (Optional[Callable]): Get the time in seconds. Defaults to
+            time.monotonic.
+        sleep (Optional[Callable]): Wait a number of seconds. Defaults to
+            time.sleep. Tests can pass a fake clock and sleep so nothing
+            depends on real time.
+    """
+    def __init__(self, path, interval=None, debounce=None, clock=None,
+                 sleep=None):
+        self.path = path
+        self.interval = WATCH_INTERVAL if interval is None else interval
+        self.debounce = WATCH_DEBOUNCE if debounce is None else debounce
+        self.clock = time.monotonic if clock is None else clock
+        self.sleep = time.sleep if sleep is None else sleep
+        self._signature = self.get_signature()
+        self._pending = None  # signature not handled yet
+        self._pending_time = None
+
+    def get_signature(self):
+        """Get the modified time and size, or None if missing (such as
+        while a program replaces the file)."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def changed(self):
+        """Check the file once.
+
+        Returns:
+            bool: True if the file was changed and then stayed the same
+                for the debounce time (once per change).
+        """
+        signature = self.get_signature()
+        now = self.clock()
+        if signature != (self._pending or self._signature):
+            self._pending = signature
+            self._pending_time = now
+            return False
+        if self._pending is None:
+            return False
+        if now - self._pending_time < self.debounce:
+            return False
+        self._signature = self._pending
+        self._pending = None
+        return self._signature is not None
+
+    def wait(self):
+        """Wait until changed (See changed)."""
+        while not self.changed():
+            self.sleep(self.interval)
+
+
+def write_if_changed(path, text):
+    """Replace a text file only if the content would change.
+
+    Then editors and diff tools that have the file open only reload it
+    when there is something new.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    if os.path.isfile(path):
+        with io.open(path, 'r', encoding="utf-8", newline="") as stream:
+            if stream.read() == text:
+                return False
+    atomic_write(path, lambda stream: stream.write(text))
+    return True
+
+
+def watch(path, callback, pages=None, interval=None, debounce=None,
+          max_runs=None, watcher=None):
+    """Load a project and run callback now and after each save.
+
+    The file is read once per save: the same bytes are hashed (to skip
+    saves that did not change the content) and parsed.
+
+    An error while loading (such as from a partly written file) or in
+    callback is shown, then watching continues until the next save.
+
+    Args:
+        path (str): The SLA file.
+        callback (Callable): Called with the loaded ScribusProject.
+        pages (Optional[set[int]]): Only load these pages (See
+            ScribusProject).
+        interval (Optional[float]): See FileWatcher.
+        debounce (Optional[float]): See FileWatcher.
+        max_runs (Optional[int]): Stop after callback succeeded this many
+            times (None to watch until Ctrl+C). Failed runs do not count.
+        watcher (Optional[FileWatcher]): Detects saves, instead of one
+            made from path, interval and debounce.
+
+    Returns:
+        int: The number of times callback succeeded.
+    """
+    if watcher is None:
+        watcher = FileWatcher(path, interval=interval, debounce=debounce)
+    runs = 0
+    prev_hash = None
+    try:
+        while True:
+            data = None
+            content_hash = prev_hash  # If unreadable, wait for next save.
+            try:
+                with open(path, 'rb') as stream:
+                    data = stream.read()
+                content_hash = hashlib.sha1(data).hexdigest()
+            except OSError:
+                pass
+            if content_hash != prev_hash:
+                start = time.monotonic()
+                try:
+                    callback(ScribusProject(path, pages=pages, data=data))
+                    prev_hash = content_hash
+                    runs += 1
+                except Exception:
+                    echo0(traceback.format_exc())
+                    echo0('Error: "{}" could not be processed. Waiting for'
+                          ' the next save.'.format(path))
+                echo0("[{}] Done in {:.2f}s. Watching {} (Ctrl+C to stop)"
+                      "".format(time.strftime("%H:%M:%S"),
+                                time.monotonic() - start, path))
+            else:
+                echo1("The content of {} did not change.".format(path))
+            if (max_runs is not None) and (runs >= max_runs):
+                break
+            watcher.wait()
+            sys.stderr.flush()
+    except KeyboardInterrupt:
+        echo0()
+    return runs
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+'''
+booktacular.morescribus.writers
+-------------------------------
+
+Output formats for ScribusDocRoot.dump_text (sla-dump --format). The
+dumper calls start_document, then start_page and write_frame for each
+page and frame in reading order, then end_document. Each writer
+collects its output in a buffer and writes it to the stream in large
+chunks (See DUMP_BUFFER_SIZE) instead of once per text element.
+
+Each frame is passed as a record (See ScribusPage.get_frames) and the
+Markdown that the original dumper writes for it:
+- page (int): The page number counting from 1.
+- ItemID (str): The ItemID of the frame (None if not set).
+- tagName (str): PAGEOBJECT, or MASTEROBJECT for master page objects.
+- bbox (list[float]): left, top, right, bottom in points relative to
+  the page (not rotated).
+- style (str): The first paragraph style (See get_paragraph_style).
+- image (str): The PFILE of an image frame, otherwise None.
+- text (str): The text without image markup nor surrounding whitespace.
+'''
+from __future__ import print_function
+import html
+import json
+import re
+
+from collections import OrderedDict
+
+DUMP_BUFFER_SIZE = 64 * 1024  # characters to collect before writing
+
+IMAGE_MARKDOWN = re.compile(r"!\[([^\]]*)\]\(([^)]*)\)")
+# ^ written for images by SGMLNode._dump_text_unsorted
+
+
+class DumpWriter(object):
+    """Write a dump of an SLA file in some format, through a buffer.
+
+    Subclasses must implement write_frame, and may implement
+    start_document, start_page and end_document (call
+    DumpWriter.end_document to flush).
+
+    Attributes:
+        stream: A file-like object opened for writing text.
+        buffer_size (int): Write to stream once the buffer has at least
+            this many characters.
+    """
+    extension = ".txt"
+
+    def __init__(self, stream, buffer_size=DUMP_BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._parts:
+            return
+        self.stream.write("".join(self._parts))
+        self._parts = []
+        self._size = 0
+
+    def start_document(self, title):
+        pass
+
+    def start_page(self, number):
+        """Start a page.
+
+        Args:
+            number (int): The page number counting from 1.
+        """
+        pass
+
+    def write_frame(self, record, markdown):
+        raise NotImplementedError(
+            "{} must implement write_frame".format(type(self).__name__))
+
+    def end_document(self):
+        self.flush()
+
+
+class MarkdownWriter(DumpWriter):
+    """Write the same Markdown as the original dumper."""
+    extension = ".md"
+
+    def start_document(self, title):
+        self.write("\n\n# %s\n" % title)
+
+    def start_page(self, number):
+        self.write("\n\n## Page %s\n" % number)
+
+    def write_frame(self, record, markdown):
+        self.write(markdown)
+
+
+class TextWriter(DumpWriter):
+    """Write plain text, with one blank line between frames.
+
+    Images are only shown by their path, in brackets.
+    """
+    extension = ".txt"
+
+    def start_document(self, title):
+        self.write("%s\n" % title)
+
+    def start_page(self, number):
+        self.write("\n\n--- Page %s ---\n" % number)
+
+    def write_frame(self, record, markdown):
+        if record['image']:
+            self.write("\n[%s]\n" % record['image'])
+        if record['text']:
+            self.write("\n%s\n" % record['text'])
+
+
+class HTMLWriter(DumpWriter):
+    """Write an HTML document with a section per page and a div per frame.
+
+    The div of each frame has the ItemID and style as data attributes,
+    lines starting with "* " become lists, and blank lines separate
+    paragraphs.
+    """
+    extension = ".html"
+
+    def __init__(self, stream, buffer_size=DUMP_BUFFER_SIZE):
+        DumpWriter.__init__(self, stream, buffer_size=buffer_size)
+        self._in_page = False
+
+    def start_document(self, title):
+        self.write(
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            "<title>{0}</title>\n</head>\n<body>\n<h1>{0}</h1>\n"
+            "".format(html.escape(title)))
+
+    def _end_page(self):
+        if self._in_page:
+            self.write("</section>\n")
+            self._in_page = False
+
+    def start_page(self, number):
+        self._end_page()
+        self.write("<section class=\"page\" id=\"page-{0}\">\n"
+                   "<h2>Page {0}</h2>\n".format(number))
+        self._in_page = True
+
+    def write_frame(self, record, markdown):
+        body = markdown_to_html(markdown)
+        if not body:
+            return
+        attributes = ""
+        for key, name in (('ItemID', "item-id"), ('style', "style")):
+            if record[key] is not None:
+                attributes += " data-{}=\"{}\"".format(
+                    name, html.escape(record[key]))
+        self.write("<div class=\"frame\"{}>\n{}</div>\n"
+                   "".format(attributes, body))
+
+    def end_document(self):
+        self._end_page()
+        self.write("</body>\n</html>\n")
+        DumpWriter.end_document(self)
+
+
+class JSONLinesWriter(DumpWriter):
+    """Write one JSON object per frame per line (See the module docstring).
+
+    Frames with neither text nor an image are skipped.
+    """
+    extension = ".jsonl"
+
+    def write_frame(self, record, markdown):
+        if not record['text'] and not record['image']:
+            return
+        self.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def markdown_to_html(markdown):
+    """Convert the Markdown of one frame (See MarkdownWriter) to HTML.
+
+    Only what the dumper writes is supported: paragraphs, "* " list
+    items and images.
+
+    Returns:
+        str: HTML elements, one per line (empty if there is no text).
+    """
+    parts = []
+    paragraph = []
+    in_list = False
+    for line in markdown.split("\n"):
+        stripped = line.strip()
+        if (not stripped) or line.startswith(("* ", "![")):
+            if paragraph:
+                parts.append("<p>%s</p>\n" % "<br>\n".join(paragraph))
+                paragraph = []
+        if in_list and not line.startswith("* "):
+            parts.append("</ul>\n")
+            in_list = False
+        if not stripped:
+            continue
+        match = IMAGE_MARKDOWN.match(stripped)
+        if match:
+            parts.append("<img src=\"%s\" alt=\"%s\">\n"
+                         % (html.escape(match.group(2)),
+                            html.escape(match.group(1))))
+        elif line.startswith("* "):
+            if not in_list:
+                parts.append("<ul>\n")
+                in_list = True
+            parts.append("<li>%s</li>\n" % html.escape(line[2:]))
+        else:
+            paragraph.append(html.escape(line))
+    if paragraph:
+        parts.append("<p>%s</p>\n" % "<br>\n".join(paragraph))
+    if in_list:
+        parts.append("</ul>\n")
+    return "".join(parts)
+
+
+def get_frame_text(markdown):
+    """Get the text of a frame without image markup nor outer whitespace."""
+    return IMAGE_MARKDOWN.sub("", markdown).strip()
+
+
+WRITERS = OrderedDict([
+    ("markdown", MarkdownWriter),
+    ("text", TextWriter),
+    ("html", HTMLWriter),
+    ("jsonl", JSONLinesWriter),
+])
+DUMP_FORMATS = tuple(WRITERS.keys())
+
+
+def get_writer(output_format, stream, buffer_size=DUMP_BUFFER_SIZE):
+    """Create the writer for a format.
+
+    Args:
+        output_format (str): One of DUMP_FORMATS.
+        stream: A file-like object opened for writing text.
+
+    Returns:
+        DumpWriter: The writer (call start_document first).
+    """
+    if output_format not in WRITERS:
+        raise ValueError("output_format={} (expected one of {})"
+                         "".format(repr(output_format), DUMP_FORMATS))
+    return WRITERS[output_format](stream, buffer_size=buffer_size)
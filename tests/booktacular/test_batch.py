@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus.batch import (  # noqa: E402
+    find_sla_files,
+    run_batch,
+    sibling_path,
+)
+
+data_dir = os.path.join(my_dir, "data")
+book_path = os.path.join(data_dir, "minimal-book.sla")
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for name in ("a.sla", os.path.join("sub", "b.sla")):
+            path = os.path.join(self.tmp_dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            shutil.copy(book_path, path)
+            self.paths.append(path)
+        self.bad_path = os.path.join(self.tmp_dir, "sub", "c.sla")
+        with open(self.bad_path, 'w') as stream:
+            stream.write('<SCRIBUSUTF8NEW></DOCUMENT>')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_sla_files(self):
+        self.assertEqual(
+            find_sla_files([self.tmp_dir, self.paths[0]]),
+            self.paths + [self.bad_path],
+        )
+        self.assertEqual(
+            find_sla_files([os.path.join(self.tmp_dir, "**", "b.sla")]),
+            [self.paths[1]],
+        )
+        self.assertEqual(sibling_path("x/book.sla.gz", ".md"), "x/book.md")
+
+    def test_run_batch(self):
+        done = []
+        paths = self.paths + [self.bad_path]
+        results = run_batch(paths, "toc", jobs=2, callback=done.append)
+        self.assertEqual(len(done), 3)
+        self.assertEqual([result['path'] for result in results], paths)
+        self.assertEqual([result['ok'] for result in results],
+                         [True, True, False])
+        self.assertIn("SyntaxError", results[2]['error'])
+        self.assertTrue(os.path.isfile(sibling_path(paths[1], ".toc.md")))
+
+    def test_run_batch_bundle_shared_image(self):
+        # Each book cites images/map.png, so a worker moving it for one
+        #   book must not leave the others without it.
+        old_dir = os.path.join(self.tmp_dir, "old")
+        shutil.copytree(data_dir, old_dir)
+        paths = self.paths + [os.path.join(self.tmp_dir, "c.sla")]
+        shutil.copy(book_path, paths[2])  # same directory as a.sla
+        done = []
+        results = run_batch(paths, "bundle", jobs=2, callback=done.append,
+                            options={'old_dir': old_dir})
+        self.assertEqual([result['ok'] for result in results],
+                         [True, True, True], [result['error']
+                                              for result in results])
+        self.assertEqual([result['result'] for result in results], [1, 1, 1])
+        self.assertEqual(len(done), 3)
+        for path in paths:
+            self.assertTrue(os.path.isfile(os.path.join(
+                os.path.dirname(path), "images", "map.png")))
+        self.assertFalse(os.path.isfile(os.path.join(old_dir, "images",
+                                                     "map.png")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus.bundle import (  # noqa: E402
+    COPY,
+    DONE,
+    MISSING,
+    READY,
+    execute_bundle,
+    plan_bundle,
+    pull_images,
+)
+from booktacular.morescribus.fileindex import (  # noqa: E402
+    DirectoryIndex,
+    FileStatCache,
+)
+from booktacular.morescribus.manifest import (  # noqa: E402
+    AssetManifest,
+)
+
+data_dir = os.path.join(my_dir, "data")
+book_path = os.path.join(data_dir, "minimal-book.sla")
+
+
+class TestBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_dir = os.path.join(self.tmp_dir, "old")
+        self.new_dir = os.path.join(self.tmp_dir, "new")
+        shutil.copytree(data_dir, self.old_dir)
+        os.makedirs(self.new_dir)
+        self.sla_path = os.path.join(self.new_dir, "book.sla")
+        with open(book_path, 'r') as stream:
+            data = stream.read()
+        data = data.replace(
+            'PFILE="images/map.png"',
+            'PFILE="images/map.png" ANNAME="a"/><PAGEOBJECT OwnPage="1"'
+            ' PFILE="images\\missing.png"',
+        )
+        with open(self.sla_path, 'w') as stream:
+            stream.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_directory_index(self):
+        index = DirectoryIndex(self.old_dir)
+        self.assertIn("images/map.png", index)
+        self.assertIn("images\\map.png", index)
+        self.assertIn("./images/../images/map.png", index)
+        self.assertNotIn("images/missing.png", index)
+        self.assertTrue(index.has_dir("images"))
+        self.assertEqual(index.stat("images/map.png").st_size,
+                         os.path.getsize(os.path.join(self.old_dir, "images",
+                                                      "map.png")))
+
+    def test_file_stat_cache(self):
+        file_cache = FileStatCache(self.old_dir)
+        path = os.path.join(self.old_dir, "images", "map.png")
+        self.assertTrue(file_cache.isfile("images/map.png"))
+        self.assertTrue(file_cache.isfile(path))
+        self.assertEqual(file_cache.getmtime("images/map.png"),
+                         os.path.getmtime(path))
+        self.assertFalse(file_cache.isfile("images/missing.png"))
+        self.assertFalse(file_cache.isfile("images"))  # not a file
+        self.assertFalse(file_cache.isfile("nowhere/map.png"))
+        self.assertEqual(file_cache.get_missing_report(), [])
+        file_cache.add_missing("images/missing.png", page=2)
+        file_cache.update_missing({"images/missing.png": [2, 3]})
+        self.assertEqual(file_cache.missing["images/missing.png"], [2, 3])
+        self.assertEqual(len(file_cache.get_missing_report()), 2)
+
+    def test_plan_and_execute(self):
+        plan = plan_bundle(self.sla_path, self.old_dir)
+        self.assertEqual([action['status'] for action in plan.actions],
+                         [READY, MISSING])
+        self.assertEqual(plan.actions[1]['pages'], [2])
+        dst = os.path.join(self.new_dir, "images", "map.png")
+
+        results = execute_bundle(plan, dry_run=True)
+        self.assertEqual(len(results), 1)
+        self.assertFalse(os.path.exists(dst))
+
+        results = execute_bundle(plan, mode=COPY)
+        self.assertTrue(results[0]['ok'])
+        self.assertTrue(os.path.isfile(dst))
+        self.assertTrue(os.path.isfile(plan.actions[0]['src']))
+
+        os.remove(plan.actions[0]['src'])
+        plan = plan_bundle(self.sla_path, self.old_dir)
+        self.assertEqual(plan.actions[0]['status'], DONE)
+
+    def test_manifest(self):
+        images_dir = os.path.join(self.old_dir, "images")
+        shutil.copy(os.path.join(images_dir, "map.png"),
+                    os.path.join(images_dir, "copy.png"))
+        with open(self.sla_path, 'r') as stream:
+            data = stream.read()
+        with open(self.sla_path, 'w') as stream:
+            stream.write(data.replace("missing.png", "copy.png"))
+        self.assertEqual(pull_images(self.sla_path, self.old_dir), 0)
+        asset_manifest = AssetManifest(self.sla_path)
+        self.assertEqual(list(asset_manifest.assets.keys()),
+                         ["images/map.png", "images/copy.png"])
+        self.assertEqual(
+            list(asset_manifest.find_duplicates().values()),
+            [["images/map.png", "images/copy.png"]],
+        )
+        # Nothing changed, so the SLA file is not lexed nor images hashed:
+        references, _ = asset_manifest.get_references()
+        self.assertEqual(list(references.keys()),
+                         ["images/map.png", "images\\copy.png"])
+        asset_manifest.update(references.keys())
+        self.assertEqual(asset_manifest.hashed, 0)
+
+        self.assertEqual(pull_images(self.sla_path, self.old_dir,
+                                     dedupe=True), 0)
+        with open(self.sla_path, 'r') as stream:
+            self.assertNotIn("copy.png", stream.read())
+        self.assertTrue(os.path.isfile(self.sla_path + ".bak"))
+        references, _ = AssetManifest(self.sla_path).get_references()
+        self.assertEqual(references["images/map.png"], [2, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from io import StringIO
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus import (  # noqa: E402
+    from_string_scribus,
+)
+from booktacular.morescribus.compare import (  # noqa: E402
+    ADDED,
+    ATTRIBUTES_CHANGED,
+    DELETE,
+    EQUAL,
+    IMAGE_CHANGED,
+    INSERT,
+    MOVED,
+    REMOVED,
+    REPLACE,
+    RESIZED,
+    STYLE_CHANGED,
+    TEXT_CHANGED,
+    StructureDiff,
+    TextDiff,
+    _dump_to_file,
+    diff_lines,
+    diff_sla,
+    diff_structure,
+)
+from booktacular.morescribus.rewrite import (  # noqa: E402
+    rename_rule,
+    rewrite_sla,
+)
+
+book_path = os.path.join(my_dir, "data", "minimal-book.sla")
+
+
+class TestCompare(unittest.TestCase):
+    def test_diff_lines(self):
+        a = ["# Title", "", "one", "two", "", "three", "four"]
+        b = ["# Title", "", "one", "2", "", "three", "four", "five"]
+        self.assertEqual(diff_lines(a, b), [
+            (EQUAL, 0, 3, 0, 3),
+            (REPLACE, 3, 4, 3, 4),
+            (EQUAL, 4, 7, 4, 7),
+            (INSERT, 7, 7, 7, 8),
+        ])
+        self.assertEqual(diff_lines(a, a[2:]), [
+            (DELETE, 0, 2, 0, 0),
+            (EQUAL, 2, 7, 0, 5),
+        ])
+        self.assertEqual(diff_lines([], []), [])
+        # Moved lines are found by unique lines (patience diff):
+        a = ["x", "a", "b", "c"]
+        b = ["a", "b", "c", "x"]
+        opcodes = diff_lines(a, b)
+        self.assertIn((EQUAL, 1, 4, 0, 3), opcodes)
+
+    def test_diff_sla(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "book.sla")
+            shutil.copy(book_path, path)
+            shutil.copytree(os.path.join(my_dir, "data", "images"),
+                            os.path.join(tmp_dir, "images"))
+            # ^ so the text of the image (with its date) is the same
+            self.assertFalse(diff_sla([book_path, path]).has_changes())
+
+            rewrite_sla(path, [rename_rule("CH", "First item", "1st item")])
+            text_diff = diff_sla([book_path, path])
+            self.assertTrue(text_diff.has_changes())
+            # Loading one after the other gets the same result:
+            self.assertEqual(diff_sla([book_path, path], jobs=1).opcodes,
+                             text_diff.opcodes)
+            structure_diff = diff_structure([book_path, path])
+            self.assertEqual([change['kind']
+                              for change in structure_diff.changes],
+                             [TEXT_CHANGED])
+            hunks = text_diff.get_hunks()
+            self.assertEqual(len(hunks), 1)
+            self.assertEqual(hunks[0]['page'], 3)
+            changed = [line for line in hunks[0]['lines']
+                       if line[0] != " "]
+            self.assertEqual(changed, [["-", "* First item"],
+                                       ["+", "* 1st item"]])
+
+            stream = StringIO()
+            text_diff.write(stream)
+            self.assertIn("@@ Page 3\n", stream.getvalue())
+            self.assertIn("\n+* 1st item\n", stream.getvalue())
+            stream = StringIO()
+            text_diff.write(stream, output_format="json")
+            self.assertEqual(json.loads(stream.getvalue())['hunks'][0]['page'],
+                             3)
+            stream = StringIO()
+            text_diff.write(stream, output_format="html")
+            self.assertIn("<td class=\"new\">* 1st item</td>",
+                          stream.getvalue())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_dump_to_file_masters(self):
+        # The text shown in meld (See meld_sla) follows --masters too:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            tmp_path = os.path.join(tmp_dir, "book.txt")
+            for include_master in (False, True):
+                _dump_to_file((book_path, tmp_path),
+                              include_master=include_master)
+                with open(tmp_path, 'r') as stream:
+                    self.assertEqual("Minimal Book page" in stream.read(),
+                                     include_master)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_text_diff_pages(self):
+        a = ["# Book", "## Page 1", "a", "## Page 2", "b"]
+        b = ["# Book", "## Page 1", "a", "## Page 2", "c"]
+        self.assertEqual(TextDiff(a, b).get_hunks()[0]['page'], 2)
+
+    def test_structure_diff(self):
+        with open(book_path, 'r') as stream:
+            data = stream.read()
+        new_data = (
+            data
+            .replace('XPOS="332" YPOS="150" OwnPage="0"',
+                     'XPOS="332" YPOS="160" OwnPage="0"')
+            .replace('ItemID="1000000203" PTYPE="2" WIDTH="468"',
+                     'ItemID="1000000203" PTYPE="2" WIDTH="400"')
+            .replace('PFILE="images/map.png"', 'PFILE="images/other.png"')
+            .replace('CH="Second item"', 'CH="2nd item"')
+            .replace('<ITEXT CH="After the list."/>\n'
+                     '                <trail PARENT="Body"/>',
+                     '<ITEXT CH="After the list."/>\n'
+                     '                <trail PARENT="Quote"/>')
+            .replace('ItemID="1000000105"', 'ItemID="1000000999"')
+            .replace('ItemID="1000000104" PTYPE="4"',
+                     'ItemID="1000000104" PTYPE="4" COLUMNS="3"'
+                     ' ANNAME="Renamed"')
+        )
+        old_root = from_string_scribus(data)
+        self.assertFalse(StructureDiff(old_root, old_root).has_changes())
+        structure_diff = StructureDiff(old_root,
+                                       from_string_scribus(new_data))
+        found = [(change['kind'], change['ItemID'])
+                 for change in structure_diff.changes]
+        self.assertEqual(sorted(found), sorted([
+            (MOVED, "1000000103"),
+            (RESIZED, "1000000203"),
+            (IMAGE_CHANGED, "1000000203"),
+            (TEXT_CHANGED, "1000000302"),
+            (STYLE_CHANGED, "1000000302"),
+            (ATTRIBUTES_CHANGED, "1000000104"),
+            # The same content with a new ItemID is matched by hash:
+            (ATTRIBUTES_CHANGED, "1000000999"),
+        ]))
+        moved = structure_diff.changes[found.index((MOVED, "1000000103"))]
+        self.assertEqual(moved['attributes'], {'YPOS': ["150", "160"]})
+        self.assertEqual(moved['page'], 1)
+
+        # Objects that were not matched are added or removed:
+        removed_data = (data.replace('ItemID="1000000105"',
+                                     'ItemID="1000000999"')
+                        .replace('CH="Alpha two."', 'CH="New text."'))
+        found = [(change['kind'], change['ItemID']) for change in
+                 StructureDiff(old_root,
+                               from_string_scribus(removed_data)).changes]
+        self.assertEqual(found, [(REMOVED, "1000000105"),
+                                 (ADDED, "1000000999")])
+        stream = StringIO()
+        structure_diff.write(stream)
+        self.assertIn("moved: PAGEOBJECT ItemID=1000000103 YPOS: 150 -> 160",
+                      stream.getvalue())
+
+        # Master page objects are only compared with include_master:
+        master_root = from_string_scribus(
+            data.replace('CH="Minimal Book page "', 'CH="Book page "'))
+        self.assertFalse(StructureDiff(old_root, master_root).has_changes())
+        found = [change['kind'] for change in
+                 StructureDiff(old_root, master_root,
+                               include_master=True).changes]
+        self.assertEqual(found, [TEXT_CHANGED])
+
+
+if __name__ == "__main__":
+    unittest.main()
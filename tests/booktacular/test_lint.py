@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus import (  # noqa: E402
+    from_string_scribus,
+)
+from booktacular.morescribus.lint import (  # noqa: E402
+    MISSING_IMAGE,
+    OFF_PAGE,
+    OUTSIDE_BLEED,
+    OUTSIDE_SAFE_AREA,
+    OVERLAP,
+    ZERO_SIZE,
+    lint_root,
+    lint_sla,
+)
+
+data_dir = os.path.join(my_dir, "data")
+
+PAGE_ATTRIBUTES = (
+    'PAGEWIDTH="612" PAGEHEIGHT="792" BORDERLEFT="72" BORDERRIGHT="72"'
+    ' BORDERTOP="72" BORDERBOTTOM="72"'
+)
+
+lint_data = (
+    '<SCRIBUSUTF8NEW Version="1.5.8">'
+    '<DOCUMENT ANZPAGES="1" BleedTop="9" BleedLeft="9" BleedRight="9"'
+    ' BleedBottom="9" ' + PAGE_ATTRIBUTES + '>'
+    '<PAGE PAGEXPOS="100" PAGEYPOS="20" NUM="0" MNAM="" '
+    + PAGE_ATTRIBUTES + '/>'
+    # ok:
+    '<PAGEOBJECT XPOS="172" YPOS="92" OwnPage="0" ItemID="1"'
+    ' WIDTH="100" HEIGHT="100"/>'
+    # overlaps 1:
+    '<PAGEOBJECT XPOS="222" YPOS="142" OwnPage="0" ItemID="2"'
+    ' WIDTH="100" HEIGHT="100"/>'
+    # into the left margin but not past the bleed:
+    '<PAGEOBJECT XPOS="100" YPOS="400" OwnPage="0" ItemID="3"'
+    ' WIDTH="50" HEIGHT="50"/>'
+    # past the bleed:
+    '<PAGEOBJECT XPOS="80" YPOS="500" OwnPage="0" ItemID="4"'
+    ' WIDTH="50" HEIGHT="50"/>'
+    # on the canvas but not the page:
+    '<PAGEOBJECT XPOS="800" YPOS="500" OwnPage="0" ItemID="5"'
+    ' WIDTH="50" HEIGHT="50"/>'
+    '<PAGEOBJECT XPOS="300" YPOS="600" OwnPage="0" ItemID="6"'
+    ' WIDTH="0" HEIGHT="50"/>'
+    '</DOCUMENT>'
+    '</SCRIBUSUTF8NEW>'
+)
+
+
+class TestLint(unittest.TestCase):
+    def test_lint_root(self):
+        issues = lint_root(from_string_scribus(lint_data))
+        found = set((issue['kind'], issue['ItemID']) for issue in issues)
+        self.assertEqual(
+            found,
+            set([
+                (OVERLAP, "2"),
+                (OUTSIDE_SAFE_AREA, "3"),
+                (OUTSIDE_BLEED, "4"),
+                (OFF_PAGE, "5"),
+                (ZERO_SIZE, "6"),
+            ]),
+        )
+        overlap = [issue for issue in issues if issue['kind'] == OVERLAP][0]
+        self.assertEqual(overlap['other'], "1")
+        self.assertEqual(overlap['area'], 50 * 50)
+        self.assertEqual(overlap['bbox'], [122, 122, 222, 222])
+
+    def test_overlaps_after_sweep(self):
+        # 7 ends before 9 starts (so it is dropped from the sweep), but the
+        #   wide 8 is still open and overlaps 9. 10 is above 9.
+        data = lint_data.replace(
+            '</DOCUMENT>',
+            '<PAGEOBJECT XPOS="172" YPOS="300" OwnPage="0" ItemID="7"'
+            ' WIDTH="50" HEIGHT="50"/>'
+            '<PAGEOBJECT XPOS="172" YPOS="650" OwnPage="0" ItemID="8"'
+            ' WIDTH="400" HEIGHT="50"/>'
+            '<PAGEOBJECT XPOS="300" YPOS="660" OwnPage="0" ItemID="9"'
+            ' WIDTH="50" HEIGHT="20"/>'
+            '<PAGEOBJECT XPOS="400" YPOS="92" OwnPage="0" ItemID="10"'
+            ' WIDTH="50" HEIGHT="50"/>'
+            '</DOCUMENT>',
+        )
+        issues = lint_root(from_string_scribus(data), ignore=[ZERO_SIZE])
+        pairs = set((issue['ItemID'], issue['other']) for issue in issues
+                    if issue['kind'] == OVERLAP)
+        self.assertEqual(pairs, set([("2", "1"), ("9", "8")]))
+
+    def test_ignore(self):
+        issues = lint_root(from_string_scribus(lint_data),
+                           ignore=[OVERLAP, OFF_PAGE])
+        self.assertNotIn(OVERLAP, [issue['kind'] for issue in issues])
+        self.assertEqual(len(issues), 3)
+
+    def test_missing_image(self):
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "book.sla")
+            shutil.copy(os.path.join(data_dir, "minimal-book.sla"), path)
+            missing = [issue for issue in lint_sla(path)
+                       if issue['kind'] == MISSING_IMAGE]
+            self.assertEqual([(issue['page'], issue['pfile'])
+                              for issue in missing],
+                             [(2, "images/map.png")])
+            shutil.copytree(os.path.join(data_dir, "images"),
+                            os.path.join(tmp_dir, "images"))
+            self.assertNotIn(MISSING_IMAGE,
+                             [issue['kind'] for issue in lint_sla(path)])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
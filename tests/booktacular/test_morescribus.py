@@ -25,9 +25,29 @@ test_sgml_data = '''        <PAGEOBJECT XPOS="766.0008" YPOS="30026.5978352942"
             </PageItemAttributes>
         </PAGEOBJECT>'''
 
+narrow_columns_frames = '''        <PAGEOBJECT XPOS="332" YPOS="2410" OwnPage="2" ItemID="1000000303" PTYPE="4" WIDTH="148" HEIGHT="40" FRTYPE="0" CLIPEDIT="0" PWIDTH="1" PLINEART="1" COLUMNS="2" COLGAP="12" AUTOTEXT="0" LAYER="0" NEXTITEM="-1" BACKITEM="-1">
+            <StoryText>
+                <DefaultStyle/>
+                <ITEXT CH="Narrow two column flow."/>
+                <trail PARENT="Body"/>
+            </StoryText>
+        </PAGEOBJECT>
+        <PAGEOBJECT XPOS="172" YPOS="2416" OwnPage="2" ItemID="1000000304" PTYPE="4" WIDTH="148" HEIGHT="50" FRTYPE="0" CLIPEDIT="0" PWIDTH="1" PLINEART="1" COLUMNS="1" COLGAP="0" AUTOTEXT="0" LAYER="0" NEXTITEM="-1" BACKITEM="-1">
+            <StoryText>
+                <DefaultStyle/>
+                <ITEXT CH="Beside the narrow columns."/>
+                <trail PARENT="Body"/>
+            </StoryText>
+        </PAGEOBJECT>
+'''
+# ^ Added to page 3 of minimal-book.sla by
+#   test_reading_order_columns_attribute.
+
 my_dir = os.path.dirname(os.path.abspath(__file__))
 module_dir = os.path.dirname(my_dir)
 repo_dir = os.path.dirname(module_dir)
+data_dir = os.path.join(my_dir, "data")
+book_path = os.path.join(data_dir, "minimal-book.sla")
 
 # if __name__ == "__main__":
 sys.path.insert(0, repo_dir)
@@ -35,11 +55,27 @@ sys.path.insert(0, repo_dir)
 from booktacular.morescribus import (  # noqa: E402
     SGMLLexer,
     # from_string,
+    LIST_EMPTY_ITEM,
+    LIST_MID_PARAGRAPH,
     from_string_scribus,
+    get_page_boxes,
+    mark_list_items,
+    node_from_dict,
+    parse_page_ranges,
+    ReadingOrder,
+    ScribusProject,
+    validate_lists,
     # SGMLElementTree,
     # SGMLNode,
     # SGMLText,
 )
+from booktacular.morescribus.pagecache import (  # noqa: E402
+    PageCache,
+    page_cache_path,
+)
+from booktacular.morescribus.writers import (  # noqa: E402
+    MarkdownWriter,
+)
 
 
 def echo0(*args, **kwargs):
@@ -240,6 +276,438 @@ class TestMoreScribus(unittest.TestCase):
     def test_to_dict_with_spacing(self):
         self.test_to_dict(data=spaced_xml_data, strip=True)
 
+    def get_sorted_ids(self, page_number, reading_order=None, data=None):
+        if data is None:
+            root = ScribusProject(book_path).root
+        else:
+            root = from_string_scribus(data)
+        root.collect_pages()
+        page = root._pages[page_number]
+        page.sort_children_spatially(reading_order=reading_order)
+        return [child.get("ItemID") for child in page.children
+                if child.tagName == "PAGEOBJECT"]
+
+    def test_reading_order_three_columns(self):
+        self.assertAllEqual(
+            self.get_sorted_ids(0),
+            ["1000000101", "1000000102", "1000000105", "1000000103",
+             "1000000104"],
+        )
+
+    def test_reading_order_bands(self):
+        # The wide picture ends the first band of two columns.
+        self.assertAllEqual(
+            self.get_sorted_ids(1),
+            ["1000000201", "1000000202", "1000000203", "1000000204",
+             "1000000205"],
+        )
+
+    def test_reading_order_columns_attribute(self):
+        # A frame with COLUMNS="2" is one block even if narrow enough
+        #   to be a column by width, so it starts a band and the frame
+        #   beside it (a little lower) is read after it.
+        with open(book_path, 'r') as stream:
+            data = stream.read()
+        data = data.replace('        <FRAMEOBJECT', narrow_columns_frames
+                            + '        <FRAMEOBJECT', 1)
+        self.assertTrue(ReadingOrder().use_columns_attribute)
+        self.assertAllEqual(
+            self.get_sorted_ids(2, data=data),
+            ["1000000301", "1000000302", "1000000303", "1000000304"],
+        )
+        # Otherwise both are columns by width, read from left to right:
+        reading_order = ReadingOrder(use_columns_attribute=False)
+        self.assertAllEqual(
+            self.get_sorted_ids(2, reading_order=reading_order, data=data),
+            ["1000000301", "1000000302", "1000000304", "1000000303"],
+        )
+
+    def test_node_from_dict(self):
+        root = from_string_scribus(xml_data)
+        copied = node_from_dict(root.children[1].to_dict())
+        self.assertMoreEqual(copied.to_dict(), root.children[1].to_dict())
+
+    def dump_book(self, jobs=None, include_master=False, path=book_path,
+                  output_format="markdown"):
+        from io import StringIO
+        stream = StringIO()
+        project = ScribusProject(path)
+        # PFILE paths are relative to the SLA file, not the current
+        #   directory (See ScribusDocRoot.image_dir).
+        project.root.dump_text(stream, jobs=jobs,
+                               include_master=include_master,
+                               output_format=output_format)
+        self.file_cache = project.root.file_cache
+        return stream.getvalue()
+
+    def test_dump_text_jobs(self):
+        serial = self.dump_book()
+        self.assertIn("## Page 3", serial)
+        self.assertEqual(self.dump_book(jobs=2), serial)
+
+    def test_dump_formats(self):
+        import json
+        lines = self.dump_book(output_format="jsonl").splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['ItemID'] for record in records[:2]],
+                         ["1000000101", "1000000102"])
+        self.assertEqual(records[0]['page'], 1)
+        self.assertEqual(records[0]['bbox'], [72.0, 72.0, 540.0, 112.0])
+        self.assertEqual(records[0]['style'], "Heading - H1")
+        self.assertEqual(records[0]['text'], "Chapter One")
+        image_record = [record for record in records
+                        if record['image']][0]
+        self.assertEqual(image_record['image'], "images/map.png")
+        self.assertEqual(image_record['text'], "")
+        self.assertEqual(records[-1]['text'],
+                         "Two column flow.\n* First item\n* Second item"
+                         "\nAfter the list.")
+        self.assertEqual(self.dump_book(jobs=2, output_format="jsonl"),
+                         "\n".join(lines) + "\n")
+
+        text = self.dump_book(output_format="text")
+        self.assertTrue(text.startswith("Minimal Book\n"))
+        self.assertIn("\n--- Page 2 ---\n", text)
+        self.assertIn("\n[images/map.png]\n", text)
+
+        page = self.dump_book(output_format="html")
+        self.assertIn("<h2>Page 3</h2>", page)
+        self.assertIn("<li>Second item</li>\n</ul>\n<p>After the list.</p>",
+                      page)
+        self.assertTrue(page.endswith("</section>\n</body>\n</html>\n"))
+
+        with self.assertRaises(ValueError):
+            self.dump_book(output_format="docx")
+
+    def test_dump_writer_buffer(self):
+        from io import StringIO
+        stream = StringIO()
+        writer = MarkdownWriter(stream, buffer_size=10)
+        writer.start_document("Book")
+        self.assertEqual(stream.getvalue(), "")  # still in the buffer
+        writer.start_page(1)
+        self.assertEqual(stream.getvalue(), "\n\n# Book\n\n\n## Page 1\n")
+        writer.write_frame(None, "Text")
+        writer.end_document()
+        self.assertTrue(stream.getvalue().endswith("Text"))
+
+    def dump_with_cache(self, path, cache, jobs=None):
+        from io import StringIO
+        stream = StringIO()
+        ScribusProject(path).root.dump_text(stream, jobs=jobs, cache=cache)
+        return stream.getvalue()
+
+    def test_page_cache(self):
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "book.sla")
+            shutil.copy(book_path, path)
+            shutil.copytree(os.path.join(data_dir, "images"),
+                            os.path.join(tmp_dir, "images"))
+            serial = self.dump_book(path=path)
+            cache = PageCache(path)
+            self.assertEqual(self.dump_with_cache(path, cache), serial)
+            self.assertEqual((cache.hits, cache.misses), (0, 3))
+            cache.save()
+            self.assertTrue(os.path.isfile(page_cache_path(path)))
+
+            cache = PageCache(path)
+            for jobs in (None, 2):
+                self.assertEqual(self.dump_with_cache(path, cache, jobs=jobs),
+                                 serial)
+            self.assertEqual((cache.hits, cache.misses), (6, 0))
+
+            # Only the edited page is dumped again:
+            with open(path, 'r') as stream:
+                data = stream.read()
+            with open(path, 'w') as stream:
+                stream.write(data.replace('CH="Left top."',
+                                          'CH="Top left."'))
+            serial = self.dump_book(path=path)
+            self.assertIn("Top left.", serial)
+            for jobs in (None, 2):
+                cache = PageCache(path)
+                self.assertEqual(self.dump_with_cache(path, cache, jobs=jobs),
+                                 serial)
+                self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+            # The date of an image is shown, so changing it is a change:
+            os.utime(os.path.join(tmp_dir, "images", "map.png"), (0, 0))
+            cache.hits = cache.misses = 0
+            self.assertEqual(self.dump_with_cache(path, cache),
+                             self.dump_book(path=path))
+            self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+            # Margins decide which objects span columns, so they change
+            #   the order:
+            with open(path, 'r') as stream:
+                data = stream.read()
+            with open(path, 'w') as stream:
+                stream.write(data.replace(
+                    'BORDERLEFT="72" BORDERRIGHT="72" BORDERTOP="72"'
+                    ' BORDERBOTTOM="72" NUM="0"',
+                    'BORDERLEFT="400" BORDERRIGHT="72" BORDERTOP="72"'
+                    ' BORDERBOTTOM="72" NUM="0"',
+                ))
+            serial = self.dump_book(path=path)
+            cache.hits = cache.misses = 0
+            self.assertEqual(self.dump_with_cache(path, cache), serial)
+            self.assertEqual((cache.hits, cache.misses), (2, 1))
+            self.assertLess(serial.index("Gamma column text."),
+                            serial.index("Beta column text."))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_missing_images(self):
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "book.sla")
+            shutil.copy(book_path, path)
+            # The whole text is dumped even though the image is missing:
+            serial = self.dump_book(path=path)
+            self.assertIn("## Page 3", serial)
+            self.assertIn("![map: missing](images/map.png)", serial)
+            self.assertEqual(list(self.file_cache.missing.items()),
+                             [("images/map.png", [2])])
+            self.assertEqual(self.dump_book(jobs=2, path=path), serial)
+            self.assertEqual(list(self.file_cache.missing.items()),
+                             [("images/map.png", [2])])
+
+            os.mkdir(os.path.join(tmp_dir, "images"))
+            shutil.copy(os.path.join(data_dir, "images", "map.png"),
+                        os.path.join(tmp_dir, "images"))
+            self.assertNotIn("missing", self.dump_book(path=path))
+            self.assertEqual(self.file_cache.get_missing_report(), [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_parse_page_ranges(self):
+        self.assertEqual(parse_page_ranges("1,3, 10-12"),
+                         set([0, 2, 9, 10, 11]))
+        with self.assertRaises(ValueError):
+            parse_page_ranges("5-4")
+
+    def test_skip_pages_while_parsing(self):
+        data = (
+            '<DOCUMENT>'
+            '<PAGEOBJECT OwnPage="0" ItemID="1">'
+            '<PAGEOBJECT OwnPage="0" ItemID="2"><ITEXT CH="a"/></PAGEOBJECT>'
+            '<PAGEOBJECT OwnPage="0" ItemID="3"/>'
+            '</PAGEOBJECT>'
+            '<PAGEOBJECT OwnPage="1" ItemID="4"><ITEXT CH="b"/></PAGEOBJECT>'
+            '</DOCUMENT>'
+        )
+        root = from_string_scribus(data, pages=set([1]))
+        document = root.children[0]
+        self.assertAllEqual(
+            [child.get("ItemID") for child in document.children],
+            ["4"],
+        )
+        self.assertEqual(document.children[0].children[0].get("CH"), "b")
+
+    def test_master_pages(self):
+        project = ScribusProject(book_path)
+        root = project.root
+        root.collect_pages()
+        master = root.get_master_page("Normal")
+        self.assertEqual(len(master.children), 1)
+        for number in range(3):
+            page = root._pages[number]
+            self.assertIs(page.master, master)
+            self.assertNotIn("1000000001",
+                             [child.get("ItemID") for child in page.children])
+        children = root._pages[0].get_children(include_master=True)
+        self.assertIs(children[0], master.children[0])
+        self.assertIn("Minimal Book page", self.dump_book(include_master=True))
+        self.assertNotIn("Minimal Book page", self.dump_book())
+
+    def test_page_origins(self):
+        # Facing pages: the right page starts at PAGEXPOS="712".
+        page = ('PAGEWIDTH="612" PAGEHEIGHT="792" BORDERLEFT="72"'
+                ' BORDERRIGHT="72" BORDERTOP="72" BORDERBOTTOM="72"')
+        data = (
+            '<DOCUMENT ' + page + '>'
+            # before the PAGE elements but still inferred to be on page 0:
+            '<PAGEOBJECT XPOS="172" YPOS="92" ItemID="4"'
+            ' WIDTH="200" HEIGHT="100"/>'
+            '<MASTERPAGE PAGEXPOS="50" PAGEYPOS="10" NUM="0" NAM="Normal" '
+            + page + '/>'
+            '<PAGE PAGEXPOS="100" PAGEYPOS="20" NUM="0" ' + page + '/>'
+            '<PAGE PAGEXPOS="712" PAGEYPOS="20" NUM="1" ' + page + '/>'
+            '<PAGE PAGEXPOS="100" PAGEYPOS="852" NUM="2" ' + page + '/>'
+            '<PAGEOBJECT XPOS="784" YPOS="92" OwnPage="1" ItemID="1"'
+            ' WIDTH="200" HEIGHT="100"/>'
+            '<PAGEOBJECT XPOS="1036" YPOS="92" OwnPage="1" ItemID="2"'
+            ' WIDTH="200" HEIGHT="100"/>'
+            '<PAGEOBJECT XPOS="172" YPOS="924" ItemID="3"'
+            ' WIDTH="200" HEIGHT="100"/>'
+            '</DOCUMENT>'
+        )
+        root = from_string_scribus(data)
+        root.collect_pages()
+        origins = root.page_origins
+        self.assertEqual(len(origins), 3)
+        self.assertEqual(origins.find_page(800, 500), 1)
+        self.assertEqual(origins.find_page(200, 900), 2)
+        self.assertIsNone(origins.find_page(50, 500))  # scratch space
+        self.assertIsNone(origins.find_page(800, 900))
+        self.assertEqual(origins.to_page_relative([784, 5], [92, 5], [1, 9]),
+                         ([72, 5], [72, 5]))
+        self.assertEqual(root.get_master_page("Normal").get_origin(),
+                         (50, 10))
+        self.assertEqual(
+            get_page_boxes(root._pages[1].children),
+            [(72, 72, 200, 100), (324, 72, 200, 100)],
+        )
+        self.assertAllEqual(
+            [child.get("ItemID") for child in root._pages[0].children],
+            ["4"],
+        )
+        # The object without OwnPage is inferred to be on page 2:
+        self.assertAllEqual(
+            [child.get("ItemID") for child in root._pages[2].children],
+            ["3"],
+        )
+        page = root._pages[1]
+        left, right = page.left_and_right_children(page.children)
+        self.assertAllEqual([child.get("ItemID") for child in left], ["1"])
+        self.assertAllEqual([child.get("ItemID") for child in right], ["2"])
+
+    def test_save(self):
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "book.sla")
+            shutil.copy(book_path, path)
+            with open(book_path, 'rb') as stream:
+                original = stream.read()
+            project = ScribusProject(path)
+            self.assertEqual(project.save(), 0)
+            with open(path, 'rb') as stream:
+                self.assertEqual(stream.read(), original)
+
+            # Objects on pages that were not loaded are kept:
+            project = ScribusProject(path, pages=set([1]))
+            project.root.collect_pages()
+            obj = project.root._pages[1].children[0]
+            obj.attributes['ANNAME'] = "Renamed"
+            self.assertEqual(project.save(backup=True), 1)
+            self.assertEqual(os.listdir(tmp_dir).count("book.sla"), 1)
+            self.assertEqual(len(os.listdir(tmp_dir)), 2)  # and .bak
+            with open(path + ".bak", 'rb') as stream:
+                self.assertEqual(stream.read(), original)
+
+            root = ScribusProject(path).root
+            root.collect_pages()
+            self.assertEqual(len(root._pages[0].children), 5)
+            self.assertEqual(root._pages[1].children[0].get("ANNAME"),
+                             "Renamed")
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_save_removed_node(self):
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "book.sla")
+            shutil.copy(book_path, path)
+            project = ScribusProject(path)
+            document = project.root.get_root()
+            objects = [child for child in document.children
+                       if getattr(child, 'tagName', None) == "PAGEOBJECT"]
+            document.children.remove(objects[0])
+            with self.assertRaises(ValueError):
+                project.save()
+            self.assertEqual(os.listdir(tmp_dir), ["book.sla"])
+            with open(path, 'rb') as stream:
+                saved = stream.read()
+            with open(book_path, 'rb') as stream:
+                self.assertEqual(saved, stream.read())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        from io import StringIO
+        root = from_string_scribus('<DOCUMENT><a>Old text</a></DOCUMENT>')
+        root.children[0].children[0].children[0].value = "New text"
+        with self.assertRaises(ValueError):
+            root.write(StringIO())
+
+    def test_gzip(self):
+        import gzip
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            project = ScribusProject(book_path)
+            self.assertFalse(project.compressed)
+            path = os.path.join(tmp_dir, "book.sla.gz")
+            project.save(path)
+            with open(path, 'rb') as stream:
+                self.assertEqual(stream.read(2), b"\x1f\x8b")
+            with gzip.open(path, 'rb') as stream:
+                data = stream.read()
+            with open(book_path, 'rb') as stream:
+                self.assertEqual(data, stream.read())
+
+            # Gzip is detected by content, and kept when saving:
+            renamed = os.path.join(tmp_dir, "book.sla")
+            os.rename(path, renamed)
+            project = ScribusProject(renamed)
+            self.assertTrue(project.compressed)
+            self.assertEqual(project.root.get_toc()[0]['title'],
+                             "Chapter One")
+            project.save()
+            self.assertTrue(ScribusProject(renamed).compressed)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_lists(self):
+        root = ScribusProject(book_path).root
+        root.collect_pages()
+        frame = [obj for obj in root._pages[2].children
+                 if obj.get("ItemID") == "1000000302"][0]
+        self.assertEqual(mark_list_items(frame), 2)
+        self.assertEqual(validate_lists(frame), [])
+        self.assertIn("\n* First item\n* Second item", self.dump_book())
+
+        root = from_string_scribus(
+            '<SCRIBUSUTF8NEW><DOCUMENT><PAGEOBJECT OwnPage="0"><StoryText>'
+            '<ITEXT CH="Text then "/><ITEXT CH="\u2022 not an item"/>'
+            '<para/><ITEXT CH="\u2022 "/><para/>'
+            '<ITEXT CH="\u2022 Item"/><trail/>'
+            '</StoryText></PAGEOBJECT></DOCUMENT></SCRIBUSUTF8NEW>'
+        )
+        story = root.children[0].children[0].children[0].children[0]
+        self.assertTrue(story.children[1].list_item)  # See mark_list_items
+        self.assertFalse(story.children[0].list_item)
+        self.assertEqual(
+            [(problem['kind'], problem['index'])
+             for problem in validate_lists(root)],
+            [(LIST_MID_PARAGRAPH, 1), (LIST_EMPTY_ITEM, 3)],
+        )
+
+    def test_toc(self):
+        root = from_string_scribus(test_sgml_data)
+        entries = root.get_toc()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['title'], "The Pyramid - Inside")
+        self.assertEqual(entries[0]['page'], 74)
+        self.assertEqual(entries[0]['level'], 1)
+        self.assertEqual(entries[0]['style'], "Place Name - major - H1")
+
+        from booktacular.morescribus.toc import toc_to_outline
+        project = ScribusProject(book_path)
+        self.assertMoreEqual(
+            toc_to_outline(project.root.get_toc()),
+            [[1, "Chapter One", 1], [2, "Section Two", 3]],
+        )
+
 
 if __name__ == "__main__":
     testcase = TestMoreScribus()
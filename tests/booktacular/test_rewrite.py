@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import io
+import os
+import sys
+import unittest
+
+from io import StringIO
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus import (  # noqa: E402
+    from_string_scribus,
+)
+from booktacular.morescribus.rewrite import (  # noqa: E402
+    Rewriter,
+    prefix_rule,
+    rename_rule,
+)
+
+book_path = os.path.join(my_dir, "data", "minimal-book.sla")
+
+
+class TestRewrite(unittest.TestCase):
+    def setUp(self):
+        with io.open(book_path, 'r', encoding="utf-8", newline="") as stream:
+            self.data = stream.read()
+
+    def test_rewrite(self):
+        rewriter = Rewriter([
+            prefix_rule("PFILE", "images/", "../images/"),
+            rename_rule("PARENT", "Body", "Body Text"),
+            ("STYLE", "NAME", lambda value: value == "Body",
+             lambda value: "Body Text"),
+            rename_rule("PARENT", "Body Text", "Body 2", tagName="para"),
+        ])
+        stream = StringIO()
+        changed = rewriter.rewrite(self.data, stream)
+        result = stream.getvalue()
+        self.assertEqual(rewriter.counts[0], 1)
+        self.assertEqual(rewriter.counts[2], 1)
+        self.assertGreater(rewriter.counts[1], 1)
+        self.assertEqual(rewriter.counts[3],
+                         self.data.count('<para PARENT="Body"'))
+        # ^ Rules are applied in order, so the para rule gets the new value.
+        self.assertIn('<para PARENT="Body 2"', result)
+        self.assertEqual(changed, sum(rewriter.counts[:3]))
+        self.assertIn('PFILE="../images/map.png"', result)
+        self.assertNotIn('PARENT="Body"', result)
+        self.assertIn('<STYLE NAME="Body Text"', result)
+        # Only changed tags differ:
+        self.assertEqual(len(result.splitlines()),
+                         len(self.data.splitlines()))
+
+    def test_rewrite_tree(self):
+        root = from_string_scribus(self.data)
+        rewriter = Rewriter([prefix_rule("PFILE", "images/", "pictures/")])
+        self.assertEqual(rewriter.rewrite_tree(root), 1)
+        stream = StringIO()
+        root.write(stream)
+        self.assertIn('PFILE="pictures/map.png"', stream.getvalue())
+
+    def test_rewrite_escaped(self):
+        data = ('<DOCUMENT><para PARENT="Q&amp;A"/>'
+                '<para PARENT="Quotes"/></DOCUMENT>')
+        rewriter = Rewriter([
+            rename_rule("PARENT", "Q&A", "Questions & \"Answers\""),
+            prefix_rule("PARENT", "Quo", "<Quo"),
+        ])
+        stream = StringIO()
+        self.assertEqual(rewriter.rewrite(data, stream), 2)
+        self.assertEqual(
+            stream.getvalue(),
+            '<DOCUMENT><para PARENT="Questions &amp; &quot;Answers&quot;"/>'
+            '<para PARENT="&lt;Quotes"/></DOCUMENT>')
+
+
+if __name__ == "__main__":
+    unittest.main()
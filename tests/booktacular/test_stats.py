@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus import stats as stats_module  # noqa: E402
+from booktacular.morescribus.stats import (  # noqa: E402
+    NO_STYLE,
+    collect_stats,
+    get_stats,
+    stats_path,
+)
+
+book_path = os.path.join(my_dir, "data", "minimal-book.sla")
+
+
+class TestStats(unittest.TestCase):
+    def test_collect_stats(self):
+        with open(book_path, 'r') as stream:
+            stats = collect_stats(stream.read())
+        self.assertEqual(list(stats.pages.keys()), [1, 2, 3])
+        self.assertEqual(stats.pages[1]['paragraphs'], 5)
+        self.assertEqual(stats.pages[1]['frames'], 5)
+        self.assertEqual(stats.pages[1]['words'], 13)
+        self.assertEqual(stats.pages[2]['images'], 1)
+        self.assertEqual(stats.pages[3]['paragraphs'], 5)
+        self.assertEqual(stats.pages[3]['frames'], 2)
+        self.assertEqual(stats.styles["Heading - H1"]['characters'],
+                         len("Chapter One"))
+        self.assertEqual(stats.get_total(pages=set([3]))['words'], 12)
+        self.assertEqual(stats.get_total()['images'], 1)
+
+    def test_styles_and_pasteboard(self):
+        data = (
+            '<SCRIBUSUTF8NEW><DOCUMENT>'
+            '<MASTEROBJECT OwnPage="0"><StoryText>'
+            '<ITEXT CH="Header"/><trail/></StoryText></MASTEROBJECT>'
+            '<PAGEOBJECT OwnPage="-1"><StoryText>'
+            '<ITEXT CH="Off the page"/><trail/></StoryText></PAGEOBJECT>'
+            '<PAGEOBJECT OwnPage="0"><StoryText>'
+            '<ITEXT CH="Wiz&#173;ard &amp; co"/><tab/><ITEXT CH="x"/>'
+            '<para/><para PARENT="Body"/>'
+            '<ITEXT CH="Two words"/><trail PARENT="Body"/>'
+            '</StoryText></PAGEOBJECT>'
+            '</DOCUMENT></SCRIBUSUTF8NEW>'
+        )
+        stats = collect_stats(data)
+        self.assertEqual(list(stats.pages.keys()), [None, 1])
+        self.assertEqual(stats.pages[None]['words'], 3)
+        self.assertEqual(stats.pages[1]['paragraphs'], 2)  # not the empty
+        self.assertEqual(stats.styles[NO_STYLE]['characters'],
+                         len("Off the page") + len("Wizard & co\tx"))
+        self.assertEqual(stats.styles[NO_STYLE]['words'], 3 + 3)
+        self.assertEqual(stats.styles["Body"]['frames'], 1)
+        self.assertNotIn("Header", str(stats.to_dict()))
+
+    def test_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "book.sla")
+            shutil.copy(book_path, path)
+            stats = get_stats(path)
+            self.assertTrue(os.path.isfile(stats_path(path)))
+            cached = get_stats(path)
+            self.assertEqual(cached.to_dict(), stats.to_dict())
+
+            with open(path, 'r') as stream:
+                data = stream.read()
+            with open(path, 'w') as stream:
+                stream.write(data.replace('CH="Left top."',
+                                          'CH="Left top, more words."'))
+            self.assertEqual(get_stats(path).pages[2]['words'],
+                             stats.pages[2]['words'] + 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_cache_not_writable(self):
+        # such as a book in a read-only directory (chmod would not stop
+        #   root, so the write fails instead):
+        def fail(path, write, **kwargs):
+            raise PermissionError(13, "Permission denied", path)
+
+        old_atomic_write = stats_module.atomic_write
+        stats_module.atomic_write = fail
+        try:
+            stats = get_stats(book_path)
+        finally:
+            stats_module.atomic_write = old_atomic_write
+        with open(book_path, 'r') as stream:
+            self.assertEqual(stats.to_dict(),
+                             collect_stats(stream.read()).to_dict())
+
+
+if __name__ == "__main__":
+    unittest.main()
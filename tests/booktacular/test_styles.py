@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+from collections import OrderedDict
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus import (  # noqa: E402
+    ScribusProject,
+)
+from booktacular.morescribus.styles import (  # noqa: E402
+    StyleTable,
+    get_font_report,
+)
+
+book_path = os.path.join(my_dir, "data", "minimal-book.sla")
+
+
+class TestStyles(unittest.TestCase):
+    def setUp(self):
+        self.root = ScribusProject(book_path).root
+        self.style_table = self.root.get_style_table()
+
+    def test_inheritance(self):
+        style_table = self.style_table
+        self.assertIs(self.root.get_style_table(), style_table)
+        body = style_table.get_paragraph_style("Body")
+        self.assertEqual(body['FONTSIZE'], "10")
+        self.assertEqual(body['FONT'], "DejaVu Sans Book")
+        self.assertEqual(body['LINESP'], "15")  # from the default
+        self.assertEqual(body['FCOLOR'], "Black")  # default character style
+        self.assertNotIn("PARENT", body)
+        h2 = style_table.get_paragraph_style("Heading - H2")
+        self.assertEqual(h2['FONTSIZE'], "18")
+        self.assertEqual(h2['FONT'], "DejaVu Serif Bold")
+        # ^ The paragraph style overrides its own character style:
+        self.assertEqual(style_table.get_character_style("Emphasis")['FONT'],
+                         "DejaVu Sans Oblique")
+        self.assertIs(style_table.get_paragraph_style("Heading - H2"), h2)
+
+        resolved = style_table.resolve("Body", "Emphasis",
+                                       overrides={'FONTSIZE': "9",
+                                                  'CH': "text"})
+        self.assertEqual(resolved['FONT'], "DejaVu Sans Oblique")
+        self.assertEqual(resolved['FONTSIZE'], "9")
+        self.assertNotIn("CH", resolved)
+        self.assertIs(style_table.resolve("Body", "Emphasis",
+                                          overrides={'CH': "other",
+                                                     'FONTSIZE': "9"}),
+                      resolved)
+        self.assertIs(style_table._chain_formatting("Emphasis"),
+                      style_table._chain_formatting("Emphasis"))
+        # An unknown style falls back to the default:
+        self.assertEqual(style_table.get_paragraph_style("Missing")['FONT'],
+                         "DejaVu Sans Book")
+
+    def test_cycle(self):
+        style_table = StyleTable(
+            OrderedDict([
+                ("A", {'NAME': "A", 'PARENT': "B", 'FONTSIZE': "8"}),
+                ("B", {'NAME': "B", 'PARENT': "A", 'FONT': "Serif"}),
+            ]),
+            OrderedDict(),
+        )
+        resolved = style_table.get_paragraph_style("A")
+        self.assertEqual((resolved['FONT'], resolved['FONTSIZE']),
+                         ("Serif", "8"))
+
+    def test_runs(self):
+        self.root.collect_pages()
+        frames = dict((child.get("ItemID"), child)
+                      for page in self.root.visible_pages()
+                      for child in page.children)
+        runs = self.style_table.get_runs(frames["1000000103"])
+        self.assertEqual(runs[0][0], "Beta column text.")
+        self.assertEqual(runs[0][1]['FONTSIZE'], "11")  # local
+        self.assertEqual(runs[0][1]['FONT'], "DejaVu Sans Book")
+        runs = self.style_table.get_runs(frames["1000000104"])
+        self.assertEqual(runs[0][1]['FONT'], "DejaVu Sans Oblique")
+        self.assertEqual(runs[0][1]['FONTSIZE'], "10")  # Body
+
+        report = get_font_report(self.root)
+        self.assertEqual(report[("DejaVu Serif Bold", "24")],
+                         len("Chapter One"))
+        self.assertEqual(report[("DejaVu Sans Oblique", "10")],
+                         len("Gamma column text."))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus.text import (  # noqa: E402
+    tokenize,
+)
+from booktacular.morescribus.textindex import (  # noqa: E402
+    TextIndex,
+)
+
+book_path = os.path.join(my_dir, "data", "minimal-book.sla")
+
+
+class TestTextIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for name in ("one.sla", "two.sla"):
+            path = os.path.join(self.tmp_dir, name)
+            shutil.copy(book_path, path)
+            self.paths.append(path)
+        self.text_index = TextIndex(os.path.join(self.tmp_dir,
+                                                 "index.sqlite"))
+
+    def tearDown(self):
+        self.text_index.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize(u"Don't stop, Wiz­ard!"),
+                         [("don't", 0), ("stop", 6), ("wizard", 12)])
+
+    def test_search(self):
+        result = self.text_index.update(self.paths, jobs=1)
+        self.assertEqual(result['indexed'], self.paths)
+        found = self.text_index.search("second ITEM")
+        self.assertEqual(len(found), 2)
+        self.assertEqual(found[0]['path'], self.paths[0])
+        self.assertEqual(found[0]['page'], 3)
+        self.assertEqual(found[0]['ItemID'], "1000000302")
+        self.assertEqual(found[0]['line'], "* Second item")
+        self.assertEqual(found[0]['title'], "Minimal Book")
+        self.assertEqual(self.text_index.search("item first"), [])
+        self.assertEqual(
+            len(self.text_index.search("item first", words=True)), 2)
+        self.assertEqual(
+            len(self.text_index.search("second item", paths=self.paths[1:])),
+            1)
+
+        # Only changed files are parsed again:
+        with open(self.paths[1], 'r') as stream:
+            data = stream.read()
+        with open(self.paths[1], 'w') as stream:
+            stream.write(data.replace('CH="Second item"',
+                                      'CH="Second thing"'))
+        result = self.text_index.update(self.paths, jobs=1)
+        self.assertEqual(result['indexed'], self.paths[1:])
+        self.assertEqual(result['unchanged'], self.paths[:1])
+        self.assertEqual([match['path'] for match
+                          in self.text_index.search("second item")],
+                         self.paths[:1])
+        self.assertEqual(len(self.text_index.search("thing")), 1)
+
+        os.remove(self.paths[0])
+        self.assertEqual(self.text_index.prune(), self.paths[:1])
+        self.assertEqual(self.text_index.search("second item"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus import transfer as transfer_module  # noqa: E402
+from booktacular.morescribus.transfer import (  # noqa: E402
+    COPY,
+    HARDLINK,
+    MOVE,
+    REFLINK,
+    SYMLINK,
+    copy_file,
+    transfer,
+)
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp_dir, "src.png")
+        self.dst = os.path.join(self.tmp_dir, "dst.png")
+        self.content = os.urandom(3 * 1024 * 1024 + 7)
+        with open(self.src, 'wb') as stream:
+            stream.write(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_dst(self):
+        with open(self.dst, 'rb') as stream:
+            return stream.read()
+
+    def test_copy_file(self):
+        copy_file(self.src, self.dst)
+        self.assertEqual(self.read_dst(), self.content)
+        self.assertEqual(int(os.stat(self.src).st_mtime),
+                         int(os.stat(self.dst).st_mtime))
+        # Without copy_file_range or sendfile, a buffer is used:
+        old_copy_range = transfer_module._copy_range
+        transfer_module._copy_range = lambda src_fd, dst_fd, size: False
+        try:
+            os.remove(self.dst)
+            copy_file(self.src, self.dst)
+        finally:
+            transfer_module._copy_range = old_copy_range
+        self.assertEqual(self.read_dst(), self.content)
+
+    def test_copy_range_copies_nothing(self):
+        # Some filesystems return 0 from copy_file_range instead of
+        #   failing, so the buffer must be used instead:
+        old_copy_file_range = getattr(os, 'copy_file_range', None)
+        calls = []
+
+        def copy_nothing(src_fd, dst_fd, count):
+            calls.append(count)
+            return 0
+
+        def copy_once(src_fd, dst_fd, count):
+            calls.append(count)
+            if len(calls) > 1:
+                return 0  # such as if src got shorter
+            return count - 1
+
+        os.copy_file_range = copy_nothing
+        try:
+            copy_file(self.src, self.dst)
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(self.read_dst(), self.content)
+            del calls[:]
+            os.copy_file_range = copy_once
+            with self.assertRaises(OSError):
+                copy_file(self.src, self.dst)
+        finally:
+            if old_copy_file_range is None:
+                del os.copy_file_range
+            else:
+                os.copy_file_range = old_copy_file_range
+
+    def test_modes(self):
+        self.assertEqual(transfer(self.src, self.dst, mode=COPY), COPY)
+        self.assertEqual(self.read_dst(), self.content)
+        self.assertNotEqual(os.stat(self.src).st_ino,
+                            os.stat(self.dst).st_ino)
+
+        self.assertEqual(transfer(self.src, self.dst, mode=HARDLINK),
+                         HARDLINK)
+        self.assertEqual(os.stat(self.src).st_ino, os.stat(self.dst).st_ino)
+        # Linking again does nothing:
+        self.assertEqual(transfer(self.src, self.dst, mode=HARDLINK),
+                         HARDLINK)
+        os.remove(self.dst)
+
+        used = transfer(self.src, self.dst, mode=REFLINK)
+        self.assertIn(used, (REFLINK, COPY))  # COPY if cannot clone
+        self.assertEqual(self.read_dst(), self.content)
+        os.remove(self.dst)
+
+        self.assertEqual(transfer(self.src, self.dst, mode=SYMLINK),
+                         SYMLINK)
+        self.assertTrue(os.path.islink(self.dst))
+        self.assertEqual(os.readlink(self.dst), "src.png")  # relative
+        self.assertEqual(self.read_dst(), self.content)
+        os.remove(self.dst)
+
+        self.assertEqual(transfer(self.src, self.dst, mode=MOVE), MOVE)
+        self.assertFalse(os.path.exists(self.src))
+        self.assertEqual(self.read_dst(), self.content)
+
+        with self.assertRaises(ValueError):
+            transfer(self.dst, self.src, mode="teleport")
+
+    def test_fallback(self):
+        def no_link(src, dst):
+            raise OSError(18, "Invalid cross-device link")
+
+        old_link = os.link
+        os.link = no_link
+        try:
+            used = transfer(self.src, self.dst, mode=HARDLINK)
+        finally:
+            os.link = old_link
+        self.assertIn(used, (REFLINK, COPY))
+        self.assertEqual(self.read_dst(), self.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
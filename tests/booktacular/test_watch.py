@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+module_dir = os.path.dirname(my_dir)
+repo_dir = os.path.dirname(module_dir)
+
+# if __name__ == "__main__":
+sys.path.insert(0, repo_dir)
+
+from booktacular.morescribus.watch import (  # noqa: E402
+    FileWatcher,
+    watch,
+    write_if_changed,
+)
+
+book_path = os.path.join(my_dir, "data", "minimal-book.sla")
+
+
+class FakeClock(object):
+    """Time that only passes when sleep is called.
+
+    Args:
+        saves (list[tuple]): (seconds, path, data) for each file to save
+            once the time reaches seconds.
+    """
+    def __init__(self, saves=None):
+        self.now = 0.0
+        self.saves = list(saves or [])
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        while self.saves and (self.saves[0][0] <= self.now):
+            _, path, data = self.saves.pop(0)
+            save(path, data)
+
+
+def save(path, data):
+    """Replace a file and give it a newer modified time.
+
+    The time is set explicitly so that the change is detected even if
+    the filesystem's time resolution is coarse.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns + 1000000000
+    with open(path, 'w') as stream:
+        stream.write(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "book.sla")
+        shutil.copy(book_path, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_file_watcher(self):
+        clock = FakeClock()
+        watcher = FileWatcher(self.path, debounce=0.5, clock=clock.monotonic,
+                              sleep=clock.sleep)
+        self.assertFalse(watcher.changed())
+        with open(self.path, 'r') as stream:
+            data = stream.read()
+        save(self.path, data)  # only the modified time changes
+        self.assertFalse(watcher.changed())  # not stable yet
+        clock.sleep(0.4)
+        self.assertFalse(watcher.changed())
+        clock.sleep(0.1)
+        self.assertTrue(watcher.changed())
+        self.assertFalse(watcher.changed())  # once per change
+
+    def test_watch(self):
+        titles = []
+
+        def callback(project):
+            titles.append(project.root.get_toc()[0]['title'])
+
+        self.assertEqual(watch(self.path, callback, max_runs=1), 1)
+        self.assertEqual(titles, ["Chapter One"])
+
+    def test_watch_change(self):
+        titles = []
+
+        def callback(project):
+            titles.append(project.root.get_toc()[0]['title'])
+
+        with open(self.path, 'r') as stream:
+            data = stream.read()
+        clock = FakeClock([
+            (1.0, self.path, data),  # same content, so callback is skipped
+            (2.0, self.path, '<SCRIBUSUTF8NEW></DOCUMENT>'),  # fails
+            (3.0, self.path, data.replace("Chapter One", "Chapter 1")),
+        ])
+        watcher = FileWatcher(self.path, interval=0.1, debounce=0.5,
+                              clock=clock.monotonic, sleep=clock.sleep)
+        self.assertEqual(watch(self.path, callback, max_runs=2,
+                               watcher=watcher), 2)
+        self.assertEqual(titles, ["Chapter One", "Chapter 1"])
+        self.assertEqual(clock.saves, [])
+
+    def test_write_if_changed(self):
+        path = os.path.join(self.tmp_dir, "book.md")
+        self.assertTrue(write_if_changed(path, "# Text\n"))
+        self.assertFalse(write_if_changed(path, "# Text\n"))
+        self.assertTrue(write_if_changed(path, "# New\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()